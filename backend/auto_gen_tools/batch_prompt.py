@@ -0,0 +1,125 @@
+"""Packing several short documents into one NER prompt.
+
+For short texts (tweets, invoice lines, addresses) the fixed cost of a call
+(instructions, model scheduling, HTTP) outweighs the text itself. Documents
+are packed greedily into prompts under a token budget, each introduced by a
+`### Document <n>` line with a short sequential ID, and the model is asked for
+one JSON array whose items carry the ID they belong to. The reply is then
+split back per document.
+"""
+from typing import Any, Dict, List, Sequence, Tuple
+
+from auto_gen_tools.json_extractor import extract_json
+from utils.llm_metrics import estimate_tokens
+
+DOCUMENT_MARKER = "### Document"
+
+BATCH_INSTRUCTIONS = """
+        Instructions
+                1. Each document starts with a line "### Document <id>"; annotate every document separately.
+                2. Identify and extract only the entities that match the specified classes.
+                3. Return one JSON array for all documents, where each item is
+                   {"id": "<id of the document>", "text": "the extracted entity text", "entity": "the entity class"}.
+                4. The "text" must be copied exactly from the document with that id.
+"""
+
+# (key, text) of a document to annotate
+PackDocument = Tuple[str, str]
+
+
+def _document_block(index: int, text: str) -> str:
+    return f"{DOCUMENT_MARKER} {index}\n{text}\n\n"
+
+
+def pack_documents(
+    documents: Sequence[PackDocument],
+    overhead_tokens: int,
+    max_prompt_tokens: int,
+    max_documents: int,
+) -> Tuple[List[List[PackDocument]], List[PackDocument]]:
+    """
+    Greedily group documents into packs whose prompt stays under the budget.
+
+    Args:
+        overhead_tokens: Estimated tokens of the instructions shared by a pack
+
+    Returns:
+        The packs, and the documents too long to share a prompt (annotated one by one)
+    """
+    packs: List[List[PackDocument]] = []
+    singles: List[PackDocument] = []
+    current: List[PackDocument] = []
+    used = overhead_tokens
+    for key, text in documents:
+        cost = estimate_tokens(_document_block(len(current) + 1, text))
+        if overhead_tokens + cost > max_prompt_tokens:
+            singles.append((key, text))
+            continue
+        if current and (used + cost > max_prompt_tokens or len(current) >= max_documents):
+            packs.append(current)
+            current, used = [], overhead_tokens
+        current.append((key, text))
+        used += cost
+    if current:
+        packs.append(current)
+    return packs, singles
+
+
+def build_batch_prompt(header: str, classes: List[str], pack: Sequence[PackDocument]) -> str:
+    """Prompt for one pack; documents are numbered from 1 in pack order."""
+    documents = "".join(_document_block(index, text) for index, (_, text) in enumerate(pack, start=1))
+    return (
+        header + "\n\n"
+        + "Entity Classes: " + ", ".join(classes) + "\n\n"
+        + BATCH_INSTRUCTIONS + "\n"
+        + "Documents:\n\n" + documents
+    ).rstrip() + "\n"
+
+
+def split_batch_reply(response_text: str, pack: Sequence[PackDocument]) -> Tuple[Dict[str, List[Dict[str, Any]]], List[str]]:
+    """
+    Entities per document from a packed reply.
+
+    An item whose text does not occur in the document it names shows that the
+    model mixed documents up, so that document is reported as failed.
+
+    Returns:
+        {key: [{"text", "entity"}, ...]} for the documents that parsed, and the
+        keys of the documents to annotate again on their own
+
+    Raises:
+        ValueError: The reply is not a JSON array, or none of its items names a document
+    """
+    items = extract_json(response_text)
+    if isinstance(items, dict):
+        # Some models wrap the array: {"entities": [...]}
+        items = next((value for value in items.values() if isinstance(value, list)), None)
+    if not isinstance(items, list):
+        raise ValueError("Packed reply is not a JSON array")
+
+    by_index = {str(index): (key, text) for index, (key, text) in enumerate(pack, start=1)}
+    entities: Dict[str, List[Dict[str, Any]]] = {key: [] for key, _ in pack}
+    failed = set()
+    unassigned = 0
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get("text"), str) or "entity" not in item:
+            continue
+        document = by_index.get(str(item.get("id", "")).strip().lstrip("#").strip())
+        if document is None:
+            unassigned += 1
+            continue
+        key, text = document
+        if item["text"] not in text:
+            failed.add(key)
+            continue
+        entities[key].append({"text": item["text"], "entity": item["entity"]})
+    if unassigned and unassigned == len(items):
+        raise ValueError("Packed reply does not say which document its entities belong to")
+    for key in failed:
+        entities.pop(key, None)
+    return entities, [key for key, _ in pack if key in failed]
+
+
+def pack_overhead_tokens(header: str, classes: List[str]) -> int:
+    """Estimated tokens of a pack prompt without its documents."""
+    return estimate_tokens(build_batch_prompt(header, classes, []))
@@ -1,45 +1,69 @@
-from transformers import AutoTokenizer
+import bisect
+import re
+from functools import lru_cache
 
-def convert_span_to_iob2(text, annotations, tokenizer_model="bert-base-uncased"):
+from utils.lazy_imports import lazy_import
+
+@lru_cache(maxsize=4)
+def get_tokenizer(tokenizer_model="bert-base-uncased"):
     """
-    Convert span-based annotations to IOB2 tagging format.
+    Load a tokenizer once per process.
+
+    transformers is imported on first use rather than with this module, so
+    workers that never export IOB2 do not pay for it.
+    """
+    transformers = lazy_import("transformers", "IOB2 tokenization")
+    return transformers.AutoTokenizer.from_pretrained(tokenizer_model)
+
+# Built-in tokenizer: runs of word characters and single punctuation marks.
+# Needs no model, and its tokens are the text at their offsets
+WORD_TOKENIZER = "words"
+WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def tokenize(text, tokenizer_model="bert-base-uncased"):
+    """
+    Tokenize a text into token offsets.
 
     Args:
         text (str): The input text.
-        annotations (list): List of annotations with start_index, end_index, entity, and text.
-        tokenizer_model (str): The tokenizer model name to use (default: 'bert-base-uncased').
+        tokenizer_model (str): WORD_TOKENIZER or a Hugging Face tokenizer name.
 
     Returns:
-        dict: A dictionary containing tokens and IOB2 tags.
+        tuple: ([(start, end), ...] per token, token ids or None for WORD_TOKENIZER).
     """
+    if tokenizer_model == WORD_TOKENIZER:
+        return [match.span() for match in WORD_PATTERN.finditer(text)], None
+    tokenized = get_tokenizer(tokenizer_model)(text, return_offsets_mapping=True, add_special_tokens=False)
+    return [tuple(offset) for offset in tokenized["offset_mapping"]], list(tokenized["input_ids"])
+
+def token_strings(text, offsets, ids, tokenizer_model="bert-base-uncased"):
+    """Token strings for the output of `tokenize` (sub-word pieces for Hugging Face tokenizers)."""
+    if ids is None:
+        return [text[start:end] for start, end in offsets]
+    return get_tokenizer(tokenizer_model).convert_ids_to_tokens(ids)
 
-    # Load the specified tokenizer
-    tokenizer = AutoTokenizer.from_pretrained(tokenizer_model)
-    
-    # Tokenize the input text and get offsets
-    tokenized = tokenizer(text, return_offsets_mapping=True, add_special_tokens=False)
-    tokens = tokenized["input_ids"]
-    offsets = tokenized["offset_mapping"]
-    tokens_text = tokenizer.convert_ids_to_tokens(tokens)
-    
-    # Initialize IOB2 tags with "O"
-    tags = ["O"] * len(tokens)
-    
-    # Process each annotation
+def iob2_tags(offsets, annotations):
+    """
+    IOB2 tag of each token: tokens inside a span get B- (at the span's
+    start) or I-; later annotations win where spans overlap.
+
+    Token offsets are sorted, so each span only visits its own tokens.
+    """
+    starts = [start for start, _ in offsets]
+    tags = ["O"] * len(offsets)
     for annotation in annotations:
         start_idx = annotation["start_index"]
         end_idx = annotation["end_index"]
         entity = annotation["entity"]
-        
-        # Align spans with token offsets
-        for idx, (start, end) in enumerate(offsets):
-            if start >= start_idx and end <= end_idx:
-                if start == start_idx:
-                    tags[idx] = f"B-{entity}"
-                else:
-                    tags[idx] = f"I-{entity}"
-    
-    # Split tokens and tags into sentences (if text contains multiple sentences)
+        idx = bisect.bisect_left(starts, start_idx)
+        while idx < len(offsets) and starts[idx] <= end_idx:
+            if offsets[idx][1] <= end_idx:
+                tags[idx] = f"B-{entity}" if starts[idx] == start_idx else f"I-{entity}"
+            idx += 1
+    return tags
+
+def split_sentences(tokens_text, tags):
+    """Split tokens and tags into sentences at sentence-ending punctuation."""
     sentences = []
     sentence_tags = []
     current_sentence = []
@@ -55,7 +79,28 @@ def convert_span_to_iob2(text, annotations, tokenizer_model="bert-base-uncased")
     if current_sentence:  # Add any remaining tokens as a sentence
         sentences.append(current_sentence)
         sentence_tags.append(current_sentence_tags)
-    
+    return sentences, sentence_tags
+
+def convert_span_to_iob2(text, annotations, tokenizer_model="bert-base-uncased", tokens=None):
+    """
+    Convert span-based annotations to IOB2 tagging format.
+
+    Args:
+        text (str): The input text.
+        annotations (list): List of annotations with start_index, end_index, entity, and text.
+        tokenizer_model (str): The tokenizer model name to use (default: 'bert-base-uncased').
+        tokens (tuple): (offsets, token strings) computed earlier for this text
+            (see utils/token_cache.py); tokenized here when not given.
+
+    Returns:
+        dict: A dictionary containing tokens and IOB2 tags.
+    """
+    if tokens is None:
+        offsets, ids = tokenize(text, tokenizer_model)
+        tokens = (offsets, token_strings(text, offsets, ids, tokenizer_model))
+    offsets, tokens_text = tokens
+
+    sentences, sentence_tags = split_sentences(tokens_text, iob2_tags(offsets, annotations))
     return {
         "tokens": sentences,
         "tags": sentence_tags
@@ -0,0 +1,243 @@
+"""Local pre-annotation that runs before the LLM.
+
+Two sources find spans without a model:
+
+* Recognizers: regular expressions per entity class. A class gets one when
+  the project defines `patterns` on it, or when its name matches a built-in
+  recognizer (dates, e-mail addresses, URLs, phone numbers, postal codes,
+  money, percentages, IP addresses). Such classes are resolved locally and
+  are no longer sent to the LLM.
+* A gazetteer of span texts that annotators confirmed (documents with status
+  "completed") with one dominant class. It finds recurring names, but a
+  class found this way still goes to the LLM, which may find new names.
+
+More recognizers can be added with `register_recognizer`.
+"""
+import bisect
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from config.auto_annotate_config import (
+    GAZETTEER_CACHE_SIZE,
+    GAZETTEER_MAX_TERMS,
+    GAZETTEER_MIN_COUNT,
+    GAZETTEER_MIN_LENGTH,
+    GAZETTEER_TTL_SECONDS,
+)
+from config.database import documents_collection
+from utils.compact_annotations import document_annotations
+
+# Share of a text's labels its most frequent class needs to enter the gazetteer
+GAZETTEER_DOMINANCE = 0.8
+
+MONTH = r"(?:Jan(?:uary)?|Feb(?:ruary)?|Mar(?:ch)?|Apr(?:il)?|May|June?|July?|Aug(?:ust)?|Sep(?:t(?:ember)?)?|Oct(?:ober)?|Nov(?:ember)?|Dec(?:ember)?)\.?"
+
+# Built-in recognizers: key -> patterns
+RECOGNIZERS: Dict[str, List["re.Pattern"]] = {}
+
+# Normalized class name -> recognizer key
+RECOGNIZER_ALIASES: Dict[str, str] = {}
+
+
+def _normalize_class_name(name: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", name.lower())
+
+
+def register_recognizer(key: str, patterns: Iterable[str], aliases: Iterable[str] = (), flags: int = 0) -> None:
+    """Add a recognizer used for entity classes whose name is `key` or one of `aliases`."""
+    RECOGNIZERS[key] = [re.compile(pattern, flags) for pattern in patterns]
+    for alias in (key, *aliases):
+        RECOGNIZER_ALIASES[_normalize_class_name(alias)] = key
+
+
+register_recognizer("date", [
+    r"\b\d{4}-\d{2}-\d{2}\b",
+    r"\b\d{1,2}[/.]\d{1,2}[/.](?:\d{4}|\d{2})\b",
+    rf"\b{MONTH}\s+\d{{1,2}}(?:st|nd|rd|th)?,?\s+\d{{4}}\b",
+    rf"\b\d{{1,2}}(?:st|nd|rd|th)?\s+(?:of\s+)?{MONTH}\s+\d{{4}}\b",
+], aliases=["dates", "day", "datetime"], flags=re.IGNORECASE)
+register_recognizer("email", [r"\b[\w.+-]+@[\w-]+(?:\.[\w-]+)*\.[a-zA-Z]{2,}\b"], aliases=["email address", "e-mail", "mail"])
+register_recognizer("url", [r"\b(?:https?://|www\.)[^\s<>\"']+[^\s<>\"'.,;:!?)\]]"], aliases=["website", "link", "web address"])
+register_recognizer("phone", [
+    # 7+ digits in groups, optionally with a country or area code; ISO dates are not phone numbers
+    r"(?<![\w+])(?!\d{4}-\d{2}-\d{2}\b)(?=(?:[\s().+-]*\d){7})"
+    r"(?:\+\d{1,3}[\s.-]?)?(?:\(\d{1,4}\)[\s.-]?)?\d{2,4}(?:[\s.-]\d{2,4}){1,4}(?![\w-])",
+], aliases=["phone number", "telephone", "tel", "mobile", "fax"])
+register_recognizer("postal_code", [
+    r"\b[A-Z]{1,2}\d[A-Z\d]?\s?\d[A-Z]{2}\b",  # UK
+    r"\b[A-Z]\d[A-Z]\s?\d[A-Z]\d\b",  # Canada
+    r"(?<=\b[A-Z]{2} )\d{5}(?:-\d{4})?\b",  # US ZIP after a state code
+], aliases=["postal code", "postcode", "zip", "zip code", "zipcode"])
+register_recognizer("money", [
+    r"[$€£¥]\s?\d[\d,]*(?:\.\d+)?(?:\s?(?:million|billion|thousand|[MBK])\b)?",
+    r"\b\d[\d,]*(?:\.\d+)?\s?(?:USD|EUR|GBP|CHF|JPY|dollars|euros|pounds)\b",
+], aliases=["amount", "price", "currency", "monetary value"])
+register_recognizer("percent", [r"\b\d+(?:\.\d+)?\s?(?:%|percent\b|per cent\b)"], aliases=["percentage"])
+register_recognizer("ip_address", [r"\b(?:(?:25[0-5]|2[0-4]\d|1?\d?\d)\.){3}(?:25[0-5]|2[0-4]\d|1?\d?\d)\b"], aliases=["ip", "ip address"])
+
+
+def recognizers_for(classes: Iterable[str], entity_classes: Optional[List[Dict[str, Any]]] = None) -> Dict[str, List["re.Pattern"]]:
+    """
+    Patterns per requested class: the project's own `patterns` take precedence
+    over a built-in recognizer matched by class name.
+    """
+    custom = {
+        entity["name"]: entity.get("patterns")
+        for entity in entity_classes or []
+        if entity.get("patterns")
+    }
+    recognizers = {}
+    for name in classes:
+        if name in custom:
+            try:
+                recognizers[name] = [re.compile(pattern) for pattern in custom[name]]
+            except re.error:
+                continue
+        else:
+            key = RECOGNIZER_ALIASES.get(_normalize_class_name(name))
+            if key:
+                recognizers[name] = RECOGNIZERS[key]
+    return recognizers
+
+
+class Gazetteer:
+    """Confirmed span texts and their class, matched on word boundaries."""
+
+    def __init__(self, terms: Dict[str, str]):
+        self.terms = terms
+        self.pattern = None
+        if terms:
+            alternatives = "|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True))
+            self.pattern = re.compile(rf"(?<!\w)(?:{alternatives})(?!\w)")
+
+    def find(self, text: str, classes: Set[str]) -> List[Tuple[int, int, str]]:
+        if self.pattern is None:
+            return []
+        spans = []
+        for match in self.pattern.finditer(text):
+            entity = self.terms[match.group(0)]
+            if entity in classes:
+                spans.append((match.start(), match.end(), entity))
+        return spans
+
+
+# project_id -> (built at, Gazetteer), least recently used first
+_gazetteers: "OrderedDict[str, Tuple[float, Gazetteer]]" = OrderedDict()
+
+
+def build_gazetteer(project_id: str) -> Gazetteer:
+    """Aggregate the confirmed spans of a project into a gazetteer."""
+    rows = documents_collection.aggregate([
+        {"$match": {"project_id": str(project_id), "status": "completed", "deleted_at": None}},
+        {"$unwind": "$annotations"},
+        {"$group": {
+            "_id": {"text": "$annotations.text", "entity": "$annotations.entity"},
+            "count": {"$sum": 1},
+        }},
+        {"$sort": {"count": -1}},
+    ])
+    counts: Dict[str, Dict[str, int]] = {}
+
+    def count(text, entity, n):
+        if text and entity and len(text.strip()) >= GAZETTEER_MIN_LENGTH:
+            by_entity = counts.setdefault(text.strip(), {})
+            by_entity[entity] = by_entity.get(entity, 0) + n
+
+    for row in rows:
+        count(row["_id"].get("text"), row["_id"].get("entity"), row["count"])
+    # Compactly stored documents have no `annotations` array to unwind
+    for doc in documents_collection.find(
+        {"project_id": str(project_id), "status": "completed", "deleted_at": None, "annotations_compact": {"$exists": True}},
+        {"text": 1, "annotations_compact": 1}
+    ):
+        for annotation in document_annotations(doc):
+            count(annotation.get("text"), annotation.get("entity"), 1)
+
+    terms = {}
+    for text, by_entity in counts.items():
+        entity, count = max(by_entity.items(), key=lambda item: item[1])
+        if count >= GAZETTEER_MIN_COUNT and count >= GAZETTEER_DOMINANCE * sum(by_entity.values()):
+            terms[text] = (entity, count)
+    frequent = sorted(terms.items(), key=lambda item: -item[1][1])[:GAZETTEER_MAX_TERMS]
+    return Gazetteer({text: entity for text, (entity, _) in frequent})
+
+
+def get_gazetteer(project_id: str) -> Gazetteer:
+    """The project's gazetteer, rebuilt every GAZETTEER_TTL_SECONDS (GAZETTEER_CACHE_SIZE are kept)."""
+    cached = _gazetteers.get(project_id)
+    if cached and time.monotonic() - cached[0] < GAZETTEER_TTL_SECONDS:
+        _gazetteers.move_to_end(project_id)
+        return cached[1]
+    gazetteer = build_gazetteer(project_id)
+    _gazetteers[project_id] = (time.monotonic(), gazetteer)
+    _gazetteers.move_to_end(project_id)
+    while len(_gazetteers) > GAZETTEER_CACHE_SIZE:
+        _gazetteers.popitem(last=False)
+    return gazetteer
+
+
+def _select_non_overlapping(candidates: List[Tuple[int, int, str, int]]) -> List[Tuple[int, int, str, int]]:
+    """Keep the longest spans first (then the higher-priority source), dropping overlaps."""
+    # Accepted spans sorted by start; a candidate only needs checking against its neighbours
+    selected: List[Tuple[int, int, str, int]] = []
+    for candidate in sorted(candidates, key=lambda span: (-(span[1] - span[0]), span[3], span[0])):
+        position = bisect.bisect_left(selected, candidate)
+        if position > 0 and selected[position - 1][1] > candidate[0]:
+            continue
+        if position < len(selected) and selected[position][0] < candidate[1]:
+            continue
+        selected.insert(position, candidate)
+    return selected
+
+
+class PreAnnotation:
+    """Result of the local stage."""
+
+    def __init__(self, annotations: List[Dict[str, Any]], resolved_classes: List[str], sources: Dict[str, int]):
+        self.annotations = annotations
+        self.resolved_classes = resolved_classes
+        self.sources = sources
+
+
+def pre_annotate(
+    text: str,
+    classes: List[str],
+    entity_classes: Optional[List[Dict[str, Any]]] = None,
+    project_id: Optional[str] = None,
+) -> PreAnnotation:
+    """
+    Find spans of the requested classes locally.
+
+    Args:
+        entity_classes: The project's entity class definitions (for custom patterns)
+        project_id: Enables the gazetteer of the project's confirmed spans
+
+    Returns:
+        Annotations (dicts like the LLM output), the classes the LLM no
+        longer needs to look for, and span counts per source
+    """
+    candidates = []
+    recognizers = recognizers_for(classes, entity_classes)
+    for name, patterns in recognizers.items():
+        for pattern in patterns:
+            candidates.extend((match.start(), match.end(), name, 0) for match in pattern.finditer(text) if match.end() > match.start())
+    if project_id:
+        gazetteer_classes = set(classes) - set(recognizers)
+        candidates.extend((start, end, entity, 1) for start, end, entity in get_gazetteer(project_id).find(text, gazetteer_classes))
+
+    selected = _select_non_overlapping(candidates)
+    annotations = [
+        {"text": text[start:end], "entity": entity, "start_index": start, "end_index": end}
+        for start, end, entity, _ in selected
+    ]
+    sources = {
+        "recognizer": sum(1 for span in selected if span[3] == 0),
+        "gazetteer": sum(1 for span in selected if span[3] == 1),
+    }
+    return PreAnnotation(annotations, list(recognizers), sources)
+
+
+def overlaps_any(start: int, end: int, spans: List[Dict[str, Any]]) -> bool:
+    return any(start < span["end_index"] and end > span["start_index"] for span in spans)
@@ -0,0 +1,104 @@
+"""
+Size and speed of the plain and compact annotation formats.
+
+For one synthetic document per size and density, measures:
+
+    bson_bytes / json_bytes   the whole record stored in MongoDB and sent as
+                              JSON, with `annotations` or `annotations_compact`
+    field_bson_bytes          the annotations field alone
+    encode_ms / decode_ms     plain -> compact and back (text derived from the
+                              document), i.e. the cost of a compact write / read
+    bson_encode_ms, bson_decode_ms, json_ms
+                              BSON encode/decode and orjson encode of the record
+
+and checks that the conversion round-trips losslessly.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_annotation_format [--sizes medium,large] [--densities 0.1,0.5] [--json results.json]
+"""
+import argparse
+import json
+import random
+import time
+
+import bson
+
+from benchmarks.harness import run_metadata
+from benchmarks.synthetic import DOCUMENT_SIZES, ENTITY_CLASSES, make_document
+from utils.compact_annotations import decode, encode, format_record
+from utils.serialization import dumps
+
+PROJECT_ID = "65a000000000000000000000"
+CLASSES = [entity["name"] for entity in ENTITY_CLASSES]
+
+
+def timed_ms(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return round((time.perf_counter() - start) * 1000 / repeat, 3)
+
+
+def measure(record, field: str, repeat: int):
+    body = bson.encode(record)
+    return {
+        "bson_bytes": len(body),
+        "field_bson_bytes": len(bson.encode({field: record[field]})),
+        "json_bytes": len(dumps(record)),
+        "bson_encode_ms": timed_ms(lambda: bson.encode(record), repeat),
+        "bson_decode_ms": timed_ms(lambda: bson.decode(body), repeat),
+        "json_ms": timed_ms(lambda: dumps(record), repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="medium,large", help=f"Document sizes ({', '.join(DOCUMENT_SIZES)})")
+    parser.add_argument("--densities", default="0.1,0.5", help="Annotation densities (spans per 10 characters)")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = []
+    for size in args.sizes.split(","):
+        for density in (float(value) for value in args.densities.split(",")):
+            plain = make_document(PROJECT_ID, DOCUMENT_SIZES[size], rng, density=density)
+            annotations, text = plain["annotations"], plain["text"]
+            compact = format_record(plain, "compact", CLASSES)
+            if decode(compact["annotations_compact"], text) != annotations:
+                raise SystemExit(f"{size}/{density}: compact annotations do not round-trip")
+
+            plain_row, compact_row = measure(plain, "annotations", args.repeat), measure(compact, "annotations_compact", args.repeat)
+            row = {
+                "size": size,
+                "density": density,
+                "spans": len(annotations),
+                "plain": plain_row,
+                "compact": compact_row,
+                "encode_ms": timed_ms(lambda: encode(annotations, text, CLASSES), args.repeat),
+                "decode_ms": timed_ms(lambda: decode(compact["annotations_compact"], text), args.repeat),
+                "bson_ratio": round(plain_row["bson_bytes"] / compact_row["bson_bytes"], 2),
+                "field_bson_ratio": round(plain_row["field_bson_bytes"] / compact_row["field_bson_bytes"], 2),
+                "json_ratio": round(plain_row["json_bytes"] / compact_row["json_bytes"], 2),
+            }
+            results.append(row)
+            print(
+                f"{size:<7} density {density:<5} {row['spans']:>6} spans   "
+                f"BSON {plain_row['bson_bytes']:>9} -> {compact_row['bson_bytes']:>9} (x{row['bson_ratio']}, annotations x{row['field_bson_ratio']})   "
+                f"JSON {plain_row['json_bytes']:>9} -> {compact_row['json_bytes']:>9} (x{row['json_ratio']})   "
+                f"encode {row['encode_ms']} ms   decode {row['decode_ms']} ms"
+            )
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({
+                "benchmark": "annotation_format",
+                "metadata": run_metadata(repeat=args.repeat, seed=args.seed),
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Time to validate and normalize a document's annotations on save.
+
+Builds one synthetic document per --spans count, shuffles its spans and adds
+duplicates (as a client sending an unsorted list would), then times
+`normalize_annotations` under each overlap policy (the synthetic spans do
+not overlap, so "reject" passes). For counts up to
+--pairwise-max it also times the pairwise overlap check the sweep replaces.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_annotation_validation [--spans 1000,10000,50000] [--json results.json]
+"""
+import argparse
+import json
+import random
+import time
+
+from benchmarks.harness import run_metadata
+from benchmarks.synthetic import make_annotations, make_text
+from utils.annotation_validation import OVERLAP_POLICIES, normalize_annotations
+
+
+def document(n_spans: int, rng: random.Random):
+    # make_annotations places about one span per 10 / density characters
+    density = 0.5
+    text = make_text(n_spans * 24, rng)
+    annotations = make_annotations(text, rng, density=density)
+    annotations += rng.sample(annotations, len(annotations) // 20)
+    rng.shuffle(annotations)
+    return text, annotations
+
+
+def pairwise_overlaps(annotations) -> int:
+    count = 0
+    for i, a in enumerate(annotations):
+        for b in annotations[i + 1:]:
+            if a["start_index"] < b["end_index"] and b["start_index"] < a["end_index"]:
+                count += 1
+    return count
+
+
+def timed_ms(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return round((time.perf_counter() - start) * 1000 / repeat, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--spans", default="1000,10000,50000", help="Comma-separated span counts")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--pairwise-max", type=int, default=5000, help="Largest span count timed with the pairwise check")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = []
+    for n_spans in (int(value) for value in args.spans.split(",")):
+        text, annotations = document(n_spans, rng)
+        row = {"spans": len(annotations)}
+        for policy in OVERLAP_POLICIES:
+            row[f"{policy}_ms"] = timed_ms(
+                lambda: normalize_annotations(annotations, text, invalid="drop", overlaps=policy),
+                args.repeat,
+            )
+        normalized, removed = normalize_annotations(annotations, text, invalid="drop", overlaps="allow")
+        row["kept"] = len(normalized)
+        row["removed"] = removed
+        if len(annotations) <= args.pairwise_max:
+            row["pairwise_ms"] = timed_ms(lambda: pairwise_overlaps(annotations), 1)
+        results.append(row)
+        print(json.dumps(row))
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({
+                "benchmark": "annotation_validation",
+                "metadata": run_metadata(repeat=args.repeat, seed=args.seed),
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
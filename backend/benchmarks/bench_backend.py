@@ -0,0 +1,197 @@
+"""
+End-to-end benchmark of the hot backend endpoints.
+
+Starts the FastAPI app from main.py with uvicorn against a throwaway MongoDB
+(an in-memory mongomock stand-in unless --mongo-url is given) and the fake
+Ollama/OpenAI server, seeds a project, then measures throughput and
+p50/p95/p99 latency for listing, fetching, saving, uploading, exporting and
+auto-annotating documents. Results are written as JSON; compare two runs
+with `python -m benchmarks.compare old.json new.json`.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_backend --output results.json
+    python -m benchmarks.bench_backend --mongo-url mongodb://localhost:27017 --llm-latency 0.5
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import time
+
+from benchmarks.fake_llm_server import FakeLLMConfig, start_fake_llm_server
+from benchmarks.harness import configure_environment, run_metadata, start_app_server, summarize
+from benchmarks.synthetic import DOCUMENT_SIZES, ENTITY_CLASSES, make_annotations, make_document, make_text
+
+SCENARIOS = ("list", "fetch", "save", "upload", "export", "auto_annotate")
+
+
+async def run_scenario(client, make_request, requests: int, concurrency: int):
+    """Issue `requests` calls with `concurrency` workers; returns the summary dict."""
+    latencies, errors = [], 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                response = await make_request(client, i)
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+def seed(documents_collection, projects_collection, user_id: str, docs: int, size: str, rng: random.Random):
+    from datetime import datetime
+    from utils.project_stats import apply_document_changes, init_project_stats
+
+    project_id = str(projects_collection.insert_one({
+        "name": "bench",
+        "description": "benchmark project",
+        "entity_classes": ENTITY_CLASSES,
+        "user_id": user_id,
+        "created_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow(),
+    }).inserted_id)
+    batch = [make_document(project_id, DOCUMENT_SIZES[size], rng) for _ in range(docs)]
+    document_ids = [str(doc_id) for doc_id in documents_collection.insert_many(batch).inserted_ids]
+    # Counters as the upload routes keep them, instead of a rebuild on first read
+    init_project_stats(project_id)
+    apply_document_changes(project_id, added=batch)
+    return project_id, document_ids
+
+
+async def benchmark(args, base_url: str, token: str, project_id: str, document_ids, rng: random.Random):
+    import httpx
+
+    headers = {"Authorization": f"Bearer {token}"}
+    pages = max(1, len(document_ids) // args.page_size)
+    save_text = make_text(DOCUMENT_SIZES[args.size], rng)
+    save_annotations = make_annotations(save_text, rng)
+    upload_files = [make_text(DOCUMENT_SIZES["small"], rng).encode() for _ in range(args.upload_files)]
+
+    async def list_page(client, i):
+        return await client.get(
+            f"/api/documents/project/{project_id}",
+            params={"page": i % pages + 1, "docsPerPage": args.page_size},
+        )
+
+    async def fetch(client, i):
+        return await client.get(f"/api/documents/{document_ids[i % len(document_ids)]}")
+
+    async def save(client, i):
+        return await client.put(
+            f"/api/documents/{document_ids[i % len(document_ids)]}",
+            json={"text": save_text, "annotations": save_annotations, "status": "completed" if i % 2 else "in_progress"},
+        )
+
+    async def upload(client, i):
+        files = [("files", (f"bench_{i}_{n}.txt", content, "text/plain")) for n, content in enumerate(upload_files)]
+        return await client.post("/api/documents/upload", data={"project_id": project_id}, files=files)
+
+    async def export(client, i):
+        return await client.get(f"/api/projects/{project_id}/export")
+
+    async def auto_annotate(client, i):
+        document_id = document_ids[i % len(document_ids)]
+        return await client.post(f"/api/auto/project/{project_id}/document/{document_id}/auto_annotate")
+
+    scenarios = {
+        "list": (list_page, args.requests),
+        "fetch": (fetch, args.requests),
+        "save": (save, args.requests),
+        "upload": (upload, max(1, args.requests // 10)),
+        "export": (export, args.export_requests),
+        "auto_annotate": (auto_annotate, max(1, args.requests // 10)),
+    }
+
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=600, limits=limits) as client:
+        for name in args.scenarios:
+            make_request, requests = scenarios[name]
+            # Warm-up so connection setup and first-call costs are not measured
+            await run_scenario(client, make_request, min(3, requests), 1)
+            results[name] = await run_scenario(client, make_request, requests, args.concurrency)
+            print(json.dumps({name: results[name]}), file=sys.__stdout__)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", help="Throwaway mongod to use instead of the in-memory stand-in")
+    parser.add_argument("--docs", type=int, default=1000, help="Documents to seed")
+    parser.add_argument("--size", choices=sorted(DOCUMENT_SIZES), default="small", help="Seeded document size")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario (upload/auto-annotate use a tenth)")
+    parser.add_argument("--export-requests", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--upload-files", type=int, default=5, help="Files per upload request")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Fake LLM seconds per request")
+    parser.add_argument("--llm-token-latency", type=float, default=0.0, help="Fake LLM seconds per generated token")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of " + ",".join(SCENARIOS))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_results.json", help="JSON results file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the app's print output")
+    args = parser.parse_args()
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    args.output = os.path.abspath(args.output)
+    llm_server, llm_url, _ = start_fake_llm_server(config=FakeLLMConfig(args.llm_latency, args.llm_token_latency))
+    mongo_backend = configure_environment(args.mongo_url, llm_url)
+
+    import main as app_module
+    from config.database import client as mongo_client, DB_NAME, documents_collection, projects_collection, users_collection
+    from utils.auth import create_access_token, get_password_hash
+
+    rng = random.Random(args.seed)
+    user_id = str(users_collection.insert_one({
+        "email": "bench@example.com",
+        "username": "bench",
+        "password": get_password_hash("bench"),
+    }).inserted_id)
+    token = create_access_token({"sub": user_id})
+    project_id, document_ids = seed(documents_collection, projects_collection, user_id, args.docs, args.size, rng)
+
+    server, base_url = start_app_server(app_module.app)
+    output = io.StringIO() if not args.verbose else sys.stdout
+    try:
+        with contextlib.redirect_stdout(output):
+            results = asyncio.run(benchmark(args, base_url, token, project_id, document_ids, rng))
+    finally:
+        server.should_exit = True
+        llm_server.shutdown()
+        if args.mongo_url:
+            mongo_client.drop_database(DB_NAME)
+
+    report = {
+        "benchmark": "backend",
+        "metadata": run_metadata(
+            mongo=mongo_backend, docs=args.docs, size=args.size, requests=args.requests,
+            concurrency=args.concurrency, page_size=args.page_size, llm_latency=args.llm_latency,
+            llm_token_latency=args.llm_token_latency, seed=args.seed,
+        ),
+        "scenarios": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
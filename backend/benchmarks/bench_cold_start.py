@@ -0,0 +1,135 @@
+"""
+Cold-start latency of LLM requests with and without the Ollama model manager.
+
+Runs the app from main.py against the in-memory MongoDB stand-in and a fake
+Ollama server that takes --load-latency seconds to load a model that is not
+resident. Two Ollama backends point at that server with their own model:
+
+    unmanaged  no warm-up, and a keep_alive shorter than --idle (standing in
+               for Ollama's 5m default against a real idle period)
+    managed    warmed up at startup, keep_alive of 30m
+
+For each backend it measures the first request after startup and,
+--rounds times, the first one after --idle seconds without requests, and
+reports those latencies with the number of model loads they caused. The
+managed backend's time from startup until /api/model/ready answers 200 is
+reported too.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_cold_start [--load-latency 3] [--idle 2] [--rounds 3] [--json results.json]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import sys
+import time
+
+from benchmarks.fake_llm_server import FakeLLMConfig, start_fake_llm_server
+from benchmarks.harness import configure_environment, run_metadata, start_app_server
+
+CLASSES = ["Organization", "Person"]
+TEXT = "Acme hired Jane Smith from Globex last spring."
+
+
+async def generate(client, backend: str) -> float:
+    start = time.perf_counter()
+    response = await client.post("/api/model/llm_chat", json={
+        "messages": [{"role": "user", "content": f"Entity Classes: {', '.join(CLASSES)}\n\nText: {TEXT}"}],
+        "backend": backend,
+    })
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def wait_ready(client, backend: str, timeout: float) -> float:
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if (await client.get("/api/model/ready", params={"backend": backend})).status_code == 200:
+            return time.perf_counter() - start
+        await asyncio.sleep(0.05)
+    raise RuntimeError(f"Backend '{backend}' not ready after {timeout}s")
+
+
+async def benchmark(args, base_url: str, llm_config: FakeLLMConfig, started_at: float):
+    import httpx
+
+    results = {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=600) as client:
+        ready_s = await wait_ready(client, "managed", args.load_latency * 10 + 30)
+        results["managed_startup_to_ready_s"] = round(time.perf_counter() - started_at, 3)
+        results["managed_ready_wait_s"] = round(ready_s, 3)
+
+        for backend in ("unmanaged", "managed"):
+            loads_before = llm_config.loads
+            first = await generate(client, backend)
+            after_idle = []
+            for _ in range(args.rounds):
+                await asyncio.sleep(args.idle)
+                after_idle.append(await generate(client, backend))
+            results[backend] = {
+                "first_request_ms": round(first * 1000, 1),
+                "after_idle_ms": [round(latency * 1000, 1) for latency in after_idle],
+                "after_idle_mean_ms": round(sum(after_idle) / len(after_idle) * 1000, 1) if after_idle else None,
+                "model_loads": llm_config.loads - loads_before,
+            }
+            print(json.dumps({backend: results[backend]}), file=sys.__stdout__)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--load-latency", type=float, default=3.0, help="Fake Ollama seconds to load a model")
+    parser.add_argument("--idle", type=float, default=2.0, help="Seconds without requests between measurements")
+    parser.add_argument("--rounds", type=int, default=3, help="Idle periods to measure")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Fake LLM seconds per call once loaded")
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the app's print output")
+    args = parser.parse_args()
+
+    llm_config = FakeLLMConfig(args.llm_latency, think=False, load_latency=args.load_latency)
+    llm_server, llm_url, _ = start_fake_llm_server(config=llm_config)
+    configure_environment(None, llm_url, extra_env={
+        "LLM_BACKENDS": json.dumps([
+            {"name": "unmanaged", "type": "ollama", "model": "fake-unmanaged", "url": llm_url,
+             "keep_alive": f"{args.idle / 2:g}s", "warm_up": False},
+            {"name": "managed", "type": "ollama", "model": "fake-managed", "url": llm_url,
+             "keep_alive": "30m", "warm_up": True},
+        ]),
+        "LLM_DEFAULT_BACKEND": "managed",
+        "LLM_COALESCE_ENABLED": "False",
+        "OLLAMA_PROBE_INTERVAL": "1",
+    })
+
+    import main as app_module
+
+    output = io.StringIO() if not args.verbose else sys.stdout
+    with contextlib.redirect_stdout(output):
+        started_at = time.perf_counter()
+        server, base_url = start_app_server(app_module.app)
+        try:
+            results = asyncio.run(benchmark(args, base_url, llm_config, started_at))
+        finally:
+            server.should_exit = True
+            llm_server.shutdown()
+
+    print(
+        f"first request: unmanaged {results['unmanaged']['first_request_ms']} ms, "
+        f"managed {results['managed']['first_request_ms']} ms; "
+        f"after idle: unmanaged {results['unmanaged']['after_idle_mean_ms']} ms, "
+        f"managed {results['managed']['after_idle_mean_ms']} ms"
+    )
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({
+                "benchmark": "cold_start",
+                "metadata": run_metadata(
+                    load_latency=args.load_latency, idle=args.idle, rounds=args.rounds, llm_latency=args.llm_latency,
+                ),
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark response compression on typical SmartAnnotate payloads.
+
+Reports, for each payload and encoding, the bytes saved and the CPU time
+spent compressing one response.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_compression [--repeat 20] [--json results.json]
+"""
+import argparse
+import json
+import random
+import time
+
+from benchmarks.synthetic import DOCUMENT_SIZES, ENTITY_CLASSES, make_document
+from utils.compression import compress_bytes, supported_encodings
+
+
+def build_payloads(rng: random.Random):
+    project_id = "65a000000000000000000000"
+    payloads = {}
+    for name, size in DOCUMENT_SIZES.items():
+        payloads[f"document_{name}"] = make_document(project_id, size, rng)
+    payloads["list_page_100_small"] = {
+        "total_count": 5000,
+        "documents": [make_document(project_id, DOCUMENT_SIZES["small"], rng) for _ in range(100)],
+    }
+    payloads["export_500_medium"] = {
+        "project": {"id": project_id, "name": "bench", "entity_classes": ENTITY_CLASSES},
+        "documents": [make_document(project_id, DOCUMENT_SIZES["medium"], rng) for _ in range(500)],
+    }
+    return {name: json.dumps(payload, default=str).encode() for name, payload in payloads.items()}
+
+
+def measure(body: bytes, encoding: str, repeat: int, **levels):
+    compressed = b""
+    start = time.process_time()
+    for _ in range(repeat):
+        compressed = compress_bytes(body, encoding, **levels)
+    cpu_ms = (time.process_time() - start) * 1000 / repeat
+    return {
+        "original_bytes": len(body),
+        "compressed_bytes": len(compressed),
+        "bytes_saved": len(body) - len(compressed),
+        "ratio": round(len(body) / max(len(compressed), 1), 2),
+        "cpu_ms_per_request": round(cpu_ms, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20, help="Compressions per measurement")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    payloads = build_payloads(random.Random(args.seed))
+
+    settings = [("gzip", {"gzip_level": level}) for level in (1, 6, 9)]
+    if "br" in supported_encodings():
+        settings += [("br", {"brotli_quality": quality}) for quality in (1, 4, 6)]
+
+    results = []
+    print(f"{'payload':<22}{'encoding':<10}{'original':>12}{'compressed':>12}{'saved':>12}{'ratio':>8}{'cpu ms':>10}")
+    for name, body in payloads.items():
+        # Large exports are slow to compress repeatedly, scale repeats down
+        repeat = max(1, args.repeat * 200_000 // max(len(body), 200_000))
+        for encoding, levels in settings:
+            label = f"{encoding}-{next(iter(levels.values()))}"
+            row = {"payload": name, "encoding": label, **measure(body, encoding, repeat, **levels)}
+            results.append(row)
+            print(
+                f"{name:<22}{label:<10}{row['original_bytes']:>12}{row['compressed_bytes']:>12}"
+                f"{row['bytes_saved']:>12}{row['ratio']:>8}{row['cpu_ms_per_request']:>10}"
+            )
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"benchmark": "compression", "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+JSON project export vs the columnar Parquet/Arrow dataset export.
+
+Seeds --docs synthetic documents (into the in-memory mongomock stand-in
+unless --mongo-url is given) and for each format measures:
+
+    write_ms      building the export from the documents collection
+    peak_mb       peak Python memory while building it (tracemalloc; Arrow
+                  buffers are counted through pyarrow's memory pool)
+    bytes         size of the file sent
+    load_ms       loading the file back (json.loads / pyarrow read_table),
+                  as a training pipeline would
+
+The JSON export holds every document in memory at once; the dataset export
+holds one EXPORT_BATCH_SIZE batch. mongomock materializes sorted cursors, so
+with the stand-in the dataset export's peak still grows with --docs; use
+--mongo-url for the memory figures.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_dataset_export [--docs 2000] [--size medium] [--json results.json]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.harness import configure_environment, run_metadata
+from benchmarks.synthetic import DOCUMENT_SIZES, make_document
+
+
+def measure(build, pa):
+    """(result, ms, peak MB) of build()."""
+    pa.default_memory_pool().release_unused()
+    arrow_before = pa.total_allocated_bytes()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = (time.perf_counter() - start) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    arrow_peak = max(pa.default_memory_pool().max_memory() - arrow_before, 0)
+    return result, round(elapsed, 1), round((peak + arrow_peak) / 1e6, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", help="Throwaway mongod to use instead of the in-memory stand-in")
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--size", choices=sorted(DOCUMENT_SIZES), default="medium")
+    parser.add_argument("--density", type=float, default=0.05, help="Annotation density (spans per 10 characters)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    mongo_backend = configure_environment(args.mongo_url, "http://127.0.0.1:9")
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from config.database import client as mongo_client, DB_NAME, documents_collection
+    from utils.compact_annotations import format_record
+    from utils.dataset_export import write_dataset
+    from utils.serialization import dumps
+
+    project_id = "65a000000000000000000000"
+    rng = random.Random(args.seed)
+    documents_collection.insert_many([
+        make_document(project_id, DOCUMENT_SIZES[args.size], rng, density=args.density) for _ in range(args.docs)
+    ])
+
+    def json_export():
+        documents = [
+            format_record(doc, "full", [])
+            for doc in documents_collection.find({"project_id": project_id, "deleted_at": None})
+        ]
+        return dumps({"project": {"id": project_id}, "documents": documents})
+
+    results = []
+    folder = tempfile.mkdtemp()
+    try:
+        body, write_ms, peak_mb = measure(json_export, pa)
+        start = time.perf_counter()
+        json.loads(body)
+        results.append({"format": "json", "write_ms": write_ms, "peak_mb": peak_mb, "bytes": len(body),
+                        "load_ms": round((time.perf_counter() - start) * 1000, 1)})
+        del body
+
+        for dataset_format in ("parquet", "arrow"):
+            path = os.path.join(folder, f"export.{dataset_format}")
+            _, write_ms, peak_mb = measure(lambda: write_dataset(project_id, path, dataset_format), pa)
+            start = time.perf_counter()
+            table = pq.read_table(path) if dataset_format == "parquet" else pa.ipc.open_file(path).read_all()
+            load_ms = round((time.perf_counter() - start) * 1000, 1)
+            if table.num_rows != args.docs:
+                raise SystemExit(f"{dataset_format}: {table.num_rows} rows, expected {args.docs}")
+            results.append({"format": dataset_format, "write_ms": write_ms, "peak_mb": peak_mb,
+                            "bytes": os.path.getsize(path), "load_ms": load_ms})
+    finally:
+        for name in os.listdir(folder):
+            os.remove(os.path.join(folder, name))
+        os.rmdir(folder)
+        if args.mongo_url:
+            mongo_client.drop_database(DB_NAME)
+
+    for row in results:
+        print(json.dumps(row))
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({
+                "benchmark": "dataset_export",
+                "metadata": run_metadata(mongo=mongo_backend, docs=args.docs, size=args.size, seed=args.seed),
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
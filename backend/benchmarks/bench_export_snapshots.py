@@ -0,0 +1,135 @@
+"""
+Latency of repeated project exports with export snapshots.
+
+Seeds a project with --docs synthetic documents (in the in-memory mongomock
+stand-in unless --mongo-url is given) and requests GET /api/projects/{id}/export
+through the app:
+
+    cold         first export: builds the snapshot
+    hit          export of the unchanged project, served from the snapshot
+    revalidate   the same with If-None-Match (304, no body)
+    after_edit   first export after one document changed: rebuilds
+    stale        export with ?stale=true after a change: the previous
+                 snapshot is sent while the new one builds (in the same
+                 process, so the build competes with sending it)
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_export_snapshots [--docs 2000] [--size medium] [--json results.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import random
+import shutil
+import statistics
+import time
+from datetime import datetime
+
+from benchmarks.harness import configure_environment, run_metadata
+from benchmarks.synthetic import DOCUMENT_SIZES, ENTITY_CLASSES, make_document
+
+
+def timed_ms(func):
+    start = time.perf_counter()
+    response = func()
+    return response, round((time.perf_counter() - start) * 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", help="Throwaway mongod to use instead of the in-memory stand-in")
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--size", choices=sorted(DOCUMENT_SIZES), default="medium")
+    parser.add_argument("--repeat", type=int, default=10, help="Requests timed for hit and revalidate (median)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    mongo_backend = configure_environment(
+        args.mongo_url, "http://127.0.0.1:9", extra_env={"COMPRESSION_ENABLED": "False"}
+    )
+
+    from fastapi.testclient import TestClient
+    import main as app_module
+    from config.database import client as mongo_client, DB_NAME, documents_collection, projects_collection, users_collection
+    from config.export_config import EXPORT_ROOT
+    from utils.auth import create_access_token, get_password_hash
+    from utils.project_stats import apply_document_changes, init_project_stats
+
+    rng = random.Random(args.seed)
+    user_id = str(users_collection.insert_one({
+        "email": "bench@example.com",
+        "username": "bench",
+        "password": get_password_hash("bench"),
+    }).inserted_id)
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': user_id})}"}
+    project_id = str(projects_collection.insert_one({
+        "name": "bench",
+        "entity_classes": ENTITY_CLASSES,
+        "user_id": user_id,
+        "created_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow(),
+        "deleted_at": None,
+    }).inserted_id)
+    documents = [make_document(project_id, DOCUMENT_SIZES[args.size], rng) for _ in range(args.docs)]
+    for doc in documents:
+        doc["deleted_at"] = None
+    documents_collection.insert_many(documents)
+    # Counters as the upload routes keep them, so project_watermark reads the
+    # stats record instead of rebuilding it on the first export
+    init_project_stats(project_id)
+    apply_document_changes(project_id, added=documents)
+    url = f"/api/projects/{project_id}/export"
+
+    def edit():
+        doc = rng.choice(documents)
+        response = client.put(f"/api/documents/{doc['_id']}", json={"status": rng.choice(["pending", "completed"])}, headers=headers)
+        response.raise_for_status()
+
+    try:
+        with TestClient(app_module.app) as client, contextlib.redirect_stdout(io.StringIO()):
+            response, cold_ms = timed_ms(lambda: client.get(url, headers=headers))
+            response.raise_for_status()
+            etag = response.headers["etag"]
+            hit_ms = round(statistics.median(timed_ms(lambda: client.get(url, headers=headers))[1] for _ in range(args.repeat)), 2)
+            revalidate_ms = round(statistics.median(
+                timed_ms(lambda: client.get(url, headers={**headers, "If-None-Match": etag}))[1] for _ in range(args.repeat)
+            ), 2)
+            edit()
+            _, after_edit_ms = timed_ms(lambda: client.get(url, headers=headers))
+            edit()
+            stale_response, stale_ms = timed_ms(lambda: client.get(url + "?stale=true", headers=headers))
+            if stale_response.headers.get("x-export-stale") != "true":
+                raise SystemExit("stale export was not served from the previous snapshot")
+            # Let the background build finish before the app shuts down
+            client.get(url, headers=headers)
+    finally:
+        shutil.rmtree(EXPORT_ROOT, ignore_errors=True)
+        if args.mongo_url:
+            mongo_client.drop_database(DB_NAME)
+
+    result = {
+        "docs": args.docs,
+        "size": args.size,
+        "bytes": len(response.content),
+        "cold_ms": cold_ms,
+        "hit_ms": hit_ms,
+        "revalidate_ms": revalidate_ms,
+        "after_edit_ms": after_edit_ms,
+        "stale_ms": stale_ms,
+        "hit_speedup": round(cold_ms / hit_ms, 1) if hit_ms else None,
+    }
+    print(json.dumps(result))
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({
+                "benchmark": "export_snapshots",
+                "metadata": run_metadata(mongo=mongo_backend, docs=args.docs, size=args.size, repeat=args.repeat, seed=args.seed),
+                "results": result,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Time of a project's IOB2 export, with and without the token cache.
+
+Seeds --docs synthetic documents (into the in-memory mongomock stand-in
+unless --mongo-url is given) and streams the CoNLL export three ways:
+
+    uncached   every document tokenized on each export, tokens aligned to
+               spans by scanning all tokens per span (the previous export path)
+    cold       first export with the token cache: tokenizes and stores tokens
+    warm       later exports: tokens read from `document_tokens`
+
+The "words" tokenizer is used by default since it needs no model download;
+with a Hugging Face tokenizer (--tokenizer) tokenizing dominates even more.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_iob2_export [--docs 500] [--size medium] [--json results.json]
+"""
+import argparse
+import json
+import random
+import time
+
+from benchmarks.harness import configure_environment, run_metadata
+from benchmarks.synthetic import DOCUMENT_SIZES, make_document
+
+
+def naive_iob2_tags(offsets, annotations):
+    tags = ["O"] * len(offsets)
+    for annotation in annotations:
+        for idx, (start, end) in enumerate(offsets):
+            if start >= annotation["start_index"] and end <= annotation["end_index"]:
+                tags[idx] = f"B-{annotation['entity']}" if start == annotation["start_index"] else f"I-{annotation['entity']}"
+    return tags
+
+
+def timed_ms(func) -> float:
+    start = time.perf_counter()
+    func()
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", help="Throwaway mongod to use instead of the in-memory stand-in")
+    parser.add_argument("--docs", type=int, default=500)
+    parser.add_argument("--size", choices=sorted(DOCUMENT_SIZES), default="medium")
+    parser.add_argument("--density", type=float, default=0.05, help="Annotation density (spans per 10 characters)")
+    parser.add_argument("--tokenizer", default="words")
+    parser.add_argument("--repeat", type=int, default=3, help="Warm exports")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    mongo_backend = configure_environment(args.mongo_url, "http://127.0.0.1:9", extra_env={"EXPORT_TOKENIZERS": args.tokenizer})
+
+    import auto_gen_tools.ner_tools as ner_tools
+    from config.database import client as mongo_client, DB_NAME, documents_collection, document_tokens_collection
+    import routes.projects as projects_route
+    from routes.projects import iob2_lines
+
+    project_id = "65a000000000000000000000"
+    rng = random.Random(args.seed)
+    documents_collection.insert_many([
+        make_document(project_id, DOCUMENT_SIZES[args.size], rng, density=args.density) for _ in range(args.docs)
+    ])
+
+    def export():
+        return sum(len(chunk) for chunk in iob2_lines(project_id, args.tokenizer, "conll"))
+
+    try:
+        # The previous path: no cache (convert_span_to_iob2 tokenizes) and the all-tokens scan per span
+        cached_tokens, bisect_tags = projects_route.documents_tokens, ner_tools.iob2_tags
+        projects_route.documents_tokens = lambda batch, tokenizer: {str(doc["_id"]): None for doc in batch}
+        ner_tools.iob2_tags = naive_iob2_tags
+        try:
+            uncached_ms = timed_ms(export)
+        finally:
+            projects_route.documents_tokens, ner_tools.iob2_tags = cached_tokens, bisect_tags
+
+        document_tokens_collection.delete_many({})
+        cold_ms = timed_ms(export)
+        warm_ms = min(timed_ms(export) for _ in range(args.repeat))
+        result = {
+            "docs": args.docs,
+            "size": args.size,
+            "tokenizer": args.tokenizer,
+            "output_bytes": export(),
+            "uncached_ms": uncached_ms,
+            "cold_ms": cold_ms,
+            "warm_ms": warm_ms,
+            "warm_speedup": round(uncached_ms / warm_ms, 2) if warm_ms else None,
+        }
+        print(json.dumps(result))
+    finally:
+        if args.mongo_url:
+            mongo_client.drop_database(DB_NAME)
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({
+                "benchmark": "iob2_export",
+                "metadata": run_metadata(mongo=mongo_backend, repeat=args.repeat, seed=args.seed),
+                "results": result,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Throughput of packed multi-document prompts against one request per document.
+
+Runs the app from main.py against the in-memory MongoDB stand-in and the fake
+LLM server (fixed latency per call plus latency per generated token), then
+annotates the same corpus of short documents twice:
+
+    single  POST /api/auto/auto_annotate_ner, one request per document
+    packed  POST /api/auto/auto_annotate_ner/batch, --batch-size documents per
+            request, packed into prompts of up to --max-documents-per-prompt
+
+and reports documents per second, LLM calls and prompt tokens for each.
+Local pre-annotation and request coalescing are turned off so that only the
+LLM path is measured.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_packing [--docs 200] [--doc-chars 120] [--json results.json]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import random
+import sys
+import time
+
+from benchmarks.fake_llm_server import FakeLLMConfig, start_fake_llm_server
+from benchmarks.harness import configure_environment, run_metadata, start_app_server
+from benchmarks.synthetic import make_text
+
+NAMES = ("Acme", "Globex", "Initech", "Umbrella", "Hooli", "Stark", "Wayne", "Tyrell", "Cyberdyne", "Soylent")
+CLASSES = ["Organization", "Person", "Address"]
+
+
+def make_short_documents(count: int, n_chars: int, rng: random.Random):
+    documents = []
+    for i in range(count):
+        words = make_text(n_chars, rng).split(" ")
+        for _ in range(2):
+            words.insert(rng.randrange(len(words) + 1), rng.choice(NAMES))
+        documents.append({"id": f"doc-{i}", "text": " ".join(words)})
+    return documents
+
+
+async def run_single(client, documents, concurrency: int):
+    queue = iter(documents)
+    spans, errors = 0, 0
+
+    async def worker():
+        nonlocal spans, errors
+        for document in queue:
+            response = await client.post("/api/auto/auto_annotate_ner", json={"text": document["text"], "classes": CLASSES})
+            if response.status_code == 200:
+                spans += len(response.json()["annotations"])
+            else:
+                errors += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {"spans": spans, "errors": errors, "fallback_documents": 0}
+
+
+async def run_packed(client, documents, concurrency: int, batch_size: int, max_documents: int, max_tokens: int):
+    batches = iter([documents[i:i + batch_size] for i in range(0, len(documents), batch_size)])
+    spans, errors, fallback = 0, 0, 0
+
+    async def worker():
+        nonlocal spans, errors, fallback
+        for batch in batches:
+            response = await client.post("/api/auto/auto_annotate_ner/batch", json={
+                "documents": batch,
+                "classes": CLASSES,
+                "max_documents_per_prompt": max_documents,
+                "max_prompt_tokens": max_tokens,
+            })
+            if response.status_code != 200:
+                errors += len(batch)
+                continue
+            body = response.json()
+            fallback += body["fallback_documents"]
+            for result in body["results"]:
+                if "error" in result:
+                    errors += 1
+                spans += len(result["annotations"])
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {"spans": spans, "errors": errors, "fallback_documents": fallback}
+
+
+async def benchmark(args, base_url: str, documents, llm_config: FakeLLMConfig, usage_collection):
+    import httpx
+
+    results = {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=600) as client:
+        # Warm-up so connection setup is not measured
+        await client.post("/api/auto/auto_annotate_ner", json={"text": "Acme", "classes": CLASSES})
+        for mode in ("single", "packed"):
+            requests_before = llm_config.requests
+            usage_collection.delete_many({})
+            start = time.perf_counter()
+            if mode == "single":
+                row = await run_single(client, documents, args.concurrency)
+            else:
+                row = await run_packed(client, documents, args.concurrency, args.batch_size, args.max_documents_per_prompt, args.max_prompt_tokens)
+            elapsed = time.perf_counter() - start
+            prompt_tokens = sum(row_usage.get("prompt_tokens", 0) for row_usage in usage_collection.find({}, {"prompt_tokens": 1}))
+            results[mode] = {
+                "documents": len(documents),
+                "elapsed_s": round(elapsed, 3),
+                "docs_per_second": round(len(documents) / elapsed, 2),
+                "llm_calls": llm_config.requests - requests_before,
+                "prompt_tokens": prompt_tokens,
+                **row,
+            }
+            print(json.dumps({mode: results[mode]}), file=sys.__stdout__)
+    results["speedup"] = round(results["packed"]["docs_per_second"] / results["single"]["docs_per_second"], 2)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=200, help="Short documents to annotate")
+    parser.add_argument("--doc-chars", type=int, default=120, help="Characters per document")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent client requests")
+    parser.add_argument("--batch-size", type=int, default=50, help="Documents per batch request")
+    parser.add_argument("--max-documents-per-prompt", type=int, default=20)
+    parser.add_argument("--max-prompt-tokens", type=int, default=2048)
+    parser.add_argument("--backend-concurrency", type=int, default=2, help="Generations the (fake) Ollama runs at once")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Fake LLM seconds per call")
+    parser.add_argument("--llm-token-latency", type=float, default=0.002, help="Fake LLM seconds per generated token")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the app's print output")
+    args = parser.parse_args()
+
+    llm_config = FakeLLMConfig(args.llm_latency, args.llm_token_latency, think=False)
+    llm_server, llm_url, _ = start_fake_llm_server(config=llm_config)
+    configure_environment(None, llm_url, extra_env={
+        "USE_LOCAL_LLM": "True",
+        "OLLAMA_MAX_CONCURRENCY": str(args.backend_concurrency),
+        "LOCAL_PREANNOTATION_ENABLED": "False",
+        "LLM_COALESCE_ENABLED": "False",
+    })
+
+    import main as app_module
+    from config.database import llm_usage_collection
+
+    documents = make_short_documents(args.docs, args.doc_chars, random.Random(args.seed))
+    server, base_url = start_app_server(app_module.app)
+    output = io.StringIO() if not args.verbose else sys.stdout
+    try:
+        with contextlib.redirect_stdout(output):
+            results = asyncio.run(benchmark(args, base_url, documents, llm_config, llm_usage_collection))
+    finally:
+        server.should_exit = True
+        llm_server.shutdown()
+
+    print(f"packed / single throughput: {results['speedup']}x")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({
+                "benchmark": "packing",
+                "metadata": run_metadata(
+                    docs=args.docs, doc_chars=args.doc_chars, concurrency=args.concurrency, batch_size=args.batch_size,
+                    max_documents_per_prompt=args.max_documents_per_prompt, max_prompt_tokens=args.max_prompt_tokens,
+                    backend_concurrency=args.backend_concurrency, llm_latency=args.llm_latency,
+                    llm_token_latency=args.llm_token_latency, seed=args.seed,
+                ),
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
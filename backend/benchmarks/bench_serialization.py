@@ -0,0 +1,130 @@
+"""
+Benchmark serialization of a 100-document list page and a project export.
+
+Compares the previous path (hand-converted datetimes, `Document(**doc)` per
+record, FastAPI validation against `response_model=Dict[str, Any]`, stdlib
+JSON) with the orjson fast path used by the routes today.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_serialization [--docs 100] [--repeat 50] [--json results.json]
+"""
+import argparse
+import asyncio
+import copy
+import json
+import random
+import time
+from datetime import datetime
+from typing import Any, Dict
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from benchmarks.synthetic import DOCUMENT_SIZES, make_document
+from models.document import Document
+from utils.serialization import MongoJSONResponse, document_to_dict
+
+PROJECT_ID = "65a000000000000000000000"
+RESPONSE_FIELD = create_response_field(name="Response_get_project_documents", type_=Dict[str, Any])
+
+
+def legacy_list_page(records):
+    documents = []
+    for doc in records:
+        doc["id"] = str(doc.pop("_id"))
+        doc.setdefault("text", "")
+        doc.setdefault("filename", f"document_{doc['id']}.txt")
+        doc.setdefault("project_id", PROJECT_ID)
+        doc.setdefault("status", "pending")
+        doc.setdefault("annotations", [])
+        if isinstance(doc.get("created_at"), datetime):
+            doc["created_at"] = doc["created_at"].isoformat()
+        if isinstance(doc.get("updated_at"), datetime):
+            doc["updated_at"] = doc["updated_at"].isoformat()
+        documents.append(Document(**doc))
+    content = asyncio.run(serialize_response(
+        field=RESPONSE_FIELD,
+        response_content={"total_count": len(documents), "documents": documents},
+    ))
+    return JSONResponse(content).body
+
+
+def fast_list_page(records):
+    documents = [document_to_dict(doc, PROJECT_ID) for doc in records]
+    return MongoJSONResponse({"total_count": len(documents), "documents": documents}).body
+
+
+def legacy_serialize_document(doc):
+    serialized = {}
+    for key, value in doc.items():
+        if isinstance(value, datetime):
+            serialized[key] = value.isoformat()
+        elif isinstance(value, dict):
+            serialized[key] = legacy_serialize_document(value)
+        elif isinstance(value, list):
+            serialized[key] = [legacy_serialize_document(i) if isinstance(i, dict) else i for i in value]
+        elif not isinstance(value, (str, int, float, bool, type(None))):
+            serialized[key] = str(value)
+        else:
+            serialized[key] = value
+    return serialized
+
+
+def legacy_export(records):
+    return JSONResponse({"documents": [legacy_serialize_document(doc) for doc in records]}).body
+
+
+def fast_export(records):
+    return MongoJSONResponse({"documents": records}).body
+
+
+def timed(func, records, repeat):
+    # Each run gets its own copy because the legacy path mutates records in place
+    batches = [copy.deepcopy(records) for _ in range(repeat)]
+    start = time.perf_counter()
+    for batch in batches:
+        body = func(batch)
+    elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+    return round(elapsed_ms, 3), len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=100, help="Documents per page")
+    parser.add_argument("--size", choices=sorted(DOCUMENT_SIZES), default="small", help="Document text size")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    # Dense annotations make the per-record model building cost visible
+    records = [make_document(PROJECT_ID, DOCUMENT_SIZES[args.size], rng, density=0.1) for _ in range(args.docs)]
+
+    results = []
+    for name, legacy, fast in (
+        ("list_page", legacy_list_page, fast_list_page),
+        ("export", legacy_export, fast_export),
+    ):
+        legacy_ms, legacy_bytes = timed(legacy, records, args.repeat)
+        fast_ms, fast_bytes = timed(fast, records, args.repeat)
+        row = {
+            "case": name,
+            "documents": args.docs,
+            "legacy_ms": legacy_ms,
+            "fast_ms": fast_ms,
+            "speedup": round(legacy_ms / max(fast_ms, 1e-9), 1),
+            "legacy_bytes": legacy_bytes,
+            "fast_bytes": fast_bytes,
+        }
+        results.append(row)
+        print(f"{name:<10} legacy {legacy_ms:>9.3f} ms   fast {fast_ms:>9.3f} ms   speedup x{row['speedup']}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"benchmark": "serialization", "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
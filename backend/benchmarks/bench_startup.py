@@ -0,0 +1,115 @@
+"""
+App import time and per-worker baseline memory.
+
+Every uvicorn worker imports main.py before serving, so whatever the import
+pulls in is paid once per worker in startup time and resident memory. This
+imports the app in fresh interpreters, --runs times, and reports the import
+time and RSS after import:
+
+    app          import main (heavy dependencies stay unloaded)
+    app+preload  import main, then the --preload modules, i.e. what a worker
+                 costs with PRELOAD_MODULES set or with eager imports
+
+plus, per heavy module that is installed, its import time and RSS on top of
+a bare interpreter. No MongoDB or LLM is needed: nothing connects at import.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_startup [--runs 5] [--preload openai,transformers] [--json results.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.harness import BACKEND_DIR, run_metadata
+
+HEAVY_MODULES = ("openai", "transformers", "torch", "langchain")
+
+PROBE = r"""
+import json, sys, time
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+before = rss_mb()
+start = time.perf_counter()
+for name in sys.argv[1].split(","):
+    if name:
+        __import__(name)
+elapsed = time.perf_counter() - start
+print(json.dumps({"import_s": elapsed, "rss_mb": rss_mb(), "rss_before_mb": before}))
+"""
+
+
+def measure(modules, runs: int):
+    env = {
+        **os.environ,
+        "MONGODB_URL": "mongodb://localhost:27017",
+        "MONGODB_DB_NAME": "smartannotate_bench",
+        "MONGODB_COLLECTION": "documents",
+    }
+    samples = []
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, "-c", PROBE, ",".join(modules)],
+            cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+        )
+        if completed.returncode != 0:
+            return {"error": completed.stderr.strip().splitlines()[-1]}
+        samples.append(json.loads(completed.stdout))
+    return {
+        "import_ms_median": round(statistics.median(s["import_s"] for s in samples) * 1000, 1),
+        "import_ms_min": round(min(s["import_s"] for s in samples) * 1000, 1),
+        "rss_mb_median": round(statistics.median(s["rss_mb"] for s in samples), 1),
+        "rss_added_mb_median": round(statistics.median(s["rss_mb"] - s["rss_before_mb"] for s in samples), 1),
+    }
+
+
+def installed(name: str) -> bool:
+    import importlib.util
+    return importlib.util.find_spec(name) is not None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per measurement")
+    parser.add_argument("--preload", default="openai,transformers", help="Modules imported in the app+preload case")
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    preload = [name for name in args.preload.split(",") if name and installed(name)]
+    results = {
+        "app": measure(["main"], args.runs),
+        "app+preload": measure(["main", *preload], args.runs),
+        "modules": {name: measure([name], args.runs) for name in HEAVY_MODULES if installed(name)},
+    }
+    results["preloaded"] = preload
+    missing = [name for name in HEAVY_MODULES if not installed(name)]
+    if missing:
+        results["not_installed"] = missing
+
+    for name in ("app", "app+preload"):
+        print(json.dumps({name: results[name]}))
+    for name, row in results["modules"].items():
+        print(json.dumps({name: row}))
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({
+                "benchmark": "startup",
+                "metadata": run_metadata(runs=args.runs, preload=preload),
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
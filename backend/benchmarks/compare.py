@@ -0,0 +1,55 @@
+"""
+Compare two benchmark result files written by the benchmark scripts.
+
+Prints throughput and latency changes per scenario and exits with status 1
+when a p95 latency regressed by more than --threshold percent, so it can
+gate CI runs.
+
+Usage (from the backend directory):
+    python -m benchmarks.compare baseline.json candidate.json [--threshold 10]
+"""
+import argparse
+import json
+import sys
+
+METRICS = ("throughput_rps", "p50_ms", "p95_ms", "p99_ms")
+
+
+def change(old, new):
+    if old in (None, 0) or new is None:
+        return None
+    return (new - old) / old * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed p95 regression in percent")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)["scenarios"]
+    with open(args.candidate) as f:
+        candidate = json.load(f)["scenarios"]
+
+    regressions = []
+    print(f"{'scenario':<16}" + "".join(f"{metric:>32}" for metric in METRICS))
+    for name in sorted(set(baseline) & set(candidate)):
+        cells = []
+        for metric in METRICS:
+            old, new = baseline[name].get(metric), candidate[name].get(metric)
+            delta = change(old, new)
+            cells.append(f"{old} -> {new} ({delta:+.1f}%)" if delta is not None else f"{old} -> {new}")
+        print(f"{name:<16}" + "".join(f"{cell:>32}" for cell in cells))
+        p95_delta = change(baseline[name].get("p95_ms"), candidate[name].get("p95_ms"))
+        if p95_delta is not None and p95_delta > args.threshold:
+            regressions.append((name, p95_delta))
+
+    for name, delta in regressions:
+        print(f"REGRESSION: {name} p95 latency {delta:+.1f}%")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
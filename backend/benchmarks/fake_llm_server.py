@@ -0,0 +1,289 @@
+"""
+Local stand-in for the Ollama and OpenAI HTTP APIs with configurable latency.
+
+Implements the endpoints the backend calls:
+    POST /api/generate, GET /api/tags, GET /api/ps, GET /api/version   (Ollama)
+    POST /v1/chat/completions, streaming and non-streaming              (OpenAI)
+
+Replies are NER-shaped JSON arrays built from capitalised words in the
+prompt's "Text:" section (or, for packed prompts, in each "### Document <id>"
+section, tagged with its id), so the backend's parsing path is exercised too.
+
+Like Ollama, a model has to be loaded before it generates: the first request
+for a model that is not resident waits --load-latency seconds (reported as
+`load_duration`), and the model then stays resident for the request's
+`keep_alive` (default 5m) after its last use. GET /api/ps lists the resident
+models with their `expires_at`.
+
+Usage (from the backend directory):
+    python -m benchmarks.fake_llm_server --port 11434 --latency 0.5 --token-latency 0.01
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+CAPITALISED = re.compile(r"\b[A-Z][a-zA-Z]{2,}\b")
+PACKED_DOCUMENT = re.compile(r"^### Document (\S+)$", re.MULTILINE)
+DURATION = re.compile(r"^(-?\d+(?:\.\d+)?)(ms|s|m|h)?$")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, None: 1}
+
+
+def keep_alive_seconds(value, default: float) -> float:
+    """Seconds a model stays resident for an Ollama `keep_alive` (5, "30s", "10m", -1 = forever)."""
+    if value is None:
+        return default
+    match = DURATION.match(str(value).strip())
+    if not match:
+        return default
+    seconds = float(match.group(1)) * DURATION_UNITS[match.group(2)]
+    return float("inf") if seconds < 0 else seconds
+
+
+class FakeLLMConfig:
+    """Latency model of the fake server, shared by all handler threads."""
+
+    def __init__(
+        self,
+        latency: float = 0.2,
+        token_latency: float = 0.0,
+        think: bool = True,
+        status_code: int = 200,
+        load_latency: float = 0.0,
+        default_keep_alive: float = 300.0,
+    ):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.think = think
+        self.status_code = status_code
+        self.load_latency = load_latency
+        self.default_keep_alive = default_keep_alive
+        self.requests = 0
+        self.loads = 0
+        # model -> time.time() until which it stays resident
+        self.resident: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        # Models load one at a time; requests for a loading model wait for it
+        self._load_lock = threading.Lock()
+
+    def count(self) -> int:
+        with self._lock:
+            self.requests += 1
+            return self.requests
+
+    def load(self, model: str, keep_alive) -> float:
+        """Make `model` resident for `keep_alive` after this request; returns the load seconds spent."""
+        with self._load_lock:
+            load_seconds = 0.0
+            if self.resident.get(model, 0) <= time.time():
+                time.sleep(self.load_latency)
+                load_seconds = self.load_latency
+                self.loads += 1
+            self.resident[model] = time.time() + keep_alive_seconds(keep_alive, self.default_keep_alive)
+            return load_seconds
+
+    def resident_models(self) -> List[Dict]:
+        now = time.time()
+        models = []
+        for model, until in list(self.resident.items()):
+            if until <= now:
+                continue
+            models.append({
+                "name": model,
+                "model": model,
+                "size_vram": 1,
+                "expires_at": rfc3339_nano(until),
+            })
+        return models
+
+
+def rfc3339_nano(timestamp: float) -> str:
+    """
+    A time the way Ollama (Go's time.RFC3339Nano) writes it: local offset or
+    "Z" for UTC, up to nine fraction digits with trailing zeros dropped.
+    """
+    if timestamp == float("inf"):
+        # keep_alive < 0: Ollama reports a far-future expiry
+        moment, nanos = datetime.max.replace(tzinfo=timezone.utc), 999999999
+    else:
+        moment = datetime.fromtimestamp(timestamp).astimezone()
+        nanos = moment.microsecond * 1000 + int(round(timestamp * 1e9)) % 1000
+    offset = moment.strftime("%z")
+    zone = "Z" if offset == "+0000" else f"{offset[:3]}:{offset[3:]}"
+    fraction = f"{nanos:09d}".rstrip("0")
+    return moment.strftime("%Y-%m-%dT%H:%M:%S") + (f".{fraction}" if fraction else "") + zone
+
+
+def build_reply(prompt: str, think: bool) -> str:
+    classes_match = re.search(r"Entity Classes:\s*(.*)", prompt)
+    classes = [c.strip() for c in classes_match.group(1).split(",")] if classes_match else ["ENTITY"]
+    if PACKED_DOCUMENT.search(prompt):
+        # Packed prompt: entities of every document, tagged with its id
+        entities = []
+        parts = PACKED_DOCUMENT.split(prompt)
+        for doc_id, text in zip(parts[1::2], parts[2::2]):
+            words = list(dict.fromkeys(CAPITALISED.findall(text)))[:20]
+            entities.extend({"id": doc_id, "text": word, "entity": classes[i % len(classes)]} for i, word in enumerate(words))
+    else:
+        text = prompt.split("Text:", 1)[-1].split("Entity Classes:", 1)[0]
+        words = list(dict.fromkeys(CAPITALISED.findall(text)))[:20]
+        entities = [{"text": word, "entity": classes[i % len(classes)]} for i, word in enumerate(words)]
+    reply = json.dumps(entities)
+    if think:
+        reply = "<think>Looking for entities of the requested classes in the text.</think>\n" + reply
+    return reply
+
+
+def approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    config = FakeLLMConfig()
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, payload: Dict, status: int = 200) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": "fake:latest", "model": "fake:latest", "size": 1}]})
+        elif self.path == "/api/ps":
+            self._send_json({"models": self.config.resident_models()})
+        elif self.path == "/api/version":
+            self._send_json({"version": "0.0.0-fake"})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        self.config.count()
+        payload = self._read_json()
+        if self.config.status_code != 200:
+            time.sleep(self.config.latency)
+            self._send_json({"error": {"message": "fake error"}}, status=self.config.status_code)
+            return
+        if self.path == "/api/generate":
+            self._ollama_generate(payload)
+        elif self.path.endswith("/chat/completions"):
+            self._openai_chat(payload)
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def _ollama_generate(self, payload: Dict) -> None:
+        prompt = payload.get("prompt", "")
+        load_seconds = self.config.load(payload.get("model"), payload.get("keep_alive"))
+        if not prompt:
+            # Empty prompt is a model load request
+            self._send_json({"model": payload.get("model"), "response": "", "done": True, "load_duration": int(load_seconds * 1e9)})
+            return
+        reply = build_reply(prompt, self.config.think)
+        completion_tokens = approx_tokens(reply)
+        prompt_tokens = approx_tokens(prompt)
+        generation = completion_tokens * self.config.token_latency
+        time.sleep(self.config.latency + generation)
+        self._send_json({
+            "model": payload.get("model"),
+            "response": reply,
+            "done": True,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(self.config.latency * 1e9),
+            "eval_count": completion_tokens,
+            "eval_duration": int(generation * 1e9),
+            "load_duration": int(load_seconds * 1e9),
+            "total_duration": int((load_seconds + self.config.latency + generation) * 1e9),
+        })
+
+    def _openai_chat(self, payload: Dict) -> None:
+        prompt = " ".join(m.get("content", "") for m in payload.get("messages", []))
+        reply = build_reply(prompt, self.config.think)
+        usage = {
+            "prompt_tokens": approx_tokens(prompt),
+            "completion_tokens": approx_tokens(reply),
+            "total_tokens": approx_tokens(prompt) + approx_tokens(reply),
+        }
+        time.sleep(self.config.latency)
+        base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": payload.get("model")}
+
+        if not payload.get("stream"):
+            generation = usage["completion_tokens"] * self.config.token_latency
+            time.sleep(generation)
+            self._send_json({
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        pieces = [reply[i:i + 16] for i in range(0, len(reply), 16)]
+        for piece in pieces:
+            chunk = {**base, "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(self.config.token_latency * approx_tokens(piece))
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            chunk = {**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+def start_fake_llm_server(host: str = "127.0.0.1", port: int = 0, config: Optional[FakeLLMConfig] = None):
+    """
+    Start the fake server in a daemon thread.
+
+    Returns:
+        (server, base_url, config); call server.shutdown() to stop it
+    """
+    config = config or FakeLLMConfig()
+    handler = type("ConfiguredFakeLLMHandler", (FakeLLMHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}", config
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.2, help="Fixed seconds per request (prompt processing)")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Seconds per generated token")
+    parser.add_argument("--no-think", action="store_true", help="Do not prepend a <think> section")
+    parser.add_argument("--load-latency", type=float, default=0.0, help="Seconds to load a model that is not resident")
+    args = parser.parse_args(argv)
+
+    config = FakeLLMConfig(args.latency, args.token_latency, think=not args.no_think, load_latency=args.load_latency)
+    server, url, _ = start_fake_llm_server(args.host, args.port, config)
+    print(f"Fake LLM server listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
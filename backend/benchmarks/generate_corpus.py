@@ -0,0 +1,196 @@
+"""
+Fill a MongoDB database with a synthetic SmartAnnotate corpus.
+
+Creates users, projects and documents shaped like the `User`, `Project`
+(with `EntityClass`) and `Document` (with `Annotation`) models, with
+configurable size distributions, and writes a manifest of the created
+users and projects for `benchmarks.load_test`.
+
+Distributions are written as `kind:params`:
+    fixed:N               always N
+    uniform:A,B           integer uniformly drawn from [A, B]
+    lognormal:MU,SIGMA    rounded exp(normal(MU, SIGMA)); long-tailed sizes
+
+Usage (from the backend directory):
+    python -m benchmarks.generate_corpus --mongo-url mongodb://localhost:27017 --db smartannotate_load \\
+        --users 20 --projects 10 --docs-per-project lognormal:9,1.5 --manifest corpus.json
+"""
+import argparse
+import json
+import math
+import os
+import random
+import string
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.synthetic import ENTITY_CLASSES, make_annotations, make_text
+
+BASE_CLASS_NAMES = [entity["name"] for entity in ENTITY_CLASSES] + [
+    "Money", "Percent", "Product", "Event", "Law", "Language", "Location", "Facility",
+    "Email", "URL", "PostalCode", "InvoiceNumber", "IBAN", "VATNumber", "Quantity",
+]
+
+
+class Distribution:
+    """Integer-valued random distribution parsed from `kind:params`."""
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, _, params = spec.partition(":")
+        values = [float(value) for value in params.split(",") if value]
+        if kind == "fixed" and len(values) == 1:
+            self._sample = lambda rng: values[0]
+        elif kind == "uniform" and len(values) == 2:
+            self._sample = lambda rng: rng.uniform(values[0], values[1])
+        elif kind == "lognormal" and len(values) == 2:
+            self._sample = lambda rng: math.exp(rng.gauss(values[0], values[1]))
+        else:
+            raise argparse.ArgumentTypeError(f"Invalid distribution: {spec}")
+
+    def sample(self, rng: random.Random, minimum: int = 0, maximum: int = None) -> int:
+        value = max(minimum, int(round(self._sample(rng))))
+        return min(value, maximum) if maximum is not None else value
+
+    def __repr__(self):
+        return self.spec
+
+
+def make_entity_classes(count: int, rng: random.Random):
+    names = list(BASE_CLASS_NAMES)
+    while len(names) < count:
+        names.append(f"Class{len(names) + 1}")
+    return [
+        {
+            "name": name,
+            "color": "#" + "".join(rng.choice("0123456789abcdef") for _ in range(6)),
+            "description": f"{name} entities",
+        }
+        for name in names[:count]
+    ]
+
+
+def random_filename(rng: random.Random) -> str:
+    stem = "".join(rng.choice(string.ascii_lowercase) for _ in range(8))
+    return f"{stem}_{rng.randint(0, 10**6)}.txt"
+
+
+def generate(args, client=None):
+    """Generate the corpus described by `args`; `client` overrides --mongo-url (e.g. an in-memory stand-in)."""
+    # utils.auth pulls in config.database, which reads these at import time
+    os.environ.setdefault("MONGODB_URL", args.mongo_url)
+    os.environ.setdefault("MONGODB_DB_NAME", args.db)
+    os.environ.setdefault("MONGODB_COLLECTION", args.collection)
+    from pymongo import MongoClient
+    from utils.auth import get_password_hash
+
+    rng = random.Random(args.seed)
+    client = client or MongoClient(args.mongo_url)
+    db = client[args.db]
+    users_collection = db["users"]
+    projects_collection = db["projects"]
+    documents_collection = db[args.collection]
+
+    if args.drop:
+        for name in ("users", "projects", args.collection):
+            db.drop_collection(name)
+
+    # bcrypt is slow; every generated user shares one hash
+    password_hash = get_password_hash(args.password)
+    now = datetime.utcnow()
+    users = []
+    for i in range(args.users):
+        email = f"annotator{i}@example.com"
+        user_id = users_collection.insert_one({
+            "email": email,
+            "username": f"annotator{i}",
+            "password": password_hash,
+            "created_at": now,
+            "about_me": "",
+            "profile_picture": "",
+            "updated_at": None,
+        }).inserted_id
+        users.append({"id": str(user_id), "email": email, "projects": []})
+
+    statuses = [status for status, weight in (("pending", 5), ("in_progress", 2), ("completed", 3)) for _ in range(weight)]
+    total_docs = 0
+    start = time.perf_counter()
+    manifest_projects = []
+    for p in range(args.projects):
+        owner = users[p % len(users)]
+        entity_classes = make_entity_classes(args.entity_classes.sample(rng, minimum=1), rng)
+        project_id = str(projects_collection.insert_one({
+            "name": f"Load project {p}",
+            "description": "Synthetic load-test project",
+            "entity_classes": entity_classes,
+            "user_id": owner["id"],
+            "created_at": now,
+            "updated_at": now,
+        }).inserted_id)
+        owner["projects"].append(project_id)
+
+        n_docs = args.docs_per_project.sample(rng, minimum=1, maximum=args.max_docs_per_project)
+        batch = []
+        for d in range(n_docs):
+            text = make_text(args.doc_chars.sample(rng, minimum=20), rng)
+            status = rng.choice(statuses)
+            density = args.annotation_density if status != "pending" else args.annotation_density * rng.random() * 0.2
+            created = now - timedelta(seconds=rng.randint(0, 180 * 24 * 3600))
+            batch.append({
+                "text": text,
+                "project_id": project_id,
+                "filename": random_filename(rng),
+                "created_at": created,
+                "updated_at": created,
+                "annotations": make_annotations(text, rng, density, entity_classes),
+                "entities": [],
+                "status": status,
+            })
+            if len(batch) >= args.batch_size:
+                documents_collection.insert_many(batch, ordered=False)
+                total_docs += len(batch)
+                batch = []
+                elapsed = time.perf_counter() - start
+                print(f"\r{total_docs} documents ({total_docs / elapsed:.0f}/s)", end="", flush=True)
+        if batch:
+            documents_collection.insert_many(batch, ordered=False)
+            total_docs += len(batch)
+        manifest_projects.append({"id": project_id, "owner": owner["email"], "documents": n_docs, "entity_classes": len(entity_classes)})
+
+    elapsed = time.perf_counter() - start
+    print(f"\nInserted {args.users} users, {args.projects} projects and {total_docs} documents in {elapsed:.1f}s")
+
+    manifest = {
+        "mongo_db": args.db,
+        "password": args.password,
+        "users": users,
+        "projects": manifest_projects,
+        "params": {key: str(value) for key, value in vars(args).items() if key not in ("password", "mongo_url")},
+    }
+    with open(args.manifest, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Manifest written to {args.manifest}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", required=True)
+    parser.add_argument("--db", required=True, help="Database name (use a throwaway one)")
+    parser.add_argument("--collection", default="documents", help="Documents collection (MONGODB_COLLECTION)")
+    parser.add_argument("--drop", action="store_true", help="Drop existing users/projects/documents first")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--password", default="loadtest", help="Password of every generated user")
+    parser.add_argument("--projects", type=int, default=5)
+    parser.add_argument("--docs-per-project", type=Distribution, default=Distribution("lognormal:9,1.5"))
+    parser.add_argument("--max-docs-per-project", type=int, default=1_000_000)
+    parser.add_argument("--doc-chars", type=Distribution, default=Distribution("lognormal:7.5,1"))
+    parser.add_argument("--entity-classes", type=Distribution, default=Distribution("uniform:5,25"))
+    parser.add_argument("--annotation-density", type=float, default=0.05, help="Spans per 10 characters for annotated documents")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Documents per insert_many")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--manifest", default="corpus_manifest.json")
+    generate(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
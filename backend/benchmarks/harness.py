@@ -0,0 +1,126 @@
+"""Shared plumbing for the end-to-end benchmarks: stand-ins, app server and statistics."""
+import atexit
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def configure_environment(mongo_url: Optional[str], llm_url: str, db_name: str = "smartannotate_bench", extra_env: Optional[Dict[str, str]] = None) -> str:
+    """
+    Point the backend configuration at the stand-ins. Must run before `main` is imported.
+
+    Args:
+        mongo_url: A throwaway mongod URL, or None to use the in-memory mongomock stand-in
+        llm_url: Base URL of the fake LLM server (used for both Ollama and OpenAI)
+        db_name: Database to use; dropped by the caller when done
+
+    Returns:
+        "mongod" or "mongomock"
+    """
+    os.chdir(BACKEND_DIR)
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+
+    # Export snapshots go to a throwaway folder rather than the backend's exports/
+    export_root = tempfile.mkdtemp(prefix="smartannotate_bench_exports_")
+    atexit.register(shutil.rmtree, export_root, ignore_errors=True)
+
+    os.environ.update({
+        "EXPORT_ROOT": export_root,
+        "MONGODB_URL": mongo_url or "mongodb://localhost:27017",
+        "MONGODB_DB_NAME": db_name,
+        "MONGODB_COLLECTION": "documents",
+        "OLLAMA_API_URL": llm_url,
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "bench-key"),
+        "OPENAI_BASE_URL": f"{llm_url}/v1",
+        **(extra_env or {}),
+    })
+
+    if mongo_url:
+        return "mongod"
+
+    import mongomock
+    import pymongo
+    pymongo.MongoClient = mongomock.MongoClient
+    return "mongomock"
+
+
+def start_app_server(app, host: str = "127.0.0.1", port: int = 0):
+    """
+    Serve the ASGI app with uvicorn in a daemon thread.
+
+    Returns:
+        (server, base_url); set server.should_exit = True to stop it
+    """
+    import socket
+    import uvicorn
+
+    if port == 0:
+        with socket.socket() as sock:
+            sock.bind((host, 0))
+            port = sock.getsockname()[1]
+
+    config = uvicorn.Config(app, host=host, port=port, log_level="warning", access_log=False)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 30
+    while not server.started:
+        if time.time() > deadline or not thread.is_alive():
+            raise RuntimeError("App server failed to start")
+        time.sleep(0.05)
+    return server, f"http://{host}:{port}"
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    """Throughput and latency percentiles (in milliseconds) for one scenario."""
+    ordered = sorted(latencies)
+    to_ms = lambda value: None if value is None else round(value * 1000, 3)
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "mean_ms": to_ms(sum(ordered) / len(ordered)) if ordered else None,
+        "p50_ms": to_ms(percentile(ordered, 50)),
+        "p95_ms": to_ms(percentile(ordered, 95)),
+        "p99_ms": to_ms(percentile(ordered, 99)),
+        "max_ms": to_ms(ordered[-1]) if ordered else None,
+    }
+
+
+def run_metadata(**params) -> Dict[str, Any]:
+    """Context stored next to the results so runs can be compared meaningfully."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+            capture_output=True, text=True, timeout=10,
+        ).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "params": params,
+    }
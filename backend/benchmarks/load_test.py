@@ -0,0 +1,300 @@
+"""
+Multi-user load test replaying realistic annotator sessions.
+
+Each virtual annotator logs in, lists their projects, then loops: open a
+documents page, open a document, think, optionally auto-annotate it, save
+annotations, think. Concurrency is stepped up in stages; per stage the
+driver reports throughput, latency percentiles per action and error rate,
+and the run ends with the saturation point: the first stage where p95
+latency exceeds the SLO, errors exceed the budget, or throughput stops
+scaling with the number of annotators.
+
+Against a running deployment (corpus from benchmarks.generate_corpus):
+    python -m benchmarks.load_test --base-url http://localhost:8000 --manifest corpus_manifest.json
+
+Self-hosted against a throwaway mongod (or in-memory with a small generated corpus):
+    python -m benchmarks.load_test --self-host --mongo-url mongodb://localhost:27017 --manifest corpus_manifest.json
+    python -m benchmarks.load_test --self-host --stages 1,2,4,8
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+from benchmarks.harness import run_metadata, summarize
+
+ACTIONS = ("login", "list_projects", "list_documents", "open_document", "auto_annotate", "save_document")
+
+
+class Stage:
+    """Latencies and errors collected while one concurrency level runs."""
+
+    def __init__(self, users: int):
+        self.users = users
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def record(self, action: str, latency: float, ok: bool) -> None:
+        if ok:
+            self.latencies[action].append(latency)
+        else:
+            self.errors[action] += 1
+
+    def report(self) -> Dict:
+        all_latencies = [value for values in self.latencies.values() for value in values]
+        errors = sum(self.errors.values())
+        overall = summarize(all_latencies, errors, self.elapsed)
+        overall["error_rate"] = round(errors / max(overall["requests"], 1), 4)
+        return {
+            "users": self.users,
+            "overall": overall,
+            "actions": {
+                action: summarize(self.latencies.get(action, []), self.errors.get(action, 0), self.elapsed)
+                for action in ACTIONS
+                if action in self.latencies or action in self.errors
+            },
+        }
+
+
+async def timed(stage: Stage, action: str, request):
+    start = time.perf_counter()
+    try:
+        response = await request
+        ok = response.status_code < 400
+    except Exception:
+        response, ok = None, False
+    stage.record(action, time.perf_counter() - start, ok)
+    return response if ok else None
+
+
+async def annotator_session(client, user: Dict, password: str, stage: Stage, deadline: float, args, rng: random.Random):
+    response = await timed(stage, "login", client.post(
+        "/api/auth/token", data={"username": user["email"], "password": password}
+    ))
+    if response is None:
+        return
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    response = await timed(stage, "list_projects", client.get("/api/projects/", headers=headers))
+    projects = [project["id"] for project in response.json()] if response is not None else user.get("projects", [])
+    if not projects:
+        return
+
+    while time.perf_counter() < deadline:
+        project_id = rng.choice(projects)
+        # Most annotators stay on the first pages
+        page = 1 + int(rng.expovariate(1.0))
+        response = await timed(stage, "list_documents", client.get(
+            f"/api/documents/project/{project_id}",
+            params={"page": page, "docsPerPage": args.page_size},
+            headers=headers,
+        ))
+        documents = response.json().get("documents", []) if response is not None else []
+        if not documents:
+            continue
+
+        document_id = rng.choice(documents)["id"]
+        response = await timed(stage, "open_document", client.get(f"/api/documents/{document_id}", headers=headers))
+        if response is None:
+            continue
+        document = response.json()
+        await asyncio.sleep(rng.uniform(*args.think_time))
+
+        annotations = document.get("annotations", [])
+        if rng.random() < args.auto_annotate_ratio:
+            response = await timed(stage, "auto_annotate", client.post(
+                f"/api/auto/project/{project_id}/document/{document_id}/auto_annotate", headers=headers
+            ))
+            if response is not None:
+                annotations = annotations + [
+                    span for span in response.json().get("annotations", []) if span.get("start_index", -1) >= 0
+                ]
+
+        text = document.get("text") or ""
+        if text:
+            # Annotator adds one span on a word boundary
+            start = rng.randrange(len(text))
+            start = text.rfind(" ", 0, start) + 1
+            end = text.find(" ", start)
+            end = len(text) if end == -1 else end
+            if end > start:
+                entity = rng.choice(annotations)["entity"] if annotations else "Manual"
+                annotations = annotations + [{"start_index": start, "end_index": end, "entity": entity, "text": text[start:end]}]
+        await timed(stage, "save_document", client.put(
+            f"/api/documents/{document_id}",
+            json={"annotations": annotations, "status": "in_progress"},
+            headers=headers,
+        ))
+        await asyncio.sleep(rng.uniform(*args.think_time))
+
+
+def find_saturation(stages: List[Dict], args) -> Dict:
+    """First stage that breaks the SLO, the error budget or throughput scaling."""
+    previous = None
+    for stage in stages:
+        overall = stage["overall"]
+        reason = None
+        if overall["p95_ms"] is not None and overall["p95_ms"] > args.slo_p95_ms:
+            reason = f"p95 {overall['p95_ms']} ms exceeds SLO {args.slo_p95_ms} ms"
+        elif overall["error_rate"] > args.max_error_rate:
+            reason = f"error rate {overall['error_rate']} exceeds {args.max_error_rate}"
+        elif previous is not None and previous["overall"]["throughput_rps"]:
+            user_growth = stage["users"] / previous["users"]
+            throughput_growth = (overall["throughput_rps"] or 0) / previous["overall"]["throughput_rps"]
+            # Throughput should grow at least half as fast as the number of annotators
+            if user_growth > 1 and throughput_growth < 1 + (user_growth - 1) * 0.5:
+                reason = f"throughput grew x{throughput_growth:.2f} for x{user_growth:.2f} annotators"
+        if reason:
+            return {
+                "saturated_at_users": stage["users"],
+                "max_sustainable_users": previous["users"] if previous else None,
+                "peak_throughput_rps": max(s["overall"]["throughput_rps"] or 0 for s in stages),
+                "reason": reason,
+            }
+        previous = stage
+    return {
+        "saturated_at_users": None,
+        "max_sustainable_users": stages[-1]["users"] if stages else None,
+        "peak_throughput_rps": max((s["overall"]["throughput_rps"] or 0 for s in stages), default=None),
+        "reason": "not saturated within the tested stages",
+    }
+
+
+async def run_load(args, base_url: str, manifest: Dict) -> List[Dict]:
+    import httpx
+
+    rng = random.Random(args.seed)
+    users = manifest["users"]
+    results = []
+    limits = httpx.Limits(max_connections=max(args.stages) * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        for n_users in args.stages:
+            stage = Stage(n_users)
+            deadline = time.perf_counter() + args.stage_duration
+            sessions = [
+                annotator_session(client, users[i % len(users)], manifest["password"], stage, deadline, args, random.Random(rng.random()))
+                for i in range(n_users)
+            ]
+            await asyncio.gather(*sessions)
+            stage.elapsed = time.perf_counter() - stage.started
+            report = stage.report()
+            results.append(report)
+            overall = report["overall"]
+            print(
+                f"{n_users:>5} annotators: {overall['throughput_rps']} req/s, p50 {overall['p50_ms']} ms, "
+                f"p95 {overall['p95_ms']} ms, errors {overall['error_rate']:.2%}",
+                file=sys.__stdout__,
+            )
+            if overall["p95_ms"] is not None and overall["p95_ms"] > args.slo_p95_ms * args.stop_factor:
+                print("Stopping: latency far beyond the SLO", file=sys.__stdout__)
+                break
+    return results
+
+
+def self_host(args):
+    """Start the app in-process against the stand-ins; returns (base_url, manifest, cleanup)."""
+    from benchmarks.fake_llm_server import FakeLLMConfig, start_fake_llm_server
+    from benchmarks.harness import configure_environment, start_app_server
+
+    llm_server, llm_url, _ = start_fake_llm_server(config=FakeLLMConfig(args.llm_latency, args.llm_token_latency))
+    db_name = "smartannotate_load"
+    manifest = None
+    if args.manifest:
+        with open(args.manifest) as f:
+            manifest = json.load(f)
+        db_name = manifest["mongo_db"]
+    configure_environment(args.mongo_url, llm_url, db_name=db_name)
+
+    if manifest is None:
+        # No corpus given: generate a small one through the app's own (possibly in-memory) client
+        from benchmarks import generate_corpus
+        from config.database import client as mongo_client
+        corpus_args = argparse.Namespace(
+            mongo_url=os.environ["MONGODB_URL"], db=db_name, collection="documents", drop=True,
+            users=max(args.stages), password="loadtest", projects=max(2, max(args.stages) // 2),
+            docs_per_project=generate_corpus.Distribution("lognormal:6,1"), max_docs_per_project=5000,
+            doc_chars=generate_corpus.Distribution("lognormal:7.5,0.8"),
+            entity_classes=generate_corpus.Distribution("uniform:5,15"), annotation_density=0.05,
+            batch_size=1000, seed=args.seed, manifest=os.path.join(os.getcwd(), "load_manifest.json"),
+        )
+        generate_corpus.generate(corpus_args, client=mongo_client)
+        with open(corpus_args.manifest) as f:
+            manifest = json.load(f)
+
+    import main as app_module
+    server, base_url = start_app_server(app_module.app)
+
+    def cleanup():
+        server.should_exit = True
+        llm_server.shutdown()
+
+    return base_url, manifest, cleanup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="Running backend to load (omit with --self-host)")
+    parser.add_argument("--manifest", help="Manifest written by benchmarks.generate_corpus")
+    parser.add_argument("--self-host", action="store_true", help="Start the app in-process against stand-ins")
+    parser.add_argument("--mongo-url", help="With --self-host: mongod holding the corpus (default: in-memory)")
+    parser.add_argument("--stages", default="1,2,4,8,16,32", help="Concurrent annotators per stage")
+    parser.add_argument("--stage-duration", type=float, default=30.0, help="Seconds per stage")
+    parser.add_argument("--think-time", default="0.5,2.0", help="Min,max seconds annotators pause between actions")
+    parser.add_argument("--auto-annotate-ratio", type=float, default=0.2, help="Share of documents auto-annotated")
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--slo-p95-ms", type=float, default=1000.0)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--stop-factor", type=float, default=10.0, help="Stop when p95 exceeds SLO by this factor")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="With --self-host: fake LLM seconds per request")
+    parser.add_argument("--llm-token-latency", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="load_results.json")
+    args = parser.parse_args()
+    args.stages = [int(value) for value in args.stages.split(",")]
+    args.think_time = tuple(float(value) for value in args.think_time.split(","))
+    args.output = os.path.abspath(args.output)
+
+    cleanup = lambda: None
+    if args.self_host:
+        base_url, manifest, cleanup = self_host(args)
+    else:
+        if not args.base_url or not args.manifest:
+            parser.error("--base-url and --manifest are required without --self-host")
+        base_url = args.base_url
+        with open(args.manifest) as f:
+            manifest = json.load(f)
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            stages = asyncio.run(run_load(args, base_url, manifest))
+    finally:
+        cleanup()
+
+    saturation = find_saturation(stages, args)
+    print(f"Saturation: {saturation['reason']} (max sustainable annotators: {saturation['max_sustainable_users']})")
+    report = {
+        "benchmark": "load_test",
+        "metadata": run_metadata(
+            base_url=base_url, self_host=args.self_host, stages=args.stages, stage_duration=args.stage_duration,
+            think_time=args.think_time, auto_annotate_ratio=args.auto_annotate_ratio, slo_p95_ms=args.slo_p95_ms,
+        ),
+        "stages": stages,
+        "saturation": saturation,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
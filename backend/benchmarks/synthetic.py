@@ -0,0 +1,83 @@
+"""Synthetic documents shaped like the records stored in the documents collection."""
+import random
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+WORDS = (
+    "the invoice was issued by our office in Singapore to the customer on behalf of "
+    "international business park strategy forum shopping mall orchard road payment "
+    "due within thirty days please contact support regarding shipment order number "
+    "reference account balance delivery address telephone agreement contract signed"
+).split()
+
+ENTITY_CLASSES = [
+    {"name": "Address", "color": "#e57373", "description": "Postal addresses"},
+    {"name": "Organization", "color": "#64b5f6", "description": "Company names"},
+    {"name": "Person", "color": "#81c784", "description": "People"},
+    {"name": "DateTimes", "color": "#ffb74d", "description": "Dates and times"},
+    {"name": "TelephoneNumbers", "color": "#ba68c8", "description": "Phone numbers"},
+]
+
+# Approximate text sizes (in characters) seen in typical projects
+DOCUMENT_SIZES = {
+    "small": 2_000,
+    "medium": 20_000,
+    "large": 200_000,
+}
+
+
+def make_text(n_chars: int, rng: random.Random) -> str:
+    words = []
+    length = 0
+    while length < n_chars:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+        if rng.random() < 0.08:
+            words[-1] += "."
+        if rng.random() < 0.02:
+            words[-1] += "\n"
+    return " ".join(words)[:n_chars]
+
+
+def make_annotations(text: str, rng: random.Random, density: float = 0.02, entity_classes=ENTITY_CLASSES):
+    """Create non-overlapping spans on word boundaries, roughly `density` spans per character / 10."""
+    annotations = []
+    n_spans = max(1, int(len(text) * density / 10))
+    cursor = 0
+    step = max(1, len(text) // n_spans)
+    for _ in range(n_spans):
+        start = text.find(" ", cursor) + 1
+        if start <= 0 or start >= len(text):
+            break
+        end = text.find(" ", start + rng.randint(3, 25))
+        if end == -1:
+            end = len(text)
+        entity = rng.choice(entity_classes)["name"]
+        annotations.append({
+            "start_index": start,
+            "end_index": end,
+            "entity": entity,
+            "text": text[start:end],
+        })
+        cursor = max(end, start + step)
+    return annotations
+
+
+def make_document(project_id: str, n_chars: int, rng: random.Random, density: float = 0.02, status: str = None):
+    """Build a raw documents-collection record (including `_id` and datetimes)."""
+    text = make_text(n_chars, rng)
+    created = datetime(2024, 1, 1) + timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+    annotations = make_annotations(text, rng, density)
+    return {
+        "_id": ObjectId(),
+        "text": text,
+        "project_id": project_id,
+        "filename": f"doc_{rng.randint(0, 10**9)}.txt",
+        "created_at": created,
+        "updated_at": created + timedelta(minutes=rng.randint(0, 600)),
+        "annotations": annotations,
+        "entities": [],
+        "status": status or rng.choice(["pending", "in_progress", "completed"]),
+    }
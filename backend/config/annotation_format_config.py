@@ -0,0 +1,10 @@
+"""Configuration for the compact (columnar) annotation format."""
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Documents with at least this many spans are stored compactly (parallel offset
+# and entity-index arrays instead of one object per span); 0 keeps every
+# document in the plain format. Reads and the API are the same either way
+COMPACT_ANNOTATIONS_MIN_SPANS = int(os.getenv("COMPACT_ANNOTATIONS_MIN_SPANS", "0"))
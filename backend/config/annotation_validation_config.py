@@ -0,0 +1,13 @@
+"""Configuration for validating annotations when documents are saved."""
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Spans outside the text, empty, or whose text is not the document's text at
+# their offsets: "reject" fails the save with 400, "drop" saves the others
+ANNOTATION_INVALID_SPANS = os.getenv("ANNOTATION_INVALID_SPANS", "reject")
+
+# Spans overlapping an earlier span: "allow" (nested and overlapping entities),
+# "reject" fails the save with 400, "drop" keeps the span that starts first
+ANNOTATION_OVERLAPS = os.getenv("ANNOTATION_OVERLAPS", "allow")
@@ -29,4 +29,28 @@ AUTO_ANNOTATE_NER_PROMPT_2 = os.getenv(
 Input
 
 """
-)
\ No newline at end of file
+)
+# Local pre-annotation (regex recognizers and a gazetteer of confirmed spans) before the LLM
+LOCAL_PREANNOTATION_ENABLED = os.getenv("LOCAL_PREANNOTATION_ENABLED", "True") == "True"
+
+# A confirmed span enters the gazetteer once it was labelled this many times with the same class
+GAZETTEER_MIN_COUNT = int(os.getenv("GAZETTEER_MIN_COUNT", "2"))
+
+# Shorter gazetteer terms are ignored (too ambiguous)
+GAZETTEER_MIN_LENGTH = int(os.getenv("GAZETTEER_MIN_LENGTH", "3"))
+
+# Most frequent terms kept per project
+GAZETTEER_MAX_TERMS = int(os.getenv("GAZETTEER_MAX_TERMS", "20000"))
+
+# Seconds a project's gazetteer is reused before it is rebuilt from its documents
+GAZETTEER_TTL_SECONDS = int(os.getenv("GAZETTEER_TTL_SECONDS", "300"))
+
+# Project gazetteers kept per worker; the least recently used is dropped above this
+GAZETTEER_CACHE_SIZE = int(os.getenv("GAZETTEER_CACHE_SIZE", "64"))
+
+# Packed prompts (POST /api/auto/auto_annotate_ner/batch): several short documents per LLM call.
+# Estimated prompt tokens per call (about 4 characters per token) and documents per call
+AUTO_ANNOTATE_BATCH_MAX_PROMPT_TOKENS = int(os.getenv("AUTO_ANNOTATE_BATCH_MAX_PROMPT_TOKENS", "2048"))
+AUTO_ANNOTATE_BATCH_MAX_DOCUMENTS = int(os.getenv("AUTO_ANNOTATE_BATCH_MAX_DOCUMENTS", "20"))
+# Most documents one batch request may contain
+AUTO_ANNOTATE_BATCH_MAX_REQUEST = int(os.getenv("AUTO_ANNOTATE_BATCH_MAX_REQUEST", "500"))
@@ -0,0 +1,18 @@
+"""Configuration for real-time collaborative annotation (WebSocket sync and presence)."""
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# How often each worker checks MongoDB for changes and presence from other workers (seconds)
+COLLAB_POLL_INTERVAL = float(os.getenv("COLLAB_POLL_INTERVAL", "0.5"))
+
+# Seconds a connection counts as present without a heartbeat (refreshed while it is open)
+COLLAB_PRESENCE_TTL = float(os.getenv("COLLAB_PRESENCE_TTL", "30"))
+
+# Seconds operations stay in the log. A client further behind than the log reaches
+# gets the document's annotations instead of the missed operations
+COLLAB_OP_LOG_TTL = int(os.getenv("COLLAB_OP_LOG_TTL", str(24 * 3600)))
+
+# Most operations accepted in one message
+COLLAB_MAX_OPS_PER_MESSAGE = int(os.getenv("COLLAB_MAX_OPS_PER_MESSAGE", "500"))
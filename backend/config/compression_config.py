@@ -0,0 +1,29 @@
+"""Configuration for HTTP response compression."""
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Set to False to disable response compression entirely
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "True") == "True"
+
+# Responses smaller than this (in bytes) are sent uncompressed
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+
+# gzip level (1-9). 6 is a good size/CPU trade-off for JSON payloads
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+
+# brotli quality (0-11). Levels above 5 get expensive quickly for dynamic responses
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+# Content types that are already compressed and should be passed through untouched
+COMPRESSION_EXCLUDED_CONTENT_TYPES = (
+    "image/",
+    "video/",
+    "audio/",
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/octet-stream",
+    "application/vnd.apache.parquet",
+)
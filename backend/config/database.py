@@ -1,6 +1,8 @@
 import os
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING, TEXT
+from utils.mongo_monitoring import CommandMetricsListener
+from config.collaboration_config import COLLAB_OP_LOG_TTL
 
 load_dotenv()
 
@@ -9,11 +11,95 @@ DB_NAME = os.getenv("MONGODB_DB_NAME")
 COLLECTION_NAME = os.getenv("MONGODB_COLLECTION")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin")  # Default admin password
 
+# Language used by the full-text index for stemming and stop words ("none" disables both)
+SEARCH_LANGUAGE = os.getenv("SEARCH_LANGUAGE", "english")
+
+# Commands slower than this (in milliseconds) are logged with their redacted filter shape
+MONGO_SLOW_QUERY_MS = float(os.getenv("MONGO_SLOW_QUERY_MS", "100"))
+
+# Background deletion: documents removed per batch, pause between batches, and
+# the most document IDs a single bulk delete request may name
+DELETE_BATCH_SIZE = int(os.getenv("DELETE_BATCH_SIZE", "1000"))
+DELETE_BATCH_PAUSE_MS = float(os.getenv("DELETE_BATCH_PAUSE_MS", "50"))
+BULK_DELETE_MAX_IDS = int(os.getenv("BULK_DELETE_MAX_IDS", "1000"))
+
+# Records per-command latency for /api/metrics and the slow-query report
+command_listener = CommandMetricsListener(slow_ms=MONGO_SLOW_QUERY_MS)
+
 # Create a new client and connect to the server
-client = MongoClient(MONGODB_URL)
+client = MongoClient(MONGODB_URL, event_listeners=[command_listener])
 db = client[DB_NAME]
 
 # Collections
 users_collection = db["users"]
 documents_collection = db[COLLECTION_NAME]
 projects_collection = db["projects"]
+llm_usage_collection = db["llm_usage"]
+# One row per annotation span, kept in sync with documents (see utils/annotation_index.py)
+annotations_collection = db["annotations"]
+# One counters record per project, kept in sync with documents (see utils/project_stats.py)
+project_stats_collection = db["project_stats"]
+# Progress of background cascade deletes (see utils/deletion.py)
+deletion_jobs_collection = db["deletion_jobs"]
+# Leases and short-lived results of coalesced LLM generations (see utils/single_flight.py)
+llm_inflight_collection = db["llm_inflight"]
+# Versioned log of annotation changes, and who is connected to which document
+# (see utils/annotation_ops.py and utils/collaboration.py)
+annotation_ops_collection = db["annotation_ops"]
+presence_collection = db["presence"]
+# Token offsets per document and tokenizer for token-level exports (see utils/token_cache.py)
+document_tokens_collection = db["document_tokens"]
+
+
+def ensure_indexes():
+    """
+    Create the indexes the API relies on. Safe to call on every startup:
+    MongoDB skips indexes that already exist with the same definition.
+    A failing index (e.g. a conflicting definition) is reported and skipped.
+    """
+    indexes = [
+        # Document list pages: filter by project, newest first
+        (documents_collection, [("project_id", ASCENDING), ("created_at", DESCENDING)],
+         {"name": "project_created_at"}),
+        # Full-text search over text and filenames; the project_id prefix keeps
+        # every search scoped to one project instead of the whole collection
+        (documents_collection, [("project_id", ASCENDING), ("text", TEXT), ("filename", TEXT)],
+         {"name": "project_text_search", "weights": {"filename": 5, "text": 1}, "default_language": SEARCH_LANGUAGE}),
+        (projects_collection, [("user_id", ASCENDING)], {"name": "user_id"}),
+        # Span queries by class and text, and by text alone, in stable page order
+        (annotations_collection,
+         [("project_id", ASCENDING), ("entity", ASCENDING), ("norm_text", ASCENDING),
+          ("document_id", ASCENDING), ("start_index", ASCENDING)],
+         {"name": "project_entity_text"}),
+        (annotations_collection,
+         [("project_id", ASCENDING), ("norm_text", ASCENDING), ("document_id", ASCENDING), ("start_index", ASCENDING)],
+         {"name": "project_text"}),
+        (annotations_collection, [("document_id", ASCENDING)], {"name": "document_id"}),
+        (project_stats_collection, [("project_id", ASCENDING)], {"name": "project_id", "unique": True}),
+        # Soft-deleted documents waiting for the background purge
+        (documents_collection, [("project_id", ASCENDING), ("deleted_at", ASCENDING)],
+         {"name": "project_deleted_at", "partialFilterExpression": {"deleted_at": {"$type": "date"}}}),
+        (deletion_jobs_collection, [("status", ASCENDING), ("lease_until", ASCENDING)], {"name": "status_lease"}),
+        # Stale leases and shared results disappear a minute after they lapse
+        (llm_inflight_collection, [("lease_until", ASCENDING)], {"name": "lease_ttl", "expireAfterSeconds": 60}),
+        (llm_usage_collection, [("project_id", ASCENDING), ("created_at", DESCENDING)],
+         {"name": "project_created_at"}),
+        # One log entry per document version; operations since a version in order
+        (annotation_ops_collection, [("document_id", ASCENDING), ("version", ASCENDING)],
+         {"name": "document_version", "unique": True}),
+        # New entries of the projects a worker has connections for
+        (annotation_ops_collection, [("project_id", ASCENDING), ("created_at", ASCENDING)],
+         {"name": "project_created_at"}),
+        (annotation_ops_collection, [("created_at", ASCENDING)],
+         {"name": "created_at_ttl", "expireAfterSeconds": COLLAB_OP_LOG_TTL}),
+        (presence_collection, [("project_id", ASCENDING)], {"name": "project_id"}),
+        (presence_collection, [("expires_at", ASCENDING)], {"name": "expires_at_ttl", "expireAfterSeconds": 0}),
+        (document_tokens_collection, [("document_id", ASCENDING), ("tokenizer", ASCENDING)],
+         {"name": "document_tokenizer", "unique": True}),
+        (document_tokens_collection, [("project_id", ASCENDING)], {"name": "project_id"}),
+    ]
+    for collection, keys, options in indexes:
+        try:
+            collection.create_index(keys, **options)
+        except Exception as e:
+            print(f"Error creating index {options['name']} on {collection.name}: {str(e)}")
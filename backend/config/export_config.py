@@ -0,0 +1,28 @@
+"""Configuration for training-data exports."""
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Tokenizers token-level exports may use: "words" (built in) and Hugging Face
+# tokenizer names. Only these are loaded, and their token offsets are cached
+# per document (see utils/token_cache.py)
+EXPORT_TOKENIZERS = [name.strip() for name in os.getenv("EXPORT_TOKENIZERS", "words,bert-base-uncased").split(",") if name.strip()]
+
+# Documents read, tokenized and written per batch by exports
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "200"))
+
+# Export files; snapshots are kept in EXPORT_ROOT/snapshots (see utils/export_snapshots.py)
+EXPORT_ROOT = os.getenv("EXPORT_ROOT", "exports")
+EXPORT_SNAPSHOT_ROOT = os.path.join(EXPORT_ROOT, "snapshots")
+
+# Disk budget of export snapshots; the least recently served are removed above it
+EXPORT_SNAPSHOT_MAX_BYTES = int(os.getenv("EXPORT_SNAPSHOT_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+# Default train/dev/test fractions of dataset exports, and the seed of the
+# assignment: the same seed puts a document in the same split in every export
+EXPORT_SPLITS = os.getenv("EXPORT_SPLITS", "0.8,0.1,0.1")
+EXPORT_SPLIT_SEED = int(os.getenv("EXPORT_SPLIT_SEED", "42"))
+
+# Parquet codec ("zstd", "snappy", "gzip" or "none")
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
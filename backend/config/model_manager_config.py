@@ -1,4 +1,5 @@
 import os
+import json
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -21,3 +22,94 @@ else:
 # Ollama Configuration
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "deepseek-r1:14b")  # Default model for Ollama
 OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://localhost:11434")  # Default Ollama API endpoint
+
+# How long Ollama keeps a model loaded after its last request: a duration ("30m"),
+# seconds, or -1 to never unload it. Sent with every generation; Ollama's own default is 5m.
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+if OLLAMA_KEEP_ALIVE.lstrip("-").isdigit():
+    OLLAMA_KEEP_ALIVE = int(OLLAMA_KEEP_ALIVE)
+# Load the models of the Ollama backends at startup, and again whenever a probe
+# finds one unloaded, so no annotator waits for a cold start
+OLLAMA_WARMUP_ON_STARTUP = os.getenv("OLLAMA_WARMUP_ON_STARTUP", "True") == "True"
+# Seconds between health and residency probes of the Ollama servers, and the timeout of one probe
+OLLAMA_PROBE_INTERVAL = float(os.getenv("OLLAMA_PROBE_INTERVAL", "60"))
+OLLAMA_PROBE_TIMEOUT = float(os.getenv("OLLAMA_PROBE_TIMEOUT", "5"))
+
+# Backends the LLM router can send generations to, as a JSON list of
+#   {"name": "gpu-1", "type": "ollama" | "openai", "model": "...", "url": "...",
+#    "api_key": "...", "max_concurrency": 2, "requests_per_minute": 0,
+#    "burst": 2, "fallback": ["openai"], "keep_alive": "30m", "warm_up": true}
+# `url` is the Ollama endpoint or an OpenAI-compatible base URL; requests_per_minute 0
+# means no rate limit; `fallback` lists backends to use when this one is overloaded or down.
+# `keep_alive` and `warm_up` (Ollama only) override OLLAMA_KEEP_ALIVE and OLLAMA_WARMUP_ON_STARTUP.
+# Without it, one "ollama" and one "openai" backend are built from the settings above.
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "2"))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+OPENAI_REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "500"))
+# Backend used when the default one is overloaded or down (e.g. "openai"); none by default
+# so local-only setups never send text to a hosted API
+LLM_FALLBACK_BACKEND = os.getenv("LLM_FALLBACK_BACKEND") or None
+
+DEFAULT_LLM_BACKENDS = [
+    {
+        "name": "ollama",
+        "type": "ollama",
+        "model": OLLAMA_MODEL,
+        "url": OLLAMA_API_URL,
+        "max_concurrency": OLLAMA_MAX_CONCURRENCY,
+        "requests_per_minute": 0,
+    },
+    {
+        "name": "openai",
+        "type": "openai",
+        "model": OPENAI_MODEL,
+        "api_key": OPENAI_API_KEY,
+        "max_concurrency": OPENAI_MAX_CONCURRENCY,
+        "requests_per_minute": OPENAI_REQUESTS_PER_MINUTE,
+    },
+]
+LLM_BACKENDS = json.loads(os.getenv("LLM_BACKENDS", "null")) or DEFAULT_LLM_BACKENDS
+
+# Backend for projects that do not select one
+LLM_DEFAULT_BACKEND = os.getenv("LLM_DEFAULT_BACKEND") or ("ollama" if USE_LOCAL_LLM else "openai")
+if LLM_FALLBACK_BACKEND:
+    for backend in LLM_BACKENDS:
+        if backend["name"] == LLM_DEFAULT_BACKEND:
+            backend.setdefault("fallback", [LLM_FALLBACK_BACKEND])
+
+# Retries of 429/5xx/connection errors, with exponential backoff and full jitter
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "20"))
+# Seconds to wait for a free slot or rate-limit token before a backend counts as overloaded
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+# Seconds before an Ollama generation is abandoned
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "600"))
+# Consecutive failures that open a backend's circuit, and how long it stays open
+LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "5"))
+LLM_CIRCUIT_RESET_SECONDS = float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", "30"))
+
+# Identical concurrent generations (same backend, model and prompt) share one
+# LLM call, within a worker and across workers through a lease in MongoDB
+LLM_COALESCE_ENABLED = os.getenv("LLM_COALESCE_ENABLED", "True") == "True"
+# Seconds a leader's lease lasts without renewal (it is renewed while the call runs)
+LLM_COALESCE_LEASE_SECONDS = float(os.getenv("LLM_COALESCE_LEASE_SECONDS", "30"))
+# How often workers waiting on another worker's call check for its result
+LLM_COALESCE_POLL_INTERVAL = float(os.getenv("LLM_COALESCE_POLL_INTERVAL", "0.25"))
+# Seconds a finished result stays readable for workers that were still waiting
+LLM_COALESCE_RESULT_TTL = float(os.getenv("LLM_COALESCE_RESULT_TTL", "10"))
+
+# Heavy dependencies (openai, transformers) are imported on first use. Modules listed
+# here (comma-separated, e.g. "openai,transformers") are imported in the background
+# at startup instead, trading worker memory for a fast first request.
+PRELOAD_MODULES = [name.strip() for name in os.getenv("PRELOAD_MODULES", "").split(",") if name.strip()]
+
+# LLM pricing in USD per 1M tokens as {"model": [prompt_price, completion_price]}.
+# Used for the per-project cost report; models not listed (e.g. local Ollama models) cost 0.
+DEFAULT_LLM_PRICING = {
+    "gpt-4o-mini": [0.15, 0.60],
+    "gpt-4o": [2.50, 10.00],
+    "gpt-3.5-turbo": [0.50, 1.50],
+    "gpt-4": [30.00, 60.00],
+}
+LLM_PRICING = {**DEFAULT_LLM_PRICING, **json.loads(os.getenv("LLM_PRICING", "{}"))}
@@ -0,0 +1,22 @@
+"""Configuration for uploaded files (profile pictures) and how they are served."""
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+UPLOAD_ROOT = "uploads"
+PROFILE_PICTURE_FOLDER = os.path.join(UPLOAD_ROOT, "profile_pictures")
+
+# Larger profile pictures are rejected with 413 while they are being received
+PROFILE_PICTURE_MAX_BYTES = int(os.getenv("PROFILE_PICTURE_MAX_BYTES", str(5 * 1024 * 1024)))
+
+# Square bounding boxes (in pixels) of the generated thumbnails; needs Pillow
+PROFILE_THUMBNAIL_SIZES = tuple(
+    int(size) for size in os.getenv("PROFILE_THUMBNAIL_SIZES", "64,256").split(",") if size.strip()
+)
+
+# Bytes read from the upload and written to disk at a time
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Cache lifetime of content-hashed uploads; their URL changes whenever the content does
+IMMUTABLE_CACHE_MAX_AGE = int(os.getenv("IMMUTABLE_CACHE_MAX_AGE", str(365 * 24 * 3600)))
@@ -1,10 +1,21 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 import os
-from routes import auth, projects, documents, users, model_manager, auto_gen
+from config.compression_config import COMPRESSION_ENABLED
+from utils.compression import CompressionMiddleware
+from utils.serialization import MongoJSONResponse
+from utils.request_metrics import RequestMetricsMiddleware
+from utils.static_files import CachedStaticFiles
+from config.uploads_config import UPLOAD_ROOT, PROFILE_PICTURE_FOLDER
+from config.database import ensure_indexes
+from config.model_manager_config import PRELOAD_MODULES
+from utils.lazy_imports import preload_modules
+from utils.deletion import resume_deletion_jobs
+from routes import auth, projects, documents, users, model_manager, auto_gen, metrics, collaboration
+from utils.collaboration import collaboration_hub
 
-app = FastAPI()
+app = FastAPI(default_response_class=MongoJSONResponse)
 
 # Configure CORS
 app.add_middleware(
@@ -15,11 +26,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large JSON payloads (documents, annotations, exports)
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
+# Outermost so latency and (compressed) response sizes cover the whole stack
+app.add_middleware(RequestMetricsMiddleware)
+
 # Create uploads directory if it doesn't exist
-os.makedirs("uploads/profile_pictures", exist_ok=True)
+os.makedirs(PROFILE_PICTURE_FOLDER, exist_ok=True)
 
-# Mount the uploads directory
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# Mount the uploads directory; content-hashed files are served as immutable
+app.mount("/uploads", CachedStaticFiles(directory=UPLOAD_ROOT), name="uploads")
 
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
@@ -28,6 +46,36 @@ app.include_router(documents.router, prefix="/api/documents", tags=["documents"]
 app.include_router(users.router, prefix="/api/users", tags=["users"])
 app.include_router(model_manager.router, prefix="/api/model", tags=["model"])
 app.include_router(auto_gen.router, prefix="/api/auto", tags=["auto-generation"])
+app.include_router(metrics.router, prefix="/api/metrics", tags=["metrics"])
+app.include_router(collaboration.router, prefix="/api/collab", tags=["collaboration"])
+
+@app.on_event("startup")
+async def create_indexes():
+    ensure_indexes()
+
+@app.on_event("startup")
+async def resume_background_jobs():
+    # Finish background deletes interrupted by a restart
+    resume_deletion_jobs()
+
+@app.on_event("startup")
+async def start_model_manager():
+    # Load the Ollama models in the background; the API serves meanwhile
+    model_manager.ollama_model_manager.start()
+
+@app.on_event("startup")
+async def preload_heavy_modules():
+    # Optional: import lazily loaded dependencies in a thread while the API serves
+    if PRELOAD_MODULES:
+        asyncio.get_running_loop().run_in_executor(None, preload_modules, PRELOAD_MODULES)
+
+@app.on_event("shutdown")
+async def stop_model_manager():
+    await model_manager.ollama_model_manager.stop()
+
+@app.on_event("shutdown")
+async def stop_collaboration():
+    await collaboration_hub.stop()
 
 @app.get("/api/")
 async def read_root():
@@ -8,6 +8,16 @@ class Annotation(BaseModel):
     entity: str
     text: str
 
+class CompactAnnotations(BaseModel):
+    """Annotations as parallel arrays (see utils/compact_annotations.py)."""
+    classes: List[str]
+    start: List[int]
+    end: List[int]
+    entity: List[int]
+    # Spans whose text is not the document's text at their offsets
+    text_index: List[int] = []
+    text: List[Optional[str]] = []
+
 class DocumentBase(BaseModel):
     text: Optional[str] = None
     filename: Optional[str] = None
@@ -19,15 +29,22 @@ class DocumentBase(BaseModel):
 
 class Document(DocumentBase):
     id: str
+    # Incremented by every change to the annotations (see utils/annotation_ops.py)
+    version: int = 0
 
 class DocumentCreate(DocumentBase):
-    pass
+    # Alternative to `annotations` for dense documents
+    annotations_compact: Optional[CompactAnnotations] = None
 
 class DocumentUpdate(BaseModel):
     text: Optional[str] = None
     filename: Optional[str] = None
     status: Optional[str] = None
     annotations: Optional[List[Annotation]] = None
+    # Alternative to `annotations` for dense documents
+    annotations_compact: Optional[CompactAnnotations] = None
+    # Version the edited annotations are based on; a save over newer changes fails with 409
+    base_version: Optional[int] = None
 
     class Config:
         json_encoders = {
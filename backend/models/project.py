@@ -6,11 +6,15 @@ class EntityClass(BaseModel):
     name: str
     color: str
     description: Optional[str] = None
+    # Regular expressions that find this class locally, without the LLM
+    patterns: Optional[List[str]] = None
 
 class ProjectCreate(BaseModel):
     name: str
     description: Optional[str] = None
     entity_classes: List[EntityClass]
+    # Name of the LLM backend used for auto-annotation (default backend if not set)
+    llm_backend: Optional[str] = None
 
 class Project(ProjectCreate):
     id: str
@@ -22,6 +26,7 @@ class ProjectUpdate(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
     entity_classes: Optional[List[EntityClass]] = None
+    llm_backend: Optional[str] = None
 
 class ProjectResponse(Project):
     updated_documents_count: Optional[int] = None
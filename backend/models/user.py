@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, Any
+from typing import Optional, Any, Dict
 from datetime import datetime
 from bson import ObjectId
 from pydantic_core import core_schema
@@ -72,6 +72,8 @@ class UserResponse(BaseModel):
     username: str
     about_me: str = ""
     profile_picture: str = ""
+    # Thumbnail filenames by size in pixels, e.g. {"64": "..._64.jpg"}
+    profile_picture_thumbnails: Dict[str, str] = {}
     created_at: datetime
 
     class Config:
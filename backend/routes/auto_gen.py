@@ -1,15 +1,28 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
+import asyncio
 import json
-from routes.model_manager import chat_with_gpt, chat_with_ollama
-from config.model_manager_config import USE_LOCAL_LLM
-from config.auto_annotate_config import AUTO_ANNOTATE_NER_PROMPT, AUTO_ANNOTATE_NER_PROMPT_2
+from routes.model_manager import llm_router, llm_single_flight
+from config.model_manager_config import LLM_COALESCE_ENABLED
+from config.auto_annotate_config import (
+    AUTO_ANNOTATE_NER_PROMPT,
+    AUTO_ANNOTATE_NER_PROMPT_2,
+    LOCAL_PREANNOTATION_ENABLED,
+    AUTO_ANNOTATE_BATCH_MAX_PROMPT_TOKENS,
+    AUTO_ANNOTATE_BATCH_MAX_DOCUMENTS,
+    AUTO_ANNOTATE_BATCH_MAX_REQUEST
+)
 from models.message import Message
 from auto_gen_tools.json_extractor import extract_json
+from auto_gen_tools.pre_annotator import pre_annotate, overlaps_any
+from auto_gen_tools.batch_prompt import pack_documents, build_batch_prompt, split_batch_reply, pack_overhead_tokens
+from utils.llm_metrics import estimate_tokens, record_llm_avoided, AUTO_ANNOTATE_BATCH_DOCUMENTS
+from utils.single_flight import coalesce_key
 from config.database import projects_collection, documents_collection
 from bson import ObjectId
 from routes.projects import get_ner_classes
+from utils.auth import get_current_user, get_optional_user
 
 router = APIRouter()
 
@@ -17,6 +30,8 @@ class AutoAnnotateNERRequest(BaseModel):
     text: str = Field(..., description="The text to annotate")
     classes: List[str] = Field(..., description="List of entity classes to identify")
     prompt: Optional[str] = Field(None, description="Optional custom prompt for the annotation")
+    project_id: Optional[str] = Field(None, description="Caller's project the text belongs to: its classes, gazetteer and LLM backend are used and the LLM usage is reported for it")
+    use_local: bool = Field(True, description="Run the local pre-annotator (regex recognizers and gazetteer) before the LLM")
 
 class EntityAnnotation(BaseModel):
     text: str = Field(..., description="The extracted entity text")
@@ -24,8 +39,129 @@ class EntityAnnotation(BaseModel):
     start_index: int = Field(..., description="Start index of the entity in the text")
     end_index: int = Field(..., description="End index of the entity in the text")
 
+def prompt_header(prompt: Optional[str]) -> str:
+    if prompt is None or prompt == "" or prompt == "string":
+        return AUTO_ANNOTATE_NER_PROMPT_2
+    return prompt
+
+def load_annotation_project(project_id: Optional[str], current_user: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Entity classes and LLM backend of the project a request is made for.
+
+    Only a project of the requesting user is used: its classes and confirmed
+    spans must not reach anyone else, and nobody else may run up LLM usage
+    reported for it. Anonymous requests get None (and their usage no project).
+    """
+    if not project_id or current_user is None or not ObjectId.is_valid(project_id):
+        return None
+    return projects_collection.find_one(
+        {"_id": ObjectId(project_id), "user_id": str(current_user["_id"]), "deleted_at": None},
+        {"entity_classes": 1, "llm_backend": 1}
+    )
+
+async def generate_reply(backend, messages: List[Message], project_id: Optional[str]) -> Dict[str, Any]:
+    """Reply of the LLM router, shared with identical requests in flight."""
+    async def generate():
+        return await llm_router.generate(messages, project_id=project_id, backend=backend.name)
+
+    if LLM_COALESCE_ENABLED:
+        # Identical requests in flight (e.g. several annotators opening the same document) share one call
+        prompt = "\n".join(message.content for message in messages)
+        return await llm_single_flight.do(coalesce_key(backend.name, backend.model, prompt), generate)
+    return await generate()
+
+def record_local_savings(project_id: Optional[str], model: str, local, saved_prompt_tokens: int, call_avoided: bool) -> None:
+    # Completion tokens the LLM would have spent on the spans found locally
+    saved_completion = estimate_tokens(json.dumps([
+        {"text": span["text"], "entity": span["entity"]} for span in local.annotations
+    ]))
+    if call_avoided or local.annotations or saved_prompt_tokens > 0:
+        record_llm_avoided(project_id, model, saved_prompt_tokens, saved_completion, call_avoided, local.sources)
+
+def align_entities(text: str, entities: List[Dict[str, Any]], local=None) -> List[EntityAnnotation]:
+    """
+    Turn the LLM's {"text", "entity"} items into spans of `text`.
+
+    Spans found by the local pre-annotator win over overlapping LLM spans
+    and come first in the result.
+    """
+    # for each entity, extract the start_index, end_index, text and entity
+    # first sort the entities by length of the text
+    entities = sorted(entities, key=lambda x: len(x['text']))
+    # then for each entity, match the document text with the entity text and get the start_index and end_index
+    annotations = []
+    for entity in entities:
+        start_index = text.find(entity['text'])
+        end_index = start_index + len(entity['text'])
+        # Entities the model made up or reworded are not in the text: no span to annotate
+        if start_index < 0 or not entity['text']:
+            continue
+        if local is not None and overlaps_any(start_index, end_index, local.annotations):
+            continue
+        annotations.append(EntityAnnotation(
+            text=entity['text'],
+            entity=entity['entity'],
+            start_index=start_index,
+            end_index=end_index
+        ))
+    if local is not None:
+        annotations = [EntityAnnotation(**span) for span in local.annotations] + annotations
+    return annotations
+
+def build_single_prompt(text: str, classes: List[str], prompt: Optional[str]) -> str:
+    """Prompt asking for the entities of `classes` in one text."""
+    # formatted_prompt = prompt.format(
+    #     text=request.text,
+    #     classes=", ".join(request.classes)
+    # )
+    # input_text = "The document to be annotated: "+request.text
+    # classes_str ="The classes to be annotated: "+ ", ".join(request.classes)
+    # instructions = "Please identify and extract named entities for the specified classes. Please return the response in JSON format."
+
+    input_text = "Text: "+text
+    classes_str ="Entity Classes: "+ ", ".join(classes)
+    instructions = """
+        Instructions
+                1. Identify and extract only the entities that match the specified classes.
+                2. Ensure each extracted entity is relevant and accurate based on the provided classes.
+                3. Format the result as a JSON array where each item represents an extracted entity.
+        """
+    return prompt_header(prompt) + "\n\n" + input_text + "\n\n" + classes_str + "\n\n" + instructions
+
+async def annotate_with_llm(text: str, formatted_prompt: str, project_id: Optional[str], backend, local=None) -> Dict[str, Any]:
+    """
+    Send one document's prompt to the LLM and align the reply to the text.
+
+    Args:
+        local: Pre-annotation result for the text, already run and recorded by the caller
+    """
+    print(f"Prompt: {formatted_prompt}")
+
+    # Create message for LLM
+    messages = [
+        Message(role="user", content=formatted_prompt)
+    ]
+
+    print(f"USING LLM: {backend.name} ({backend.model})")
+
+    # Get response from LLM (falls back to another backend if this one is overloaded)
+    result = await generate_reply(backend, messages, project_id)
+    response_text = result["response"]
+    print(f"Response from {result['backend']}: {response_text}")
+    print(f"Type of response: {type(response_text)}")
+    
+    try:
+        entities = extract_json(response_text)
+        return {"annotations": align_entities(text, entities, local)}
+       
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to extract JSON: {str(e)}"
+        )
+
 @router.post("/auto_annotate_ner")#, response_model=List[EntityAnnotation])
-async def auto_annotate_ner(request: AutoAnnotateNERRequest):
+async def auto_annotate_ner(request: AutoAnnotateNERRequest, current_user = Depends(get_optional_user)):
     """
     Automatically annotate named entities in the given text using LLM.
     
@@ -33,77 +169,38 @@ async def auto_annotate_ner(request: AutoAnnotateNERRequest):
         text: The text to analyze
         classes: List of entity classes to identify
         prompt: Optional custom prompt (uses default if not provided)
+        project_id: One of the caller's projects; ignored for other projects and anonymous callers
+        use_local: Find what can be found locally first (see auto_gen_tools/pre_annotator.py);
+            classes with a recognizer are not sent to the LLM, and when no class is
+            left the LLM is not called at all
     
     Returns:
         List of identified entities with their positions
     """
     try:
         print('--------------------------')
-        # Prepare the prompt
-        if request.prompt is None or request.prompt == "" or request.prompt == "string":
-            request.prompt = AUTO_ANNOTATE_NER_PROMPT_2
-        prompt =  request.prompt
-        # formatted_prompt = prompt.format(
-        #     text=request.text,
-        #     classes=", ".join(request.classes)
-        # )
-        # input_text = "The document to be annotated: "+request.text
-        # classes_str ="The classes to be annotated: "+ ", ".join(request.classes)
-        # instructions = "Please identify and extract named entities for the specified classes. Please return the response in JSON format."
-
-        input_text = "Text: "+request.text
-        classes_str ="Entity Classes: "+ ", ".join(request.classes)
-        instructions = """
-        Instructions
-                1. Identify and extract only the entities that match the specified classes.
-                2. Ensure each extracted entity is relevant and accurate based on the provided classes.
-                3. Format the result as a JSON array where each item represents an extracted entity.
-        """
-        formatted_prompt = prompt + "\n\n" + input_text + "\n\n" + classes_str + "\n\n" + instructions
-
-        print(f"Prompt: {formatted_prompt}")
-
-        # Create message for LLM
-        messages = [
-            Message(role="user", content=formatted_prompt)
-        ]
-
-        print(f"USING LLM: {USE_LOCAL_LLM}")
-
-        # Get response from LLM
-        if USE_LOCAL_LLM:
-            print(f"Running Ollama...")
-            result = await chat_with_ollama(messages)
-            response_text = result["response"]
-        else:
-            print(f"Running ChatGPT...")
-            response_text = await chat_with_gpt(messages)
-        print(f"Response: {response_text}")
-        print(f"Type of response: {type(response_text)}")
-        
-        try:
-            entities = extract_json(response_text)
-            # for each entity, extract the start_index, end_index, text and entity
-            # first sort the entities by length of the text
-            entities = sorted(entities, key=lambda x: len(x['text']))
-            # then for each entity, match the document text with the entity text and get the start_index and end_index
-            annotations = []
-            for entity in entities:
-                start_index = request.text.find(entity['text'])
-                end_index = start_index + len(entity['text'])
-                annotations.append(EntityAnnotation(
-                    text=entity['text'],
-                    entity=entity['entity'],
-                    start_index=start_index,
-                    end_index=end_index
-                ))
-            return {"annotations": annotations}
-           
-        except Exception as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to extract JSON: {str(e)}"
-            )
+        local = None
+        classes = request.classes
+        project = load_annotation_project(request.project_id, current_user)
+        project_id = str(project["_id"]) if project else None
+        # The project's LLM backend, or the default one
+        backend = llm_router.get(project.get("llm_backend") if project else None)
+        if LOCAL_PREANNOTATION_ENABLED and request.use_local:
+            entity_classes = project.get("entity_classes") if project else None
+            local = pre_annotate(request.text, request.classes, entity_classes, project_id)
+            classes = [name for name in request.classes if name not in local.resolved_classes]
+            print(f"Pre-annotated {len(local.annotations)} spans locally, resolved classes: {local.resolved_classes}")
+
+        formatted_prompt = build_single_prompt(request.text, classes, request.prompt)
+
+        if local is not None:
+            if not classes:
+                record_local_savings(project_id, backend.model, local, estimate_tokens(formatted_prompt), True)
+                return {"annotations": [EntityAnnotation(**span) for span in local.annotations]}
+            saved_prompt = estimate_tokens(", ".join(request.classes)) - estimate_tokens(", ".join(classes))
+            record_local_savings(project_id, backend.model, local, saved_prompt, False)
+
+        return await annotate_with_llm(request.text, formatted_prompt, project_id, backend, local)
         
     except Exception as e:
         raise HTTPException(
@@ -112,7 +209,7 @@ async def auto_annotate_ner(request: AutoAnnotateNERRequest):
         )
 
 @router.post("/project/{project_id}/document/{document_id}/auto_annotate")
-async def auto_annotate_project_document(project_id: str, document_id: str, prompt: Optional[str] = None):
+async def auto_annotate_project_document(project_id: str, document_id: str, prompt: Optional[str] = None, current_user = Depends(get_optional_user)):
     """
     Auto-annotate a document in a project using the project's NER classes.
     
@@ -125,7 +222,8 @@ async def auto_annotate_project_document(project_id: str, document_id: str, prom
         # Get document content
         document = documents_collection.find_one({
             "_id": ObjectId(document_id),
-            "project_id": project_id
+            "project_id": project_id,
+            "deleted_at": None
         })
         if not document:
             raise HTTPException(status_code=404, detail="Document not found")
@@ -146,11 +244,12 @@ async def auto_annotate_project_document(project_id: str, document_id: str, prom
         annotation_request = AutoAnnotateNERRequest(
             text=text,
             classes=classes,
-            prompt=prompt
+            prompt=prompt,
+            project_id=project_id
         )
         
         # Call auto_annotate_ner
-        annotations = await auto_annotate_ner(annotation_request)
+        annotations = await auto_annotate_ner(annotation_request, current_user)
         return annotations
         
     except Exception as e:
@@ -158,3 +257,202 @@ async def auto_annotate_project_document(project_id: str, document_id: str, prom
             status_code=500,
             detail=f"Error auto-annotating document: {str(e)}"
         )
+
+class BatchDocument(BaseModel):
+    id: str = Field(..., description="Caller's ID of the document, returned with its annotations")
+    text: str = Field(..., description="The text to annotate")
+
+class AutoAnnotateNERBatchRequest(BaseModel):
+    documents: List[BatchDocument] = Field(..., description="Short documents to annotate")
+    classes: List[str] = Field(..., description="List of entity classes to identify")
+    prompt: Optional[str] = Field(None, description="Optional custom prompt for the annotation")
+    project_id: Optional[str] = Field(None, description="Caller's project the documents belong to: its classes, gazetteer and LLM backend are used and the LLM usage is reported for it")
+    use_local: bool = Field(True, description="Run the local pre-annotator (regex recognizers and gazetteer) before the LLM")
+    max_prompt_tokens: Optional[int] = Field(None, gt=0, description="Estimated prompt tokens per LLM call")
+    max_documents_per_prompt: Optional[int] = Field(None, gt=0, description="Documents per LLM call")
+
+class ProjectBatchRequest(BaseModel):
+    document_ids: List[str] = Field(..., description="Documents of the project to annotate")
+    prompt: Optional[str] = Field(None, description="Optional custom prompt for the annotation")
+
+async def annotate_documents_packed(
+    documents: List[Tuple[str, str]],
+    classes: List[str],
+    prompt: Optional[str] = None,
+    project: Optional[Dict[str, Any]] = None,
+    use_local: bool = True,
+    max_prompt_tokens: int = AUTO_ANNOTATE_BATCH_MAX_PROMPT_TOKENS,
+    max_documents: int = AUTO_ANNOTATE_BATCH_MAX_DOCUMENTS
+) -> Dict[str, Any]:
+    """
+    Annotate many short documents with as few LLM calls as possible.
+
+    Documents are packed into shared prompts (see auto_gen_tools/batch_prompt.py).
+    A document falls back to its own call when it is too long to share a
+    prompt, when its pack's reply cannot be parsed, or when the reply puts
+    spans in it that it does not contain.
+
+    Args:
+        documents: (id, text) pairs
+        project: load_annotation_project() of the request, if any
+
+    Returns:
+        Per document, in input order: its annotations and how they were made
+        ("packed", "single" or "local"), or an error; plus call counts
+    """
+    if not classes:
+        raise HTTPException(status_code=400, detail="classes must not be empty")
+    project_id = str(project["_id"]) if project else None
+    backend = llm_router.get(project.get("llm_backend") if project else None)
+    header = prompt_header(prompt)
+    texts = dict(documents)
+
+    local = {}
+    remaining = classes
+    if LOCAL_PREANNOTATION_ENABLED and use_local:
+        entity_classes = project.get("entity_classes") if project else None
+        for key, text in documents:
+            local[key] = pre_annotate(text, classes, entity_classes, project_id)
+        # Recognizers depend only on the class names, so every document resolves the same classes
+        resolved = next(iter(local.values())).resolved_classes if local else []
+        remaining = [name for name in classes if name not in resolved]
+
+    results: Dict[str, Dict[str, Any]] = {}
+    if not remaining:
+        for key, text in documents:
+            record_local_savings(project_id, backend.model, local[key], estimate_tokens(text), True)
+            results[key] = {"annotations": align_entities(text, [], local[key]), "mode": "local"}
+        packs, fallback = [], []
+    else:
+        for key in local:
+            record_local_savings(project_id, backend.model, local[key], 0, False)
+        packs, singles = pack_documents(documents, pack_overhead_tokens(header, remaining), max_prompt_tokens, max_documents)
+        fallback = [key for key, _ in singles]
+
+    async def run_pack(pack):
+        messages = [Message(role="user", content=build_batch_prompt(header, remaining, pack))]
+        try:
+            result = await generate_reply(backend, messages, project_id)
+        except HTTPException as e:
+            # The backends are down or overloaded; one call per document would not help
+            for key, _ in pack:
+                results[key] = {"annotations": [], "mode": "packed", "error": e.detail}
+            return
+        try:
+            entities, failed = split_batch_reply(result["response"], pack)
+        except ValueError as e:
+            print(f"Packed reply for {len(pack)} documents could not be parsed, annotating them one by one: {str(e)}")
+            fallback.extend(key for key, _ in pack)
+            return
+        for key, document_entities in entities.items():
+            results[key] = {"annotations": align_entities(texts[key], document_entities, local.get(key)), "mode": "packed"}
+        fallback.extend(failed)
+
+    await asyncio.gather(*(run_pack(pack) for pack in packs))
+
+    async def run_single(key):
+        # Pre-annotation already ran and its savings were recorded above; only the LLM call is left
+        try:
+            single = await annotate_with_llm(
+                texts[key], build_single_prompt(texts[key], remaining, prompt), project_id, backend, local.get(key)
+            )
+            results[key] = {"annotations": single["annotations"], "mode": "single"}
+        except HTTPException as e:
+            results[key] = {"annotations": [], "mode": "single", "error": e.detail}
+        except Exception as e:
+            results[key] = {"annotations": [], "mode": "single", "error": f"Auto-annotation failed: {str(e)}"}
+
+    await asyncio.gather(*(run_single(key) for key in fallback))
+
+    for entry in results.values():
+        AUTO_ANNOTATE_BATCH_DOCUMENTS.inc(mode="error" if "error" in entry else entry["mode"])
+    return {
+        "results": [{"id": key, **results[key]} for key, _ in documents],
+        "llm_calls": len(packs) + len(fallback),
+        "packed_calls": len(packs),
+        "fallback_documents": len(fallback),
+    }
+
+@router.post("/auto_annotate_ner/batch")
+async def auto_annotate_ner_batch(request: AutoAnnotateNERBatchRequest, current_user = Depends(get_optional_user)):
+    """
+    Annotate many short documents (tweets, invoice lines, addresses) by packing
+    several of them into each LLM prompt.
+
+    Args:
+        documents: [{"id", "text"}], at most AUTO_ANNOTATE_BATCH_MAX_REQUEST
+        classes: List of entity classes to identify
+        project_id: One of the caller's projects; ignored for other projects and anonymous callers
+        max_prompt_tokens / max_documents_per_prompt: Override the packing limits
+
+    Returns:
+        {"results": [{"id", "annotations", "mode", ["error"]}], "llm_calls", ...}
+    """
+    if not request.documents:
+        raise HTTPException(status_code=400, detail="No documents provided")
+    if len(request.documents) > AUTO_ANNOTATE_BATCH_MAX_REQUEST:
+        raise HTTPException(status_code=400, detail=f"At most {AUTO_ANNOTATE_BATCH_MAX_REQUEST} documents per request")
+    ids = [document.id for document in request.documents]
+    if len(set(ids)) != len(ids):
+        raise HTTPException(status_code=400, detail="Document IDs must be unique")
+    try:
+        return await annotate_documents_packed(
+            [(document.id, document.text) for document in request.documents],
+            request.classes,
+            request.prompt,
+            load_annotation_project(request.project_id, current_user),
+            request.use_local,
+            request.max_prompt_tokens or AUTO_ANNOTATE_BATCH_MAX_PROMPT_TOKENS,
+            request.max_documents_per_prompt or AUTO_ANNOTATE_BATCH_MAX_DOCUMENTS
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Batch auto-annotation failed: {str(e)}"
+        )
+
+@router.post("/project/{project_id}/auto_annotate_batch")
+async def auto_annotate_project_documents(project_id: str, request: ProjectBatchRequest, current_user = Depends(get_current_user)):
+    """
+    Auto-annotate several documents of a project with packed prompts, using the
+    project's NER classes.
+
+    Args:
+        project_id: ID of the project
+        document_ids: Documents to annotate, at most AUTO_ANNOTATE_BATCH_MAX_REQUEST
+        prompt: Optional custom prompt for annotation
+    """
+    if len(request.document_ids) > AUTO_ANNOTATE_BATCH_MAX_REQUEST:
+        raise HTTPException(status_code=400, detail=f"At most {AUTO_ANNOTATE_BATCH_MAX_REQUEST} documents per request")
+    invalid = [document_id for document_id in request.document_ids if not ObjectId.is_valid(document_id)]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid document IDs: {', '.join(invalid)}")
+    try:
+        project = load_annotation_project(project_id, current_user)
+        if not project:
+            raise HTTPException(status_code=404, detail="Project not found")
+
+        cursor = documents_collection.find({
+            "_id": {"$in": [ObjectId(document_id) for document_id in request.document_ids]},
+            "project_id": project_id,
+            "deleted_at": None
+        }, {"text": 1})
+        documents = [(str(doc["_id"]), doc.get("text", "")) for doc in cursor if doc.get("text")]
+        if not documents:
+            raise HTTPException(status_code=404, detail="No documents with content found")
+
+        ner_data = await get_ner_classes(project_id)
+        if not ner_data.classes:
+            raise HTTPException(status_code=400, detail="No NER classes defined for this project")
+
+        return await annotate_documents_packed(documents, ner_data.classes, request.prompt, project)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error auto-annotating documents: {str(e)}"
+        )
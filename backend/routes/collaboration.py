@@ -0,0 +1,250 @@
+from fastapi import APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from bson import ObjectId
+from typing import Dict, Any, List, Optional
+import json
+from config.collaboration_config import COLLAB_MAX_OPS_PER_MESSAGE
+from config.database import documents_collection, projects_collection
+from utils.auth import get_current_user, user_from_token
+from utils.annotation_ops import OpsError, commit_ops, entry_message, ops_since
+from utils.compact_annotations import document_annotations
+from utils.collaboration import Connection, collaboration_hub
+
+router = APIRouter()
+
+# Close codes for refused WebSocket handshakes (4000-4999 are application defined)
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_NOT_FOUND = 4404
+
+# Largest presence state (cursor, selection, ...) a client may share, as JSON
+MAX_PRESENCE_STATE_CHARS = 2048
+
+class OpsRequest(BaseModel):
+    base_version: int = Field(..., description="Document version the operations are based on")
+    ops: List[Dict[str, Any]] = Field(..., description="add / remove / update operations")
+    client_op_id: Optional[str] = Field(None, description="Echoed back to match the reply")
+
+def _owned_project(project_id: str, user: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if not ObjectId.is_valid(project_id):
+        return None
+    return projects_collection.find_one({
+        "_id": ObjectId(project_id),
+        "user_id": str(user["_id"]),
+        "deleted_at": None
+    })
+
+def _owned_document(document_id: str, user: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if not ObjectId.is_valid(document_id):
+        return None
+    doc = documents_collection.find_one(
+        {"_id": ObjectId(document_id), "deleted_at": None},
+        {"project_id": 1}
+    )
+    if not doc or not _owned_project(doc["project_id"], user):
+        return None
+    return doc
+
+def _catch_up(document_id: str, since: int) -> Dict[str, Any]:
+    """
+    What a client at version `since` missed: the operations since then, or
+    the current annotations when the log no longer has them all.
+    """
+    doc = documents_collection.find_one(
+        {"_id": ObjectId(document_id)},
+        {"version": 1, "text": 1, "annotations": 1, "annotations_compact": 1}
+    )
+    version = doc.get("version") or 0
+    entries = ops_since(document_id, since, version) if 0 <= since <= version else None
+    if entries is None:
+        return {"type": "snapshot", "document_id": document_id, "version": version, "annotations": document_annotations(doc)}
+    return {"type": "sync", "document_id": document_id, "version": version, "entries": [entry_message(e) for e in entries]}
+
+async def _commit(connection: Connection, message: Dict[str, Any]) -> Dict[str, Any]:
+    ops = message.get("ops")
+    base_version = message.get("base_version")
+    if not isinstance(ops, list) or not isinstance(base_version, int):
+        raise OpsError("op messages need a base_version and a list of ops")
+    if len(ops) > COLLAB_MAX_OPS_PER_MESSAGE:
+        raise OpsError(f"At most {COLLAB_MAX_OPS_PER_MESSAGE} ops per message")
+    result = await run_in_threadpool(commit_ops, connection.document_id, ops, base_version, connection.user, connection.id)
+    if result["entry"] is not None:
+        await collaboration_hub.publish(result["entry"])
+    return {
+        "type": "ack",
+        "client_op_id": message.get("client_op_id"),
+        "version": result["version"],
+        "applied": result["applied"],
+        "rejected": result["rejected"],
+    }
+
+async def _handle(connection: Connection, message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Act on one client message; returns the reply, if any."""
+    kind = message.get("type")
+    if kind == "ping":
+        await collaboration_hub.update_presence(connection)
+        return {"type": "pong"}
+    if kind == "presence":
+        state = message.get("state") or {}
+        if not isinstance(state, dict) or len(json.dumps(state)) > MAX_PRESENCE_STATE_CHARS:
+            raise OpsError(f"Presence state must be an object of at most {MAX_PRESENCE_STATE_CHARS} characters")
+        await collaboration_hub.update_presence(connection, state)
+        return None
+    if kind in ("op", "sync") and connection.document_id is None:
+        raise OpsError(f"'{kind}' messages need a document channel")
+    if kind == "op":
+        return await _commit(connection, message)
+    if kind == "sync":
+        since = message.get("since")
+        if not isinstance(since, int):
+            raise OpsError("sync messages need the version to sync from ('since')")
+        return await run_in_threadpool(_catch_up, connection.document_id, since)
+    raise OpsError(f"Unknown message type '{kind}'")
+
+async def _serve(websocket: WebSocket, connection: Connection, greeting) -> None:
+    """
+    Join the rooms, greet the client and answer its messages until it disconnects.
+
+    Args:
+        greeting: Builds the first messages once the connection is in its rooms
+    """
+    await collaboration_hub.join(connection)
+    try:
+        await connection.open(await run_in_threadpool(greeting))
+        while True:
+            raw = await websocket.receive_text()
+            message = None
+            try:
+                message = json.loads(raw)
+                if not isinstance(message, dict):
+                    raise OpsError("Messages must be JSON objects")
+                reply = await _handle(connection, message)
+            except ValueError as e:
+                # Invalid JSON and OpsError are both ValueErrors
+                reply = {"type": "error", "request": message.get("type") if isinstance(message, dict) else None, "detail": str(e)}
+            if reply is not None:
+                await connection.send(reply)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await collaboration_hub.leave(connection)
+
+@router.websocket("/documents/{document_id}")
+async def document_channel(websocket: WebSocket, document_id: str, token: str = "", since: Optional[int] = None):
+    """
+    Real-time channel for one document: annotation operations, their
+    broadcast to the other annotators, and presence.
+
+    Connect with `?token=<access token>`; pass `since=<version>` when
+    reconnecting to receive what was missed instead of re-fetching the
+    document. Messages are JSON objects:
+
+    Client -> server:
+    - {"type": "op", "base_version": 3, "ops": [...], "client_op_id": "..."}
+    - {"type": "sync", "since": 3}
+    - {"type": "presence", "state": {"selection": [10, 15]}}
+    - {"type": "ping"}
+
+    Server -> client:
+    - {"type": "hello", "connection_id", "version", "presence"}, then
+      "sync" / "snapshot" if `since` was given
+    - {"type": "ack", "client_op_id", "version", "applied", "rejected"}:
+      rejected operations say why ("conflict", "missing", "invalid",
+      "overlap", "stale")
+    - {"type": "ops", "version", "ops", "user"} and {"type": "replaced", "version"}
+      (whole annotation list saved; re-fetch) for changes by others
+    - {"type": "presence", "document_id", "users"}
+    - {"type": "error", "detail"}
+    """
+    user = user_from_token(token)
+    if user is None:
+        await websocket.close(code=CLOSE_UNAUTHORIZED)
+        return
+    doc = _owned_document(document_id, user)
+    if doc is None:
+        await websocket.close(code=CLOSE_NOT_FOUND)
+        return
+
+    await websocket.accept()
+    connection = Connection(websocket, user, doc["project_id"], document_id)
+    print(f"User {user.get('username')} joined document {document_id}")
+
+    def greeting() -> List[Dict[str, Any]]:
+        presence = collaboration_hub.presence(connection.project_id).get(document_id, [])
+        current = documents_collection.find_one({"_id": ObjectId(document_id)}, {"version": 1}) or {}
+        messages = [{
+            "type": "hello",
+            "connection_id": connection.id,
+            "document_id": document_id,
+            "version": current.get("version") or 0,
+            "presence": [p for p in presence if p["connection_id"] != connection.id],
+        }]
+        if since is not None:
+            messages.append(_catch_up(document_id, since))
+        return messages
+
+    await _serve(websocket, connection, greeting)
+
+@router.websocket("/projects/{project_id}")
+async def project_channel(websocket: WebSocket, project_id: str, token: str = ""):
+    """
+    Real-time channel for a project: the changes ("ops", "replaced") and
+    presence of all its documents, e.g. for the document list. Accepts
+    "presence" and "ping" messages like the document channel.
+    """
+    user = user_from_token(token)
+    if user is None:
+        await websocket.close(code=CLOSE_UNAUTHORIZED)
+        return
+    if _owned_project(project_id, user) is None:
+        await websocket.close(code=CLOSE_NOT_FOUND)
+        return
+
+    await websocket.accept()
+    connection = Connection(websocket, user, project_id)
+
+    def greeting() -> List[Dict[str, Any]]:
+        return [{
+            "type": "hello",
+            "connection_id": connection.id,
+            "project_id": project_id,
+            "presence": collaboration_hub.presence(project_id),
+        }]
+
+    await _serve(websocket, connection, greeting)
+
+@router.get("/documents/{document_id}/ops")
+async def get_document_ops(document_id: str, since: int, current_user = Depends(get_current_user)):
+    """
+    Changes to a document's annotations since version `since`, for clients
+    without a WebSocket: {"type": "sync", "version", "entries"}, or
+    {"type": "snapshot", "version", "annotations"} when the operation log
+    no longer reaches back that far.
+    """
+    if _owned_document(document_id, current_user) is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return await run_in_threadpool(_catch_up, document_id, since)
+
+@router.post("/documents/{document_id}/ops")
+async def post_document_ops(document_id: str, request: OpsRequest, current_user = Depends(get_current_user)):
+    """
+    Apply annotation operations over HTTP; the reply is the same "ack" the
+    WebSocket channel sends, and connected collaborators receive the change.
+    """
+    if _owned_document(document_id, current_user) is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if len(request.ops) > COLLAB_MAX_OPS_PER_MESSAGE:
+        raise HTTPException(status_code=400, detail=f"At most {COLLAB_MAX_OPS_PER_MESSAGE} ops per request")
+    try:
+        result = await run_in_threadpool(commit_ops, document_id, request.ops, request.base_version, current_user)
+    except OpsError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if result["entry"] is not None:
+        await collaboration_hub.publish(result["entry"])
+    return {
+        "type": "ack",
+        "client_op_id": request.client_op_id,
+        "version": result["version"],
+        "applied": result["applied"],
+        "rejected": result["rejected"],
+    }
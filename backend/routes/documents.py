@@ -1,16 +1,64 @@
 from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, Request
+from fastapi.encoders import jsonable_encoder
 from models.document import DocumentCreate, Document, DocumentUpdate
 from utils.auth import get_current_user
-from config.database import documents_collection, projects_collection
+from config.database import documents_collection, projects_collection, annotations_collection, BULK_DELETE_MAX_IDS
+from utils.serialization import MongoJSONResponse, document_to_dict
+from utils.search import parse_search_terms, build_highlight_pattern, build_snippet, find_highlights
+from utils.annotation_index import (
+    sync_document_annotations,
+    remove_document_annotations,
+    rebuild_project_annotations,
+    build_span_filter
+)
+from utils.project_stats import apply_document_changes, apply_document_update, get_project_counters
+from utils.deletion import create_deletion_job, start_deletion_job
+from utils.token_cache import remove_document_tokens
+from utils.export_snapshots import get_snapshot, project_watermark, snapshot_response
+from routes.projects import project_export_builder
+from utils.dataset_import import PARSERS, IMPORT_FORMATS, decoded_lines, import_records
+from utils.annotation_ops import record_replace, version_filter
+from utils.collaboration import collaboration_hub
+from utils.annotation_validation import AnnotationError, normalize_annotations
+from utils.compact_annotations import (
+    ANNOTATION_FORMATS,
+    decode,
+    document_annotations,
+    project_class_names,
+    storage_fields,
+    unset_fields
+)
+from starlette.concurrency import run_in_threadpool
 from bson import ObjectId
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import json
+import codecs
 
 
 
 router = APIRouter()
 
+def validate_annotation_format(annotation_format: str) -> None:
+    if annotation_format not in ANNOTATION_FORMATS:
+        raise HTTPException(status_code=400, detail=f"annotation_format must be one of {', '.join(ANNOTATION_FORMATS)}")
+
+def decode_compact_annotations(compact, text: str) -> List[Dict[str, Any]]:
+    try:
+        return decode(compact.model_dump(), text)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid annotations_compact: {str(e)}")
+
+def validate_annotations(annotations: List[Dict[str, Any]], text: str) -> List[Dict[str, Any]]:
+    """Annotations checked and normalized for saving (see utils/annotation_validation.py)."""
+    try:
+        normalized, removed = normalize_annotations(annotations, text)
+    except AnnotationError as e:
+        raise HTTPException(status_code=400, detail={"message": str(e), "issues": e.issues})
+    if removed:
+        print(f"Normalized {len(annotations)} annotations, removed: {removed}")
+    return normalized
+
 @router.post("/", response_model=Document)
 async def create_document(document: DocumentCreate, current_user = Depends(get_current_user)):
     print(f"Creating document for project {document.project_id}")
@@ -18,14 +66,19 @@ async def create_document(document: DocumentCreate, current_user = Depends(get_c
         # Verify project exists and belongs to user
         project = projects_collection.find_one({
             "_id": ObjectId(document.project_id),
-            "user_id": str(current_user["_id"])
+            "user_id": str(current_user["_id"]),
+            "deleted_at": None
         })
         if not project:
             raise HTTPException(status_code=404, detail="Project not found")
         
         # Convert annotations to dictionaries
-        annotations_dicts = [annotation.dict() for annotation in document.annotations] if document.annotations else []
-        print(f"Annotations dicts: {annotations_dicts}")
+        if document.annotations_compact is not None:
+            annotations_dicts = decode_compact_annotations(document.annotations_compact, document.text or "")
+        else:
+            annotations_dicts = [annotation.dict() for annotation in document.annotations] if document.annotations else []
+        annotations_dicts = validate_annotations(annotations_dicts, document.text or "")
+        print(f"Annotations: {len(annotations_dicts)}")
         # Create document dictionary
         doc_dict = {
             "text": document.text,
@@ -33,17 +86,21 @@ async def create_document(document: DocumentCreate, current_user = Depends(get_c
             "filename": document.filename or "untitled.txt",
             "created_at": datetime.utcnow(),
             "updated_at": datetime.utcnow(),
-            "annotations": annotations_dicts,
+            **storage_fields(annotations_dicts, document.text or "", project_class_names(project)),
             "status": document.status
         }
         
-        print(f"Inserting document: {doc_dict}")
+        print(f"Inserting document: {doc_dict['filename']}")
         result = documents_collection.insert_one(doc_dict)
-        doc_dict["id"] = str(result.inserted_id)
+        if annotations_dicts:
+            sync_document_annotations(result.inserted_id, doc_dict["project_id"], annotations_dicts)
+        apply_document_changes(doc_dict["project_id"], added=[doc_dict])
         
-        print(f"Successfully created document with ID: {doc_dict['id']}")
-        return Document(**doc_dict)
+        print(f"Successfully created document with ID: {result.inserted_id}")
+        return MongoJSONResponse(document_to_dict(doc_dict))
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error creating document: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error creating document: {str(e)}")
@@ -60,7 +117,8 @@ async def upload_document(
         # Verify project exists and belongs to user
         project = projects_collection.find_one({
             "_id": ObjectId(project_id),
-            "user_id": str(current_user["_id"])
+            "user_id": str(current_user["_id"]),
+            "deleted_at": None
         })
         if not project:
             print(f"Project not found. Project ID: {project_id}, User ID: {current_user['_id']}")
@@ -94,10 +152,9 @@ async def upload_document(
                 }
                 
                 print(f"Inserting document with filename: {file.filename}")
-                result = documents_collection.insert_one(doc_dict)
-                doc_dict["id"] = str(result.inserted_id)
+                documents_collection.insert_one(doc_dict)
                 
-                uploaded_documents.append(Document(**doc_dict))
+                uploaded_documents.append(doc_dict)
                 print(f"Successfully uploaded document: {file.filename}")
                 
             except UnicodeDecodeError as e:
@@ -113,19 +170,20 @@ async def upload_document(
                     "error": str(e)
                 })
             
+        apply_document_changes(project_id, added=uploaded_documents)
         response = {
             "success": True,
             "uploaded_count": len(uploaded_documents),
-            "uploaded_documents": uploaded_documents,
+            "uploaded_documents": [document_to_dict(doc) for doc in uploaded_documents],
             "failed_count": len(failed_documents),
             "failed_documents": failed_documents
         }
         
         if len(failed_documents) > 0 and len(uploaded_documents) == 0:
             # If all files failed, return a 400 status
-            raise HTTPException(status_code=400, detail=response)
+            raise HTTPException(status_code=400, detail=jsonable_encoder(response))
             
-        return response
+        return MongoJSONResponse(response)
             
     except Exception as e:
         print(f"Error in upload process: {str(e)}")
@@ -136,14 +194,69 @@ async def upload_document(
             detail=f"Error uploading documents: {str(e)}"
         )
 
+@router.post("/import")
+async def import_documents(
+    project_id: str = Form(...),
+    format: str = Form(...),
+    file: UploadFile = File(...),
+    skip_unknown_entities: bool = Form(False),
+    encoding: str = Form("utf-8"),
+    current_user = Depends(get_current_user)
+):
+    """
+    Import a pre-annotated dataset into a project.
+
+    The file is parsed line by line (see utils/dataset_import.py for the
+    jsonl, spans and conll formats) and inserted in batches, so large files
+    are never held in memory.
+
+    Args:
+        skip_unknown_entities: Drop spans whose class is not one of the
+            project's entity classes instead of rejecting the document
+
+    Returns:
+        imported_count, failed_count, per-line errors and docs_per_second
+    """
+    if format not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(IMPORT_FORMATS)}")
+
+    project = projects_collection.find_one({
+        "_id": ObjectId(project_id),
+        "user_id": str(current_user["_id"]),
+        "deleted_at": None
+    })
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    print(f"Importing {file.filename} ({format}) into project {project_id}")
+    try:
+        codecs.lookup(encoding)
+    except LookupError as e:
+        raise HTTPException(status_code=400, detail=f"Unable to decode file: {str(e)}")
+    try:
+        # Undecodable bytes fail their line in the report instead of the whole import
+        lines = decoded_lines(file.file, "utf-8-sig" if encoding.lower() in ("utf-8", "utf8") else encoding, "surrogateescape")
+        # Parsing and inserting are blocking; keep them off the event loop
+        report = await run_in_threadpool(
+            import_records, project, PARSERS[format](lines), file.filename or "import", skip_unknown_entities
+        )
+    except Exception as e:
+        print(f"Error importing documents: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error importing documents: {str(e)}")
+
+    print(f"Imported {report['imported_count']} documents ({report['docs_per_second']} docs/s), {report['failed_count']} failed")
+    return {"format": format, **report}
+
 @router.get("/project/{project_id}", response_model=Dict[str, Any])
 async def get_project_documents(
     project_id: str,
     current_user = Depends(get_current_user),
     page: int = 1,
     docsPerPage: int = 100,  # Default limit of 100, but can be overridden by client
-    searchQuery: str = ""
+    searchQuery: str = "",
+    annotation_format: str = "full"
 ):
+    validate_annotation_format(annotation_format)
     print(f"searchQuery: {searchQuery}")
     print(f"type searchQuery: {type(searchQuery)}")
     skip = (page - 1) * docsPerPage
@@ -153,7 +266,8 @@ async def get_project_documents(
         # Verify project exists and belongs to user
         project = projects_collection.find_one({
             "_id": ObjectId(project_id),
-            "user_id": str(current_user["_id"])
+            "user_id": str(current_user["_id"]),
+            "deleted_at": None
         })
         if not project:
             raise HTTPException(status_code=404, detail="Project not found")
@@ -164,102 +278,199 @@ async def get_project_documents(
 
         
         print(f"Looking for documents with project_id: {project_id_str}")
-        mongo_filter = {"project_id": project_id_str}
+        mongo_filter = {"project_id": project_id_str, "deleted_at": None}
 
         if searchQuery:
             try:
                 query_dict = json.loads(searchQuery)  # convert the JSON string to a dictionary
-                mongo_filter.update(query_dict)  # update the mongo_ilter (project_id) with the searched query
+                # the searched query may not widen the project scope or bring back deleted documents
+                mongo_filter = {**query_dict, **mongo_filter}
             except json.JSONDecodeError:
                 raise HTTPException(status_code=400, detail="Invalid query format")
 
         
-        # First get total count
-        total_count = documents_collection.count_documents(mongo_filter)
+        # First get total count; without a filter it comes from the project counters
+        if searchQuery:
+            total_count = documents_collection.count_documents(mongo_filter)
+        else:
+            total_count = get_project_counters(project_id_str)["documents"]
         print(f"Total documents in project: {total_count}")
 
         
         # Get all documents for this project
         cursor = documents_collection.find(mongo_filter).sort("created_at", -1).skip(skip).limit(docsPerPage)
         
-        # Convert documents to list and process them
-        documents = []
-        for doc in cursor:
-            try:
-                # Convert _id to string id
-                doc["id"] = str(doc.pop("_id"))
-                
-                # Ensure all required fields exist with defaults
-                doc.setdefault("text", "")
-                doc.setdefault("filename", f"document_{doc['id']}.txt")
-                doc.setdefault("project_id", project_id_str)
-                doc.setdefault("status", "pending")
-                doc.setdefault("annotations", [])
-                
-                # Convert datetime objects to strings
-                if isinstance(doc.get("created_at"), datetime):
-                    doc["created_at"] = doc["created_at"].isoformat()
-                if isinstance(doc.get("updated_at"), datetime):
-                    doc["updated_at"] = doc["updated_at"].isoformat()
-                
-                # Create Document object
-                document = Document(**doc)
-                documents.append(document)
-                print(f"Processed document {doc['id']}")
-            except Exception as e:
-                print(f"Error processing document: {str(e)}")
-                print(f"Document data: {doc}")
-                continue
-        
-        # Sort documents by created_at in descending order
-        # documents.sort(key=lambda x: x.created_at, reverse=True)
-        
-        # Apply pagination if needed
-        # if limit > 0:
-        #     start = skip
-        #     end = skip + limit
-        #     documents = documents[start:end]
+        # Records come straight from the DB, shape them without re-validating
+        classes = project_class_names(project)
+        documents = [document_to_dict(doc, project_id_str, annotation_format, classes) for doc in cursor]
         
         print(f"Returning {len(documents)} documents")
-        return {"total_count": total_count, "documents": documents}
+        return MongoJSONResponse({"total_count": total_count, "documents": documents})
         
     except Exception as e:
         print(f"Error in get_project_documents: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching documents: {str(e)}")
 
+@router.get("/project/{project_id}/search")
+async def search_project_documents(
+    project_id: str,
+    q: str,
+    current_user = Depends(get_current_user),
+    page: int = 1,
+    docsPerPage: int = 20,
+    snippetLength: int = 200
+):
+    """
+    Full-text search over document text and filenames within a project.
+
+    Uses the `project_text_search` text index, so words are stemmed and results
+    are ordered by relevance. Supports quoted phrases and `-excluded` words.
+
+    Returns:
+        total_count, and per document its metadata, relevance score and a
+        snippet with highlight offsets (relative to the snippet text)
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Search query is empty")
+    page = max(page, 1)
+    docsPerPage = min(max(docsPerPage, 1), 100)
+
+    project = projects_collection.find_one({
+        "_id": ObjectId(project_id),
+        "user_id": str(current_user["_id"]),
+        "deleted_at": None
+    })
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    try:
+        mongo_filter = {"project_id": str(project_id), "deleted_at": None, "$text": {"$search": q}}
+        total_count = documents_collection.count_documents(mongo_filter)
+
+        score = {"score": {"$meta": "textScore"}}
+        cursor = documents_collection.find(
+            mongo_filter,
+            {"text": 1, "filename": 1, "status": 1, "created_at": 1, "updated_at": 1, **score}
+        ).sort([("score", {"$meta": "textScore"})]).skip((page - 1) * docsPerPage).limit(docsPerPage)
+
+        pattern = build_highlight_pattern(parse_search_terms(q))
+        results = []
+        for doc in cursor:
+            filename = doc.get("filename") or ""
+            results.append({
+                "id": str(doc["_id"]),
+                "filename": filename,
+                "status": doc.get("status", "pending"),
+                "created_at": doc.get("created_at"),
+                "updated_at": doc.get("updated_at"),
+                "score": doc.get("score", 0),
+                "snippet": build_snippet(doc.get("text") or "", pattern, snippetLength),
+                "filename_highlights": [list(span) for span in find_highlights(filename, pattern)],
+            })
+
+        return MongoJSONResponse({
+            "total_count": total_count,
+            "page": page,
+            "docsPerPage": docsPerPage,
+            "documents": results
+        })
+    except Exception as e:
+        print(f"Error in search_project_documents: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error searching documents: {str(e)}")
+
+@router.get("/project/{project_id}/annotations")
+async def query_project_annotations(
+    project_id: str,
+    current_user = Depends(get_current_user),
+    entity: Optional[str] = None,
+    text: Optional[str] = None,
+    match: str = "contains",
+    page: int = 1,
+    perPage: int = 100
+):
+    """
+    Query annotation spans of a project from the materialized annotation index.
+
+    Args:
+        entity: Only spans of this entity class
+        text: Only spans whose text matches (case and whitespace insensitive)
+        match: How `text` matches: "contains" (default), "prefix" or "exact"
+        page / perPage: Pagination (perPage is capped at 1000)
+
+    Returns:
+        total_count and spans with document id, filename, entity, text and offsets
+    """
+    if match not in ("contains", "prefix", "exact"):
+        raise HTTPException(status_code=400, detail="match must be one of contains, prefix, exact")
+    page = max(page, 1)
+    perPage = min(max(perPage, 1), 1000)
+
+    project = projects_collection.find_one({
+        "_id": ObjectId(project_id),
+        "user_id": str(current_user["_id"]),
+        "deleted_at": None
+    })
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    span_filter = build_span_filter(project_id, entity, text, match)
+    total_count = annotations_collection.count_documents(span_filter)
+    cursor = annotations_collection.find(span_filter, {"_id": 0, "project_id": 0}).sort([
+        ("norm_text", 1), ("document_id", 1), ("start_index", 1)
+    ]).skip((page - 1) * perPage).limit(perPage)
+    spans = list(cursor)
+
+    # Resolve filenames for the documents on this page in one query
+    document_ids = list({span["document_id"] for span in spans})
+    filenames = {
+        str(doc["_id"]): doc.get("filename")
+        for doc in documents_collection.find(
+            {"_id": {"$in": [ObjectId(doc_id) for doc_id in document_ids]}}, {"filename": 1}
+        )
+    } if document_ids else {}
+    for span in spans:
+        span.pop("norm_text", None)
+        span["filename"] = filenames.get(span["document_id"])
+
+    return MongoJSONResponse({"total_count": total_count, "page": page, "perPage": perPage, "spans": spans})
+
+@router.post("/project/{project_id}/annotations/rebuild")
+async def rebuild_annotation_index(project_id: str, current_user = Depends(get_current_user)):
+    """Rebuild the annotation index of a project from its documents (e.g. for data written before the index existed)."""
+    project = projects_collection.find_one({
+        "_id": ObjectId(project_id),
+        "user_id": str(current_user["_id"]),
+        "deleted_at": None
+    })
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    spans = rebuild_project_annotations(project_id)
+    return {"message": f"Indexed {spans} annotation spans", "spans": spans}
+
 @router.get("/{document_id}", response_model=Document)
-async def get_document(document_id: str, current_user = Depends(get_current_user)):
+async def get_document(document_id: str, current_user = Depends(get_current_user), annotation_format: str = "full"):
+    """
+    Args:
+        annotation_format: "compact" returns `annotations_compact` (parallel
+            offset and entity-index arrays) instead of `annotations`
+    """
+    validate_annotation_format(annotation_format)
     try:
-        doc = documents_collection.find_one({"_id": ObjectId(document_id)})
+        doc = documents_collection.find_one({"_id": ObjectId(document_id), "deleted_at": None})
         if not doc:
             raise HTTPException(status_code=404, detail="Document not found")
         
         # Verify project belongs to user
         project = projects_collection.find_one({
             "_id": ObjectId(doc["project_id"]),
-            "user_id": str(current_user["_id"])
+            "user_id": str(current_user["_id"]),
+            "deleted_at": None
         })
         if not project:
             raise HTTPException(status_code=403, detail="Not authorized to access this document")
         
-        # Ensure all required fields exist with defaults
-        doc["id"] = str(doc.pop("_id"))
-        doc.setdefault("text", "")
-        doc.setdefault("filename", f"document_{doc['id']}.txt")
-        doc.setdefault("project_id", str(doc["project_id"]))
-        doc.setdefault("status", "pending")
-        doc.setdefault("annotations", [])
-        
-        # Convert datetime objects to strings
-        if isinstance(doc.get("created_at"), datetime):
-            doc["created_at"] = doc["created_at"].isoformat()
-        if isinstance(doc.get("updated_at"), datetime):
-            doc["updated_at"] = doc["updated_at"].isoformat()
-        
-        # Print debug info
-        print("Document data:", doc)
-        
-        return Document(**doc)
+        return MongoJSONResponse(document_to_dict(doc, annotation_format=annotation_format, classes=project_class_names(project)))
     except Exception as e:
         print(f"Error in get_document: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching document: {str(e)}")
@@ -272,14 +483,15 @@ async def update_document(
 ):
     try:
         # Verify document exists
-        doc = documents_collection.find_one({"_id": ObjectId(document_id)})
+        doc = documents_collection.find_one({"_id": ObjectId(document_id), "deleted_at": None})
         if not doc:
             raise HTTPException(status_code=404, detail="Document not found")
         
         # Verify project belongs to user
         project = projects_collection.find_one({
             "_id": ObjectId(doc["project_id"]),
-            "user_id": str(current_user["_id"])
+            "user_id": str(current_user["_id"]),
+            "deleted_at": None
         })
         if not project:
             raise HTTPException(status_code=403, detail="Not authorized to update this document")
@@ -292,76 +504,155 @@ async def update_document(
             update_dict["filename"] = document_update.filename
         if document_update.status is not None:
             update_dict["status"] = document_update.status
-        if document_update.annotations is not None:
-            update_dict["annotations"] = [annotation.dict() for annotation in document_update.annotations]
+        text = update_dict.get("text", doc.get("text") or "")
+        text_changed = "text" in update_dict and update_dict["text"] != doc.get("text")
+        annotations = None
+        if document_update.annotations_compact is not None:
+            annotations = decode_compact_annotations(document_update.annotations_compact, text)
+        elif document_update.annotations is not None:
+            annotations = [annotation.dict() for annotation in document_update.annotations]
+        elif text_changed:
+            # The stored spans are checked against the new text like a save of
+            # them would be (dropped or rejected per ANNOTATION_INVALID_SPANS)
+            annotations = document_annotations(doc)
+        if annotations is not None:
+            annotations = validate_annotations(annotations, text)
         
         update_dict["updated_at"] = datetime.utcnow()
+        update = {"$set": update_dict}
+        if annotations is not None:
+            stored = storage_fields(annotations, text, project_class_names(project))
+            update_dict.update(stored)
+            update["$unset"] = unset_fields(stored)
+        
+        # A save of the whole annotation list (or of a text that changes what
+        # the spans point at) must not overwrite changes it has not seen
+        version = doc.get("version") or 0
+        query = {"_id": ObjectId(document_id)}
+        if annotations is not None:
+            if document_update.base_version is not None and document_update.base_version != version:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Document changed since version {document_update.base_version} (now {version}); reload it or send operations instead"
+                )
+            query.update(version_filter(version))
+            update["$inc"] = {"version": 1}
         
         # Update document
-        result = documents_collection.update_one(
-            {"_id": ObjectId(document_id)},
-            {"$set": update_dict}
-        )
+        result = documents_collection.update_one(query, update)
         
         if result.modified_count == 0:
+            if annotations is not None:
+                raise HTTPException(status_code=409, detail="Document changed while saving; reload it and try again")
             raise HTTPException(status_code=404, detail="Document not found or no changes made")
         
+        if text_changed:
+            remove_document_tokens([document_id])
+        if annotations is not None:
+            sync_document_annotations(document_id, doc["project_id"], annotations)
+            entry = record_replace(document_id, doc["project_id"], version + 1, current_user)
+            await collaboration_hub.publish(entry)
+        
         # Get updated document
         updated_doc = documents_collection.find_one({"_id": ObjectId(document_id)})
-        updated_doc["id"] = str(updated_doc.pop("_id"))
+        apply_document_update(doc["project_id"], doc, updated_doc)
         
-        return Document(**updated_doc)
+        return MongoJSONResponse(document_to_dict(updated_doc))
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error updating document: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error updating document: {str(e)}")
 
 @router.delete("/bulk-delete")
-async def bulk_delete_documents(request: Request):
+async def bulk_delete_documents(request: Request, current_user = Depends(get_current_user)):
+    """
+    Delete up to BULK_DELETE_MAX_IDS documents of the current user's projects.
+
+    Documents are marked deleted (hidden from reads at once) and purged by a
+    background job; documents of other users' projects are ignored.
+    """
     try:
         data = await request.json()
         document_ids = data.get('document_ids', [])
         if not document_ids:
             raise HTTPException(status_code=400, detail="No document IDs provided")
+        if len(document_ids) > BULK_DELETE_MAX_IDS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"At most {BULK_DELETE_MAX_IDS} documents can be deleted per request"
+            )
 
         # Convert string IDs to ObjectId
-        object_ids = [ObjectId(doc_id) for doc_id in document_ids]
-        
-        # Delete documents
-        result = documents_collection.delete_many({"_id": {"$in": object_ids}})
-        
-        if result.deleted_count == 0:
+        object_ids = [ObjectId(doc_id) for doc_id in set(document_ids)]
+        
+        # Only documents in projects owned by the user
+        owned_projects = [
+            str(project["_id"]) for project in projects_collection.find(
+                {"user_id": str(current_user["_id"]), "deleted_at": None}, {"_id": 1}
+            )
+        ]
+        owned_filter = {"_id": {"$in": object_ids}, "project_id": {"$in": owned_projects}, "deleted_at": None}
+
+        # Keep what the counters need before the documents are hidden
+        deleted_by_project = {}
+        for doc in documents_collection.find(owned_filter, {"project_id": 1, "text": 1, "status": 1, "annotations": 1, "annotations_compact": 1}):
+            deleted_by_project.setdefault(doc["project_id"], []).append(doc)
+        deleted_ids = [doc["_id"] for docs in deleted_by_project.values() for doc in docs]
+        if not deleted_ids:
             raise HTTPException(status_code=404, detail="No documents found to delete")
+
+        # Mark documents deleted; the job removes them in batches
+        result = documents_collection.update_many(
+            {"_id": {"$in": deleted_ids}, "deleted_at": None},
+            {"$set": {"deleted_at": datetime.utcnow()}}
+        )
+        remove_document_annotations(deleted_ids)
+        for project_id, docs in deleted_by_project.items():
+            apply_document_changes(project_id, removed=docs)
+
+        job_id = create_deletion_job("documents", current_user["_id"], list(deleted_by_project), result.modified_count)
+        start_deletion_job(job_id)
             
-        return {"message": f"Successfully deleted {result.deleted_count} documents"}
+        return {"message": f"Successfully deleted {result.modified_count} documents", "job_id": job_id}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/project/{project_id}/export")
-async def export_project_data(project_id: str, current_user = Depends(get_current_user)):
+async def export_project_data(
+    project_id: str,
+    request: Request,
+    current_user = Depends(get_current_user),
+    annotation_format: str = "full",
+    stale: bool = False
+):
+    """
+    Export a project's entity classes and documents.
+
+    Served from a snapshot while the project is unchanged (see utils/export_snapshots.py).
+    """
+    validate_annotation_format(annotation_format)
     # Verify project exists and belongs to user
     project = projects_collection.find_one({
         "_id": ObjectId(project_id),
-        "user_id": str(current_user["_id"])
+        "user_id": str(current_user["_id"]),
+        "deleted_at": None
     })
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    # Get all documents for the project
-    documents = []
-    cursor = documents_collection.find({"project_id": project_id})
-    for doc in cursor:
-        doc["_id"] = str(doc["_id"])
-        documents.append(doc)
-    
-    export_data = {
-        "project": {
-            "id": str(project["_id"]),
-            "name": project["name"],
-            "entity_classes": project["entity_classes"]
-        },
-        "documents": documents
-    }
-    
-    return export_data
+    build = project_export_builder(project, annotation_format, header={
+        "id": str(project["_id"]),
+        "name": project["name"],
+        "entity_classes": project["entity_classes"]
+    })
+
+    watermark = project_watermark(project)
+    path, served, _ = await get_snapshot(
+        project_id, watermark, "documents", {"annotation_format": annotation_format}, "json", build, stale=stale
+    )
+    return snapshot_response(request, path, served, watermark, "application/json", f"{project_id}.json")
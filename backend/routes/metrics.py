@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+from utils.metrics import REGISTRY
+from config.database import command_listener
+from utils.auth import get_current_user
+
+router = APIRouter()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+@router.get("", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Expose in-process metrics in Prometheus text format.
+
+    Metrics are kept per worker process; scrape every worker (or run a single
+    worker) to get complete numbers.
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+@router.get("/mongo")
+async def get_mongo_report(limit: int = 50, current_user = Depends(get_current_user)):
+    """
+    Debug report of MongoDB command latency by collection and operation,
+    slowest total time first, plus the most recent slow commands with their
+    redacted filter shapes. Requires login: it shows collection names and
+    query shapes.
+    """
+    return command_listener.report(limit=limit)
@@ -1,17 +1,42 @@
-from fastapi import APIRouter, HTTPException
-from openai import AsyncOpenAI
+from fastapi import APIRouter, HTTPException, Depends
+from starlette.concurrency import run_in_threadpool
+import asyncio
 import requests
 import json
 import re
-from typing import Dict, Any, List, Tuple
+import time
+from datetime import datetime, timezone
+from bson import ObjectId
+from typing import Dict, Any, List, Tuple, Optional, TYPE_CHECKING
 from pydantic import BaseModel, Field
 from config.model_manager_config import (
     OPENAI_API_KEY,
     OPENAI_MODEL,
-    USE_LOCAL_LLM,
     OLLAMA_MODEL,
-    OLLAMA_API_URL
+    OLLAMA_API_URL,
+    OLLAMA_KEEP_ALIVE,
+    OLLAMA_WARMUP_ON_STARTUP,
+    OLLAMA_PROBE_INTERVAL,
+    OLLAMA_PROBE_TIMEOUT,
+    LLM_BACKENDS,
+    LLM_DEFAULT_BACKEND,
+    LLM_REQUEST_TIMEOUT
 )
+from config.database import projects_collection
+from utils.auth import get_current_user
+from utils.llm_metrics import (
+    record_llm_call,
+    estimate_think_tokens,
+    project_usage_report,
+    LLM_MODEL_LOAD_SECONDS,
+    LLM_MODEL_RESIDENT
+)
+from utils.llm_router import Backend, LLMRouter
+from utils.single_flight import SingleFlight
+from utils.lazy_imports import imported_module, lazy_import
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
 
 router = APIRouter()
 
@@ -35,24 +60,109 @@ class ChatRequest(BaseModel):
         ],
         description="List of messages in the conversation"
     )
+    backend: Optional[str] = Field(
+        None,
+        description="Name of the LLM backend to use (default backend if omitted)"
+    )
+
+# One client (and connection pool) per API key and base URL
+_openai_clients: Dict[Tuple[Optional[str], Optional[str]], "AsyncOpenAI"] = {}
+
+# Keep-alive connections to the Ollama servers, shared by the threadpool workers
+_ollama_session = requests.Session()
+
+def _openai_client(api_key: Optional[str], base_url: Optional[str]) -> "AsyncOpenAI":
+    client = _openai_clients.get((api_key, base_url))
+    if client is None:
+        # openai is imported on first use, so Ollama-only workers never load it
+        openai = lazy_import("openai", "OpenAI backends")
+        # Retries are done by the LLM router, which also knows about other backends
+        client = _openai_clients[(api_key, base_url)] = openai.AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+    return client
 
-async def chat_with_gpt(messages: List[Message]) -> str:
+def _openai_error(e: Exception) -> HTTPException:
+    """Keep the upstream status (and Retry-After) so the router can tell what to retry."""
+    if isinstance(e, HTTPException):
+        return e
+    headers = None
+    openai = imported_module("openai")
+    if openai is None:
+        # Failed before the client existed (e.g. openai not installed)
+        status_code = 500
+    elif isinstance(e, openai.APIStatusError):
+        status_code = e.status_code
+        retry_after = e.response.headers.get("retry-after")
+        headers = {"Retry-After": retry_after} if retry_after else None
+    elif isinstance(e, openai.APITimeoutError):
+        status_code = 504
+    elif isinstance(e, openai.APIConnectionError):
+        status_code = 503
+    else:
+        status_code = 500
+    return HTTPException(status_code=status_code, detail=f"Error with ChatGPT API: {str(e)}", headers=headers)
+
+async def chat_with_gpt(
+    messages: List[Message],
+    project_id: Optional[str] = None,
+    model: str = OPENAI_MODEL,
+    api_key: Optional[str] = OPENAI_API_KEY,
+    base_url: Optional[str] = None,
+    backend_name: str = "openai"
+) -> str:
     """
     Interact with ChatGPT API using the new OpenAI client (v1.0.0+).
+
+    The reply is streamed so time to first token can be measured; token usage
+    comes from the final chunk (`stream_options.include_usage`).
+
+    Args:
+        base_url: An OpenAI-compatible endpoint instead of api.openai.com
+        backend_name: Backend the call is recorded under
     """
+    start = time.perf_counter()
+    first_token_at = None
+    usage = None
+    chunks = []
     try:
-        if not OPENAI_API_KEY:
+        if not api_key and not base_url:
             raise HTTPException(status_code=500, detail="OpenAI API key not configured")
         
-        client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+        client = _openai_client(api_key, base_url)
         
-        response = await client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=[{"role": msg.role, "content": msg.content} for msg in messages]
+        stream = await client.chat.completions.create(
+            model=model,
+            messages=[{"role": msg.role, "content": msg.content} for msg in messages],
+            stream=True,
+            stream_options={"include_usage": True}
         )
-        return response.choices[0].message.content
+        async for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                chunks.append(chunk.choices[0].delta.content)
+        content = "".join(chunks)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error with ChatGPT API: {str(e)}")
+        error = _openai_error(e)
+        record_llm_call(backend_name, model, project_id, time.perf_counter() - start, error=str(error.detail))
+        raise error
+
+    end = time.perf_counter()
+    completion_tokens = usage.completion_tokens if usage else 0
+    think_content, _ = parse_deepseek_response(content) if "<think>" in content else ("", content)
+    record_llm_call(
+        backend_name,
+        model,
+        project_id,
+        end - start,
+        prompt_tokens=usage.prompt_tokens if usage else 0,
+        completion_tokens=completion_tokens,
+        think_tokens=estimate_think_tokens(content, think_content, completion_tokens),
+        time_to_first_token=(first_token_at - start) if first_token_at else None,
+        generation_time=(end - first_token_at) if first_token_at else None,
+    )
+    return content
 
 def parse_deepseek_response(response: str) -> Tuple[str, str]:
     """
@@ -72,43 +182,318 @@ def parse_deepseek_response(response: str) -> Tuple[str, str]:
     
     return think_content, response_content
 
-async def chat_with_ollama(messages: List[Message]) -> Dict[str, str]:
+async def chat_with_ollama(
+    messages: List[Message],
+    project_id: Optional[str] = None,
+    model: str = OLLAMA_MODEL,
+    url: str = OLLAMA_API_URL,
+    backend_name: str = "ollama",
+    keep_alive: Any = OLLAMA_KEEP_ALIVE
+) -> Dict[str, str]:
     """
     Interact with local Ollama instance.
+
+    The blocking HTTP call runs in the threadpool so a multi-second generation
+    does not stall the event loop. Token counts and timings come from the
+    `prompt_eval_count`, `eval_count`, `prompt_eval_duration`,
+    `eval_duration` and `load_duration` fields of the reply.
+
+    Args:
+        keep_alive: How long Ollama keeps the model loaded after this call
     """
+    start = time.perf_counter()
     try:
         # Convert messages to Ollama format
         prompt = " ".join([msg.content for msg in messages])
         
         payload = {
-            "model": OLLAMA_MODEL,
+            "model": model,
             "prompt": prompt,
-            "stream": False
+            "stream": False,
+            "keep_alive": keep_alive
         }
         
-        response = requests.post(f"{OLLAMA_API_URL}/api/generate", json=payload)
+        response = await run_in_threadpool(
+            _ollama_session.post, f"{url}/api/generate", json=payload, timeout=LLM_REQUEST_TIMEOUT
+        )
         if response.status_code != 200:
-            raise HTTPException(status_code=response.status_code, 
-                              detail="Error communicating with Ollama")
-        
-        response_text = response.json()["response"]
-        
-        # Parse response if using Deepseek model
-        if "deepseek" in OLLAMA_MODEL.lower():
-            think_content, response_content = parse_deepseek_response(response_text)
-            return {
-                "think": think_content,
-                "response": response_content
-            }
+            retry_after = response.headers.get("Retry-After")
+            raise HTTPException(status_code=response.status_code,
+                              detail=f"Error communicating with Ollama: {response.text[:200]}",
+                              headers={"Retry-After": retry_after} if retry_after else None)
         
-        return {"response": response_text}
+        data = response.json()
+        response_text = data["response"]
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error with Ollama API: {str(e)}")
+        if isinstance(e, HTTPException):
+            error = e
+        elif isinstance(e, requests.Timeout):
+            error = HTTPException(status_code=504, detail=f"Error with Ollama API: {str(e)}")
+        elif isinstance(e, requests.ConnectionError):
+            error = HTTPException(status_code=503, detail=f"Error with Ollama API: {str(e)}")
+        else:
+            error = HTTPException(status_code=502, detail=f"Error with Ollama API: {str(e)}")
+        record_llm_call(backend_name, model, project_id, time.perf_counter() - start, error=str(error.detail))
+        raise error
+
+    duration = time.perf_counter() - start
+    completion_tokens = data.get("eval_count", 0)
+    # Ollama reports durations in nanoseconds
+    generation_time = data.get("eval_duration", 0) / 1e9
+    load_time = data.get("load_duration", 0) / 1e9
+    if load_time:
+        LLM_MODEL_LOAD_SECONDS.observe(load_time, backend=backend_name, model=model, source="request")
+    think_content = ""
+    result = {"response": response_text}
+
+    # Parse response if using Deepseek model
+    if "deepseek" in model.lower():
+        think_content, response_content = parse_deepseek_response(response_text)
+        result = {
+            "think": think_content,
+            "response": response_content
+        }
+
+    record_llm_call(
+        backend_name,
+        model,
+        project_id,
+        duration,
+        prompt_tokens=data.get("prompt_eval_count", 0),
+        completion_tokens=completion_tokens,
+        think_tokens=estimate_think_tokens(response_text, think_content, completion_tokens),
+        # Everything before generation started: request, model load and prompt evaluation
+        time_to_first_token=max(duration - generation_time, 0) if generation_time else None,
+        generation_time=generation_time or None,
+    )
+    return result
+
+async def _generate_openai(messages: List[Message], project_id: Optional[str], backend) -> Dict[str, str]:
+    response = await chat_with_gpt(
+        messages,
+        project_id,
+        model=backend.model,
+        api_key=backend.config.get("api_key") or OPENAI_API_KEY,
+        base_url=backend.config.get("url"),
+        backend_name=backend.name
+    )
+    return {"response": response}
+
+async def _generate_ollama(messages: List[Message], project_id: Optional[str], backend) -> Dict[str, str]:
+    return await chat_with_ollama(
+        messages,
+        project_id,
+        model=backend.model,
+        url=backend.config.get("url") or OLLAMA_API_URL,
+        backend_name=backend.name,
+        keep_alive=backend.config.get("keep_alive", OLLAMA_KEEP_ALIVE)
+    )
+
+# Every generation goes through the router: per-backend concurrency and rate
+# limits, retries, circuit breaking and fallback (see utils/llm_router.py)
+llm_router = LLMRouter(LLM_BACKENDS, {"openai": _generate_openai, "ollama": _generate_ollama}, LLM_DEFAULT_BACKEND)
+
+# Shares one generation among identical concurrent requests (see utils/single_flight.py)
+llm_single_flight = SingleFlight()
+
+def _model_names(model: str) -> set:
+    """Names Ollama may list a model under ("llama3" is loaded as "llama3:latest")."""
+    return {model} if ":" in model else {model, f"{model}:latest"}
+
+# Fraction of a second in an RFC 3339 time; Ollama sends up to nine digits without trailing zeros
+RFC3339_FRACTION = re.compile(r"\.(\d+)")
+
+def _parse_expiry(value: Optional[str]) -> Optional[datetime]:
+    """
+    Parse Ollama's `expires_at` (Go's RFC3339Nano, e.g. "2024-06-04T14:38:31.837530117-07:00"
+    or "...Z"). Before Python 3.11 fromisoformat takes neither "Z" nor a
+    fraction of other than 3 or 6 digits, so both are normalized first.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value[-1:] in ("Z", "z"):
+        value = value[:-1] + "+00:00"
+    value = RFC3339_FRACTION.sub(lambda match: "." + (match.group(1) + "000000")[:6], value, count=1)
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=timezone.utc)
+
+class OllamaModelManager:
+    """
+    Loads the models of the Ollama backends ahead of the first request and
+    tracks whether they are still loaded.
+
+    A warm-up is an empty generation, which makes Ollama load the model and
+    keep it for the backend's `keep_alive`. Every `interval` seconds each
+    server is probed: /api/version for health, /api/ps for the loaded models
+    and when they expire. A model is warmed up at startup, and again when a
+    probe finds it gone before its keep_alive ran out (server restart, or
+    evicted by another model); a model left idle past its keep_alive stays
+    unloaded until it is used. Each worker probes on its own; warming an
+    already loaded model only extends its keep_alive.
+    """
+
+    def __init__(self, llm_router: LLMRouter, interval: float = OLLAMA_PROBE_INTERVAL):
+        self.llm_router = llm_router
+        self.interval = interval
+        self.states: Dict[str, Dict[str, Any]] = {}
+        self._loads: Dict[str, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def backends(self) -> List[Backend]:
+        return [backend for backend in self.llm_router.backends.values() if backend.type == "ollama"]
+
+    @staticmethod
+    def url(backend: Backend) -> str:
+        return backend.config.get("url") or OLLAMA_API_URL
+
+    @staticmethod
+    def keep_alive(backend: Backend) -> Any:
+        return backend.config.get("keep_alive", OLLAMA_KEEP_ALIVE)
+
+    @staticmethod
+    def warms(backend: Backend) -> bool:
+        return bool(backend.config.get("warm_up", OLLAMA_WARMUP_ON_STARTUP))
+
+    def state(self, backend: Backend) -> Dict[str, Any]:
+        return self.states.setdefault(backend.name, {
+            "healthy": None,
+            "ready": None,
+            "version": None,
+            "resident_until": None,
+            "size_vram": None,
+            "last_probe_at": None,
+            "probe_latency": None,
+            "probe_error": None,
+            "warming": False,
+            "warm_ups": 0,
+            "last_warm_up_at": None,
+            "warm_up_seconds": None,
+            "load_seconds": None,
+            "warm_up_error": None,
+        })
+
+    async def probe(self, backend: Backend) -> Dict[str, Any]:
+        """Check the server is up and whether the backend's model is loaded."""
+        state = self.state(backend)
+        url = self.url(backend)
+        start = time.perf_counter()
+        try:
+            version = await run_in_threadpool(_ollama_session.get, f"{url}/api/version", timeout=OLLAMA_PROBE_TIMEOUT)
+            version.raise_for_status()
+            loaded = await run_in_threadpool(_ollama_session.get, f"{url}/api/ps", timeout=OLLAMA_PROBE_TIMEOUT)
+            loaded.raise_for_status()
+            models = loaded.json().get("models") or []
+        except Exception as e:
+            state.update(healthy=False, ready=False, resident_until=None, size_vram=None, probe_error=str(e))
+        else:
+            names = _model_names(backend.model)
+            resident = next((m for m in models if (m.get("name") or m.get("model")) in names), None)
+            state.update(
+                healthy=True,
+                ready=resident is not None,
+                version=version.json().get("version"),
+                resident_until=resident.get("expires_at") if resident else None,
+                size_vram=resident.get("size_vram") if resident else None,
+                probe_error=None,
+            )
+        state["last_probe_at"] = datetime.utcnow()
+        state["probe_latency"] = round(time.perf_counter() - start, 4)
+        LLM_MODEL_RESIDENT.set(1 if state["ready"] else 0, backend=backend.name, model=backend.model)
+        return state
+
+    async def warm_up(self, backend: Backend) -> Dict[str, Any]:
+        """Load the backend's model now; concurrent calls share one load."""
+        task = self._loads.get(backend.name)
+        if task is None:
+            task = self._loads[backend.name] = asyncio.ensure_future(self._load(backend))
+            task.add_done_callback(lambda _: self._loads.pop(backend.name, None))
+        return await asyncio.shield(task)
+
+    async def _load(self, backend: Backend) -> Dict[str, Any]:
+        state = self.state(backend)
+        state["warming"] = True
+        start = time.perf_counter()
+        payload = {"model": backend.model, "prompt": "", "stream": False, "keep_alive": self.keep_alive(backend)}
+        try:
+            response = await run_in_threadpool(
+                _ollama_session.post, f"{self.url(backend)}/api/generate", json=payload, timeout=LLM_REQUEST_TIMEOUT
+            )
+            if response.status_code != 200:
+                raise RuntimeError(f"Ollama returned {response.status_code}: {response.text[:200]}")
+            load_time = response.json().get("load_duration", 0) / 1e9
+        except Exception as e:
+            state["warm_up_error"] = str(e)
+            print(f"Warm-up of LLM backend '{backend.name}' ({backend.model}) failed: {str(e)}")
+        else:
+            state.update(
+                warm_ups=state["warm_ups"] + 1,
+                last_warm_up_at=datetime.utcnow(),
+                warm_up_seconds=round(time.perf_counter() - start, 3),
+                load_seconds=round(load_time, 3),
+                warm_up_error=None,
+            )
+            LLM_MODEL_LOAD_SECONDS.observe(load_time, backend=backend.name, model=backend.model, source="warm_up")
+            print(f"LLM backend '{backend.name}' loaded {backend.model} in {load_time:.2f}s")
+        finally:
+            state["warming"] = False
+        return await self.probe(backend)
+
+    async def check(self, backend: Backend) -> Dict[str, Any]:
+        """Probe the backend, and warm it up if its model should be loaded but is not."""
+        expected_until = _parse_expiry(self.state(backend)["resident_until"])
+        state = await self.probe(backend)
+        if state["healthy"] and not state["ready"] and self.warms(backend):
+            evicted = expected_until is not None and expected_until > datetime.now(timezone.utc)
+            if state["warm_ups"] == 0 or evicted:
+                state = await self.warm_up(backend)
+        return state
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.gather(*(self.check(backend) for backend in self.backends()), return_exceptions=True)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """Start probing (and warming) in the background; startup does not wait for model loads."""
+        if self._task is None and self.backends():
+            self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "probe_interval": self.interval,
+            "backends": [
+                {
+                    "name": backend.name,
+                    "model": backend.model,
+                    "url": self.url(backend),
+                    "keep_alive": self.keep_alive(backend),
+                    "warm_up": self.warms(backend),
+                    **self.state(backend),
+                }
+                for backend in self.backends()
+            ],
+        }
+
+# Keeps the Ollama models loaded; started with the app (see main.py)
+ollama_model_manager = OllamaModelManager(llm_router)
 
 @router.post("/llm_chat")
 async def llm_chat(request: ChatRequest):
     """
-    Endpoint for LLM chat that switches between ChatGPT and Ollama based on configuration.
+    Endpoint for LLM chat on the requested backend (or the default one).
 
     Example request body:
     ```json
@@ -126,20 +511,95 @@ async def llm_chat(request: ChatRequest):
     - For ChatGPT: {"response": "message"}
     - For Deepseek: {"think": "thinking process", "response": "message"}
     - For other Ollama models: {"response": "message"}
+    each with the "backend" and "model" that answered
     """
     try:
         messages = request.messages
         if not messages:
             raise HTTPException(status_code=400, detail="No messages provided")
 
-        if USE_LOCAL_LLM:
-            result = await chat_with_ollama(messages)
-        else:
-            response = await chat_with_gpt(messages)
-            result = {"response": response}
-
-        return result
+        return await llm_router.generate(messages, backend=request.backend)
     except HTTPException as he:
         raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/backends")
+async def get_llm_backends():
+    """
+    Configured LLM backends with their limits, current load and circuit state
+    ("closed", "open" or "half_open").
+    """
+    return llm_router.status()
+
+@router.get("/status")
+async def get_model_status(refresh: bool = False):
+    """
+    Lifecycle of the Ollama backends' models: server health and version,
+    whether the model is loaded and until when (`resident_until`), and the
+    last warm-up with its load time.
+
+    Args:
+        refresh: Probe the servers now instead of reporting the last probe
+    """
+    if refresh:
+        await asyncio.gather(*(ollama_model_manager.probe(backend) for backend in ollama_model_manager.backends()))
+    return ollama_model_manager.status()
+
+@router.get("/ready")
+async def get_model_readiness(backend: Optional[str] = None):
+    """
+    Readiness probe: 200 when the backend (default one if omitted) can answer
+    without a cold start, i.e. its Ollama model is loaded or its hosted API is
+    configured; 503 otherwise.
+    """
+    target = llm_router.get(backend)
+    if target.type == "ollama":
+        state = await ollama_model_manager.probe(target)
+        ready = state["ready"]
+        reason = state["probe_error"] or ("model is loading" if state["warming"] else "model is not loaded")
+    else:
+        ready = target.configured
+        reason = "not configured"
+    if not ready:
+        raise HTTPException(status_code=503, detail=f"LLM backend '{target.name}' is not ready: {reason}")
+    return {"backend": target.name, "model": target.model, "ready": True}
+
+@router.post("/warmup")
+async def warm_up_model(backend: Optional[str] = None):
+    """
+    Load the model of an Ollama backend (default one if omitted) now, e.g.
+    before a labelling session after an idle period.
+
+    Returns:
+        The backend's lifecycle state after the load
+    """
+    target = llm_router.get(backend)
+    if target.type != "ollama":
+        raise HTTPException(status_code=400, detail=f"LLM backend '{target.name}' is not an Ollama backend")
+    state = await ollama_model_manager.warm_up(target)
+    if state["warm_up_error"]:
+        raise HTTPException(status_code=502, detail=f"Error warming up '{target.name}': {state['warm_up_error']}")
+    return {"name": target.name, "model": target.model, **state}
+
+@router.get("/usage/project/{project_id}")
+async def get_project_llm_usage(
+    project_id: str,
+    since: Optional[datetime] = None,
+    current_user = Depends(get_current_user)
+):
+    """
+    Cost and throughput report of the LLM calls made for a project, per backend and model.
+
+    Args:
+        project_id: ID of the project
+        since: Only include calls made after this time (ISO-8601)
+    """
+    project = projects_collection.find_one({
+        "_id": ObjectId(project_id),
+        "user_id": str(current_user["_id"])
+    })
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    return project_usage_report(project_id, since)
@@ -1,43 +1,57 @@
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
 from models.project import ProjectCreate, Project, ProjectUpdate, ProjectResponse
 from models.models_ner import ResponseModel
 from utils.auth import get_current_user
+from config.model_manager_config import LLM_BACKENDS
 from config.database import projects_collection, documents_collection
+from utils.serialization import MongoJSONResponse, dumps, project_to_dict
+from utils.annotation_index import rename_entity
+from utils.project_stats import (
+    init_project_stats,
+    rename_entity_counters,
+    rebuild_project_stats,
+    get_project_counters,
+    project_stats_report
+)
+from utils.deletion import create_deletion_job, start_deletion_job, get_deletion_job
+from utils.annotation_ops import record_replace
+from utils.collaboration import collaboration_hub
+from utils.compact_annotations import (
+    ANNOTATION_FORMATS,
+    document_annotations,
+    format_record,
+    project_class_names,
+    storage_fields,
+    unset_fields
+)
+from utils.token_cache import documents_tokens
+from auto_gen_tools.ner_tools import WORD_TOKENIZER, convert_span_to_iob2, get_tokenizer
+from utils.dataset_export import (
+    DATASET_FORMATS,
+    DATASET_MEDIA_TYPES,
+    document_batches,
+    parse_splits,
+    write_dataset
+)
+from utils.export_snapshots import get_snapshot, project_watermark, snapshot_response
+from config.export_config import EXPORT_TOKENIZERS, EXPORT_SPLITS, EXPORT_SPLIT_SEED
 from bson import ObjectId
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional
+import json
+import logging
 
 
 router = APIRouter()
 
-def serialize_datetime(dt):
-    """Helper function to serialize datetime objects"""
-    if isinstance(dt, datetime):
-        return dt.isoformat()
-    return dt
-
-def serialize_document(doc: Dict[str, Any]) -> Dict[str, Any]:
-    """Helper function to serialize document data"""
-    serialized = {}
-    for key, value in doc.items():
-        if isinstance(value, ObjectId):
-            serialized[key] = str(value)
-        elif isinstance(value, datetime):
-            serialized[key] = serialize_datetime(value)
-        elif isinstance(value, dict):
-            serialized[key] = serialize_document(value)
-        elif isinstance(value, list):
-            serialized[key] = [
-                serialize_document(item) if isinstance(item, dict) else item 
-                for item in value
-            ]
-        else:
-            serialized[key] = value
-    return serialized
+def validate_llm_backend(name: Optional[str]) -> None:
+    if name is not None and name not in {backend["name"] for backend in LLM_BACKENDS}:
+        raise HTTPException(status_code=400, detail=f"Unknown LLM backend '{name}'")
 
 @router.post("/", response_model=Project)
 async def create_project(project: ProjectCreate, current_user = Depends(get_current_user)):
+    validate_llm_backend(project.llm_backend)
     project_dict = project.dict()
     project_dict["user_id"] = str(current_user["_id"])
     project_dict["created_at"] = datetime.utcnow()
@@ -45,30 +59,27 @@ async def create_project(project: ProjectCreate, current_user = Depends(get_curr
     
     result = projects_collection.insert_one(project_dict)
     project_dict["id"] = str(result.inserted_id)
+    init_project_stats(project_dict["id"])
     
     return Project(**project_dict)
 
 @router.get("/", response_model=List[Project])
 async def get_projects(current_user = Depends(get_current_user)):
-    projects = []
-    cursor = projects_collection.find({"user_id": str(current_user["_id"])})
-    for doc in cursor:
-        doc["id"] = str(doc.pop("_id"))
-        projects.append(Project(**doc))
-    return projects
+    cursor = projects_collection.find({"user_id": str(current_user["_id"]), "deleted_at": None})
+    return MongoJSONResponse([project_to_dict(doc) for doc in cursor])
 
 @router.get("/{project_id}", response_model=Project)
 async def get_project(project_id: str, current_user = Depends(get_current_user)):
     project = projects_collection.find_one({
         "_id": ObjectId(project_id),
-        "user_id": str(current_user["_id"])
+        "user_id": str(current_user["_id"]),
+        "deleted_at": None
     })
     
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    project["id"] = str(project.pop("_id"))
-    return Project(**project)
+    return MongoJSONResponse(project_to_dict(project))
 
 # @router.get("/{project_id}/documents")
 # async def get_project_documents(
@@ -100,52 +111,78 @@ async def get_project(project_id: str, current_user = Depends(get_current_user))
     
     
 
-@router.get("/{project_id}/export")
-async def export_project(project_id: str, current_user = Depends(get_current_user)):
+def project_export_builder(project: Dict[str, Any], annotation_format: str, header: Optional[Dict[str, Any]] = None):
     """
-    Export project data including all documents and their annotations.
+    Writes the JSON export of a project to a path (see get_snapshot).
+
+    Args:
+        header: The export's "project" object, if not the project's details
     """
-    try:
-        # Verify project exists and belongs to user
-        project = projects_collection.find_one({
-            "_id": ObjectId(project_id),
-            "user_id": str(current_user["_id"])
-        })
-        
-        if not project:
-            raise HTTPException(status_code=404, detail="Project not found")
-        
-        # Get all documents for this project
-        documents = []
-        try:
-            cursor = documents_collection.find({"project_id": project_id})
-            for doc in cursor:
-                try:
-                    serialized_doc = serialize_document(doc)
-                    documents.append(serialized_doc)
-                except Exception as doc_err:
-                    logging.error(f"Error processing document {doc.get('_id', 'unknown')}: {str(doc_err)}")
-                    continue
-        except Exception as docs_err:
-            logging.error(f"Error fetching documents: {str(docs_err)}")
-            documents = []  # Continue with empty documents list
-        
-        # Prepare export data
+    def build(path: str) -> None:
+        # ObjectIds and datetimes are handled by the orjson encoder so records are exported as-is
+        classes = project_class_names(project)
+        documents = [
+            format_record(doc, annotation_format, classes)
+            for doc in documents_collection.find({"project_id": str(project["_id"]), "deleted_at": None})
+        ]
         export_data = {
-            "project": {
+            "project": header if header is not None else {
                 "id": str(project["_id"]),
                 "name": project.get("name", ""),
                 "description": project.get("description", ""),
-                "created_at": serialize_datetime(project.get("created_at", datetime.utcnow())),
-                "updated_at": serialize_datetime(project.get("updated_at", datetime.utcnow())),
+                "created_at": project.get("created_at", datetime.utcnow()),
+                "updated_at": project.get("updated_at", datetime.utcnow()),
                 "user_id": project.get("user_id", ""),
                 "settings": project.get("settings", {})
             },
             "documents": documents
         }
+        with open(path, "wb") as f:
+            f.write(dumps(export_data))
+    return build
+
+@router.get("/{project_id}/export")
+async def export_project(
+    project_id: str,
+    request: Request,
+    current_user = Depends(get_current_user),
+    annotation_format: str = "full",
+    stale: bool = False
+):
+    """
+    Export project data including all documents and their annotations.
+
+    The export is served from a snapshot while the project is unchanged and
+    rebuilt after it changes (see utils/export_snapshots.py).
+
+    Args:
+        annotation_format: "compact" exports `annotations_compact` (parallel
+            offset and entity-index arrays) instead of `annotations`
+        stale: Serve the last snapshot at once (marked X-Export-Stale) while
+            the current one is built
+    """
+    if annotation_format not in ANNOTATION_FORMATS:
+        raise HTTPException(status_code=400, detail=f"annotation_format must be one of {', '.join(ANNOTATION_FORMATS)}")
+    try:
+        # Verify project exists and belongs to user
+        project = projects_collection.find_one({
+            "_id": ObjectId(project_id),
+            "user_id": str(current_user["_id"]),
+            "deleted_at": None
+        })
         
-        return JSONResponse(content=export_data)
+        if not project:
+            raise HTTPException(status_code=404, detail="Project not found")
+
+        watermark = project_watermark(project)
+        path, served, _ = await get_snapshot(
+            project_id, watermark, "project", {"annotation_format": annotation_format}, "json",
+            project_export_builder(project, annotation_format), stale=stale
+        )
+        return snapshot_response(request, path, served, watermark, "application/json", f"{project_id}.json")
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error exporting project {project_id}: {str(e)}")
         raise HTTPException(
@@ -153,10 +190,191 @@ async def export_project(project_id: str, current_user = Depends(get_current_use
             detail=f"Error exporting project: {str(e)}"
         )
 
+IOB2_FORMATS = ("conll", "jsonl")
+
+def iob2_lines(project_id: str, tokenizer: str, export_format: str) -> Iterator[str]:
+    """
+    Documents of a project as IOB2, one batch of EXPORT_BATCH_SIZE at a time.
+
+    Tokens come from the token cache, so only documents that are new or whose
+    text changed since the last export are tokenized.
+    """
+    for batch in document_batches(project_id):
+        yield from iob2_batch(batch, tokenizer, export_format)
+
+def iob2_batch(batch: List[Dict[str, Any]], tokenizer: str, export_format: str) -> Iterator[str]:
+    tokens = documents_tokens(batch, tokenizer)
+    for doc in batch:
+        document_id = str(doc["_id"])
+        iob2 = convert_span_to_iob2(
+            doc.get("text") or "", document_annotations(doc), tokenizer, tokens=tokens[document_id]
+        )
+        if export_format == "jsonl":
+            yield json.dumps({
+                "id": document_id,
+                "filename": doc.get("filename"),
+                "tokens": iob2["tokens"],
+                "tags": iob2["tags"]
+            }, ensure_ascii=False) + "\n"
+            continue
+        lines = ["-DOCSTART- -X- O", ""]
+        for sentence, tags in zip(iob2["tokens"], iob2["tags"]):
+            lines.extend(f"{token} {tag}" for token, tag in zip(sentence, tags))
+            lines.append("")
+        yield "\n".join(lines) + "\n"
+
+@router.get("/{project_id}/export/iob2")
+async def export_project_iob2(
+    project_id: str,
+    current_user = Depends(get_current_user),
+    tokenizer: str = WORD_TOKENIZER,
+    format: str = "conll"
+):
+    """
+    Export a project's documents as token-level IOB2 training data.
+
+    Args:
+        tokenizer: One of EXPORT_TOKENIZERS ("words" splits on words and
+            punctuation; other names are Hugging Face tokenizers)
+        format: "conll" (one `token tag` line per token, a blank line between
+            sentences and -DOCSTART- between documents) or "jsonl" (one
+            {id, filename, tokens, tags} object per document)
+    """
+    if tokenizer not in EXPORT_TOKENIZERS:
+        raise HTTPException(status_code=400, detail=f"tokenizer must be one of {', '.join(EXPORT_TOKENIZERS)}")
+    if format not in IOB2_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(IOB2_FORMATS)}")
+    try:
+        project = projects_collection.find_one({
+            "_id": ObjectId(project_id),
+            "user_id": str(current_user["_id"]),
+            "deleted_at": None
+        })
+        if not project:
+            raise HTTPException(status_code=404, detail="Project not found")
+
+        # Load the tokenizer before streaming so a missing dependency is an error response
+        if tokenizer != WORD_TOKENIZER:
+            get_tokenizer(tokenizer)
+    except HTTPException:
+        raise
+    except ImportError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logging.error(f"Error exporting project {project_id} as IOB2: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error exporting project: {str(e)}")
+
+    filename = f"{project_id}_{tokenizer.replace('/', '_')}.{'jsonl' if format == 'jsonl' else 'conll'}"
+    return StreamingResponse(
+        iob2_lines(project_id, tokenizer, format),
+        media_type="application/x-ndjson" if format == "jsonl" else "text/plain",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.get("/{project_id}/export/dataset")
+async def export_project_dataset(
+    project_id: str,
+    request: Request,
+    current_user = Depends(get_current_user),
+    format: str = "parquet",
+    tokenizer: Optional[str] = None,
+    seed: int = EXPORT_SPLIT_SEED,
+    splits: str = EXPORT_SPLITS,
+    stale: bool = False
+):
+    """
+    Export a project as a columnar training dataset, one row per document.
+
+    Served from a snapshot while the project is unchanged (see utils/export_snapshots.py).
+
+    Args:
+        format: "parquet" or "arrow" (Arrow IPC file)
+        tokenizer: One of EXPORT_TOKENIZERS to add `tokens` and IOB2 `tags` columns
+        seed: Seed of the train/dev/test assignment; a document keeps its
+            split across exports with the same seed and fractions
+        splits: Train/dev/test fractions, e.g. "0.8,0.1,0.1"
+        stale: Serve the last snapshot at once while the current one is built
+    """
+    if format not in DATASET_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(DATASET_FORMATS)}")
+    if tokenizer is not None and tokenizer not in EXPORT_TOKENIZERS:
+        raise HTTPException(status_code=400, detail=f"tokenizer must be one of {', '.join(EXPORT_TOKENIZERS)}")
+    try:
+        fractions = parse_splits(splits)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        project = projects_collection.find_one({
+            "_id": ObjectId(project_id),
+            "user_id": str(current_user["_id"]),
+            "deleted_at": None
+        })
+        if not project:
+            raise HTTPException(status_code=404, detail="Project not found")
+
+        def build(path: str) -> Dict[str, Any]:
+            return {"counts": write_dataset(project_id, path, format, tokenizer, seed, fractions)}
+
+        watermark = project_watermark(project)
+        path, served, meta = await get_snapshot(
+            project_id, watermark, "dataset",
+            {"format": format, "tokenizer": tokenizer, "seed": seed, "splits": fractions},
+            format, build, stale=stale
+        )
+    except HTTPException:
+        raise
+    except ImportError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logging.error(f"Error exporting project {project_id} as {format}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error exporting project: {str(e)}")
+
+    counts = meta.get("counts") or {}
+    return snapshot_response(
+        request, path, served, watermark, DATASET_MEDIA_TYPES[format], f"{project_id}.{format}",
+        headers={"X-Split-Counts": ",".join(f"{name}={count}" for name, count in counts.items())}
+    )
+
+@router.get("/{project_id}/stats")
+async def get_project_stats(project_id: str, current_user = Depends(get_current_user)):
+    """
+    Project statistics: documents per status, spans per entity class,
+    annotations per document and annotated-character coverage.
+    Served from the project's counters, so the cost does not grow with the project.
+    """
+    project = projects_collection.find_one({
+        "_id": ObjectId(project_id),
+        "user_id": str(current_user["_id"]),
+        "deleted_at": None
+    })
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    try:
+        return MongoJSONResponse(project_stats_report(project))
+    except Exception as e:
+        logging.error(f"Error getting stats for project {project_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error getting project stats: {str(e)}")
+
+@router.post("/{project_id}/stats/rebuild")
+async def rebuild_stats(project_id: str, current_user = Depends(get_current_user)):
+    """Recompute the project's counters from its documents (repairs drift)."""
+    project = projects_collection.find_one({
+        "_id": ObjectId(project_id),
+        "user_id": str(current_user["_id"]),
+        "deleted_at": None
+    })
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    rebuild_project_stats(project_id)
+    return MongoJSONResponse(project_stats_report(project))
+
 @router.get("/{project_id}/ner_classes", response_model=ResponseModel)
 async def get_ner_classes(project_id: str):
     try:
-        project = projects_collection.find_one({"_id": ObjectId(project_id)})
+        project = projects_collection.find_one({"_id": ObjectId(project_id), "deleted_at": None})
         
         if not project:
             raise HTTPException(status_code=404, detail="Project not found")
@@ -183,11 +401,13 @@ async def update_project(
     project_update: ProjectUpdate,
     current_user = Depends(get_current_user)
 ):
+    validate_llm_backend(project_update.llm_backend)
     try:
         # Get the current project state
         current_project = projects_collection.find_one({
             "_id": ObjectId(project_id),
-            "user_id": str(current_user["_id"])
+            "user_id": str(current_user["_id"]),
+            "deleted_at": None
         })
         if not current_project:
             raise HTTPException(status_code=404, detail="Project not found")
@@ -218,6 +438,7 @@ async def update_project(
                                 "project_id": str(project_id),
                                 "$or": [
                                     {"annotations.entity": old_name},
+                                    {"annotations_compact.classes": old_name},
                                     {"entities.label": old_name}
                                 ]
                             })
@@ -228,6 +449,7 @@ async def update_project(
                                 "project_id": str(project_id),
                                 "$or": [
                                     {"annotations.entity": old_name},
+                                    {"annotations_compact.classes": old_name},
                                     {"entities.label": old_name}
                                 ]
                             })
@@ -237,11 +459,11 @@ async def update_project(
                                 try:
                                     needs_update = False
                                     # Update annotations
-                                    if "annotations" in doc:
-                                        for ann in doc["annotations"]:
-                                            if ann["entity"] == old_name:
-                                                ann["entity"] = new_name
-                                                needs_update = True
+                                    annotations = document_annotations(doc)
+                                    for ann in annotations:
+                                        if ann["entity"] == old_name:
+                                            ann["entity"] = new_name
+                                            needs_update = True
                                     
                                     # Update entities
                                     if "entities" in doc:
@@ -252,24 +474,35 @@ async def update_project(
                                     
                                     # Save the updated document only if changes were made
                                     if needs_update:
+                                        stored = storage_fields(
+                                            annotations,
+                                            doc.get("text") or "",
+                                            project_class_names(update_data)
+                                        )
                                         update_result = documents_collection.update_one(
                                             {"_id": doc["_id"]},
                                             {
                                                 "$set": {
-                                                    "annotations": doc["annotations"],
-                                                    "entities": doc["entities"],
+                                                    **stored,
+                                                    "entities": doc.get("entities", []),
                                                     "updated_at": datetime.utcnow()
-                                                }
+                                                },
+                                                "$unset": unset_fields(stored),
+                                                "$inc": {"version": 1}
                                             }
                                         )
                                         if update_result.modified_count > 0:
                                             updated_docs += 1
+                                            entry = record_replace(doc["_id"], project_id, (doc.get("version") or 0) + 1, current_user)
+                                            await collaboration_hub.publish(entry)
                                             print(f"Updated document {doc['_id']} with new entity name")
                                 except Exception as doc_error:
                                     print(f"Error updating document {doc['_id']}: {str(doc_error)}")
                                     continue
                             
                             total_updated_docs += updated_docs
+                            rename_entity(project_id, old_name, new_name)
+                            rename_entity_counters(project_id, old_name, new_name)
                             print(f"Updated {updated_docs} documents for entity rename {old_name} -> {new_name}")
                             break
         
@@ -277,7 +510,8 @@ async def update_project(
         result = projects_collection.find_one_and_update(
             {
                 "_id": ObjectId(project_id),
-                "user_id": str(current_user["_id"])
+                "user_id": str(current_user["_id"]),
+                "deleted_at": None
             },
             {"$set": update_data},
             return_document=True
@@ -292,6 +526,7 @@ async def update_project(
             "name": result["name"],
             "description": result.get("description"),
             "entity_classes": result.get("entity_classes", []),
+            "llm_backend": result.get("llm_backend"),
             "user_id": result["user_id"],
             "created_at": result["created_at"],
             "updated_at": result["updated_at"],
@@ -308,23 +543,44 @@ async def update_project(
 
 @router.delete("/{project_id}")
 async def delete_project(project_id: str, current_user = Depends(get_current_user)):
+    """
+    Delete a project and its documents.
+
+    The project is marked deleted and disappears from every read at once; its
+    documents are purged in throttled batches by a background job whose
+    progress is available at GET /api/projects/deletion-jobs/{job_id}.
+    """
     try:
-        # Convert string ID to ObjectId
-        project_obj_id = ObjectId(project_id)
-        
-        # Delete all documents associated with this project first
-        docs_result = documents_collection.delete_many({"project_id": project_id})
-        
-        # Delete the project
-        project_result = projects_collection.delete_one({"_id": project_obj_id})
-        
-        if project_result.deleted_count == 0:
+        project = projects_collection.find_one_and_update(
+            {
+                "_id": ObjectId(project_id),
+                "user_id": str(current_user["_id"]),
+                "deleted_at": None
+            },
+            {"$set": {"deleted_at": datetime.utcnow()}}
+        )
+        if not project:
             raise HTTPException(status_code=404, detail="Project not found")
+        
+        document_count = get_project_counters(project_id)["documents"]
+        job_id = create_deletion_job("project", current_user["_id"], [project_id], document_count)
+        start_deletion_job(job_id)
             
         return {
-            "message": f"Project and {docs_result.deleted_count} associated documents deleted successfully"
+            "message": f"Project deleted; {document_count} associated documents are being removed",
+            "job_id": job_id
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error deleting project: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/deletion-jobs/{job_id}")
+async def get_deletion_job_status(job_id: str, current_user = Depends(get_current_user)):
+    """Progress of a background delete: status, documents deleted so far and total."""
+    job = get_deletion_job(job_id, current_user["_id"])
+    if not job:
+        raise HTTPException(status_code=404, detail="Deletion job not found")
+    return MongoJSONResponse(job)
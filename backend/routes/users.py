@@ -1,22 +1,36 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends, BackgroundTasks
 from fastapi.responses import JSONResponse
 from typing import Optional
-import os
 from datetime import datetime
 from models.user import UserUpdate, UserPasswordUpdate, UserInDB, UserResponse
 from config.database import users_collection, ADMIN_PASSWORD
 from utils.auth import get_password_hash, verify_password, get_current_user
 from bson import ObjectId
 from pydantic import BaseModel, EmailStr
+from config.uploads_config import PROFILE_PICTURE_FOLDER, PROFILE_PICTURE_MAX_BYTES, PROFILE_THUMBNAIL_SIZES
+from utils.images import save_upload_hashed, generate_thumbnails, remove_images, UploadTooLarge, InvalidImage
 
 router = APIRouter()
 
-UPLOAD_FOLDER = 'uploads/profile_pictures'
+UPLOAD_FOLDER = PROFILE_PICTURE_FOLDER
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
 def allowed_file(filename: str) -> bool:
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def create_profile_thumbnails(user_id, filename: str) -> None:
+    """Background task: thumbnail a new profile picture and record the variants."""
+    thumbnails = generate_thumbnails(UPLOAD_FOLDER, filename, PROFILE_THUMBNAIL_SIZES)
+    if not thumbnails:
+        return
+    result = users_collection.update_one(
+        {"_id": user_id, "profile_picture": filename},
+        {"$set": {"profile_picture_thumbnails": thumbnails}}
+    )
+    if result.matched_count == 0:
+        # The picture was replaced meanwhile
+        remove_images(UPLOAD_FOLDER, thumbnails.values())
+
 class ForgotPasswordRequest(BaseModel):
     email: EmailStr
     admin_password: str
@@ -46,11 +60,13 @@ async def get_profile(current_user: dict = Depends(get_current_user)):
         "email": user.get("email", ""),
         "about_me": user.get("about_me", ""),
         "profile_picture": user.get("profile_picture", ""),
+        "profile_picture_thumbnails": user.get("profile_picture_thumbnails", {}),
         "created_at": user.get("created_at", datetime.utcnow())
     }
 
 @router.put("/profile")
 async def update_profile(
+    background_tasks: BackgroundTasks,
     about_me: Optional[str] = Form(""),
     username: Optional[str] = Form(""),
     email: Optional[str] = Form(None),
@@ -60,6 +76,7 @@ async def update_profile(
     try:
         update_data = {"updated_at": datetime.utcnow()}
         response_data = {}
+        old_pictures = []
         
         # Validate username if provided
         if username:
@@ -92,26 +109,26 @@ async def update_profile(
             if not allowed_file(profile_picture.filename):
                 raise HTTPException(status_code=400, detail="Invalid file type")
             
-            # Create upload folder if it doesn't exist
-            if not os.path.exists(UPLOAD_FOLDER):
-                os.makedirs(UPLOAD_FOLDER)
+            # Stream the new picture to disk under a content-hashed name
+            extension = profile_picture.filename.rsplit('.', 1)[1].lower()
+            try:
+                filename, _ = await save_upload_hashed(
+                    profile_picture, UPLOAD_FOLDER, str(current_user['_id']), extension, PROFILE_PICTURE_MAX_BYTES
+                )
+            except UploadTooLarge as e:
+                raise HTTPException(status_code=413, detail=str(e))
+            except InvalidImage as e:
+                raise HTTPException(status_code=400, detail=str(e))
             
-            # Delete old profile picture if it exists
+            # Old picture and thumbnails are removed once the new one is recorded
             user = users_collection.find_one({"_id": current_user["_id"]})
-            if user and user.get("profile_picture"):
-                old_picture_path = os.path.join(UPLOAD_FOLDER, user["profile_picture"])
-                if os.path.exists(old_picture_path):
-                    os.remove(old_picture_path)
-            
-            # Save new profile picture
-            filename = f"{str(current_user['_id'])}_{profile_picture.filename}"
-            file_path = os.path.join(UPLOAD_FOLDER, filename)
-            with open(file_path, "wb") as buffer:
-                content = await profile_picture.read()
-                buffer.write(content)
+            if user and user.get("profile_picture") and user["profile_picture"] != filename:
+                old_pictures = [user["profile_picture"], *user.get("profile_picture_thumbnails", {}).values()]
+                update_data["profile_picture_thumbnails"] = {}
             
             update_data["profile_picture"] = filename
             response_data["profile_picture"] = filename
+            background_tasks.add_task(create_profile_thumbnails, current_user["_id"], filename)
         
         # Always update about_me, even if empty
         update_data["about_me"] = about_me
@@ -136,10 +153,14 @@ async def update_profile(
         if result.modified_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
         
+        remove_images(UPLOAD_FOLDER, old_pictures)
+        
         return JSONResponse(
             content={"message": "Profile updated successfully", "data": response_data},
             status_code=200
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
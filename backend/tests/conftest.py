@@ -0,0 +1,23 @@
+"""
+Run the app against the in-memory mongomock stand-in (see benchmarks/harness.py).
+
+Needs ../requirements.txt and tests/requirements.txt (pytest, mongomock, httpx).
+"""
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+os.environ.update({
+    "MONGODB_URL": "mongodb://localhost:27017",
+    "MONGODB_DB_NAME": "smartannotate_test",
+    "MONGODB_COLLECTION": "documents",
+    "OLLAMA_WARMUP_ON_STARTUP": "False",
+})
+
+import mongomock  # noqa: E402
+import pymongo  # noqa: E402
+
+pymongo.MongoClient = mongomock.MongoClient
@@ -0,0 +1,67 @@
+import tempfile
+
+import pytest
+from bson import ObjectId
+
+import utils.dataset_import as dataset_import
+from config.database import documents_collection
+from utils.dataset_import import decoded_lines, import_records, parse_conll, parse_jsonl
+
+
+def spooled(data: bytes):
+    # What Starlette's UploadFile.file is; before Python 3.11 it has no readable()
+    file = tempfile.SpooledTemporaryFile()
+    file.write(data)
+    file.seek(0)
+    return file
+
+
+@pytest.mark.parametrize("read_size", [1, 3, 64 * 1024])
+@pytest.mark.parametrize("encoding", ["utf-8-sig", "utf-16"])
+def test_decoded_lines_split_on_newlines_only(monkeypatch, read_size, encoding):
+    monkeypatch.setattr(dataset_import, "IMPORT_READ_SIZE", read_size)
+    text = '{"text": "a b"}\r\nλ\n\nlast'
+
+    lines = list(decoded_lines(spooled(text.encode(encoding)), encoding))
+
+    assert lines == ['{"text": "a b"}\r', "λ", "", "last"]
+
+
+def test_decoded_lines_feed_the_parsers():
+    data = "-DOCSTART- -X- O\n\nAlice B-PER\nmet O\n".encode("utf-8")
+
+    [(line_no, record)] = list(parse_conll(decoded_lines(spooled(data))))
+
+    assert line_no == 3
+    assert record["text"] == "Alice met"
+    assert record["annotations"] == [(0, 5, "PER")]
+
+
+def test_decoded_lines_reject_invalid_bytes():
+    with pytest.raises(UnicodeDecodeError):
+        list(decoded_lines(spooled(b"ok\n\xff\xfe\xfa"), "utf-8"))
+
+
+def import_file(data: bytes, encoding: str):
+    project = {"_id": ObjectId(), "entity_classes": [{"name": "PER"}]}
+    lines = decoded_lines(spooled(data), encoding, "surrogateescape")
+    report = import_records(project, parse_jsonl(lines), "import.jsonl")
+    return report, documents_collection.count_documents({"project_id": str(project["_id"])})
+
+
+def test_undecodable_lines_fail_on_their_own():
+    data = b'{"text": "one"}\n{"text": "bad \xff byte"}\n{"text": "three"}\n'
+
+    report, stored = import_file(data, "utf-8-sig")
+
+    assert (report["imported_count"], report["failed_count"], stored) == (2, 1, 2)
+    assert report["errors"][0]["line"] == 2
+
+
+def test_a_file_that_stops_decoding_keeps_what_was_imported():
+    data = '{"text": "one"}\n{"text": "two"}\n'.encode("utf-16") + b"A"
+
+    report, stored = import_file(data, "utf-16")
+
+    assert (report["imported_count"], report["failed_count"], stored) == (2, 1, 2)
+    assert report["errors"][0]["line"] is None
@@ -0,0 +1,40 @@
+from fastapi.testclient import TestClient
+
+import main
+
+client = TestClient(main.app)
+
+
+def test_metrics_endpoint_renders_prometheus_text():
+    client.get("/api/metrics")
+    response = client.get("/api/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = response.text
+    assert "# TYPE http_requests_total counter" in body
+    assert "# TYPE http_request_duration_seconds histogram" in body
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/api/metrics",le="+Inf"}' in body
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/metrics"}' in body
+
+
+def test_requests_are_labelled_with_the_route_template():
+    document_id = "65a0000000000000000000ff"
+    client.get(f"/api/documents/{document_id}")
+    client.get("/no/such/route")
+
+    body = client.get("/api/metrics").text
+
+    assert 'http_requests_total{method="GET",route="/api/documents/{document_id}",status="401"}' in body
+    assert 'route="<unmatched>",status="404"' in body
+    assert document_id not in body
+
+
+def test_mongo_report_requires_login():
+    assert client.get("/api/metrics/mongo").status_code == 401
+
+    client.post("/api/auth/register", json={"email": "metrics@example.com", "username": "metrics", "password": "pw"})
+    token = client.post("/api/auth/token", data={"username": "metrics@example.com", "password": "pw"}).json()["access_token"]
+    response = client.get("/api/metrics/mongo", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 200
@@ -0,0 +1,139 @@
+"""Materialized annotation index: one row per span in the `annotations` collection.
+
+Documents keep their annotations as the source of truth; this module
+mirrors them into flat rows `(project_id, entity, norm_text, document_id,
+offsets)` so entity-level questions ("all ORG spans containing 'Acme'") are
+answered from an index instead of unwinding every document. Every write path
+that changes a document's spans must call one of the sync helpers below.
+"""
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import DeleteMany, InsertOne
+
+from config.database import annotations_collection, documents_collection
+from utils.compact_annotations import document_annotations
+
+WHITESPACE = re.compile(r"\s+")
+
+# Documents read per batch when rebuilding a project's rows
+REBUILD_BATCH_SIZE = 500
+
+
+def normalize_span_text(text: str) -> str:
+    """Case-fold and collapse whitespace so lookups ignore formatting differences."""
+    return WHITESPACE.sub(" ", (text or "").strip()).casefold()
+
+
+def span_rows(document_id: str, project_id: str, annotations: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Turn a document's annotations into index rows."""
+    rows = []
+    for annotation in annotations or []:
+        text = annotation.get("text", "")
+        rows.append({
+            "project_id": str(project_id),
+            "document_id": str(document_id),
+            "entity": annotation.get("entity"),
+            "text": text,
+            "norm_text": normalize_span_text(text),
+            "start_index": annotation.get("start_index"),
+            "end_index": annotation.get("end_index"),
+        })
+    return rows
+
+
+def sync_document_annotations(document_id: str, project_id: str, annotations: Iterable[Dict[str, Any]]) -> None:
+    """Replace the index rows of one document with its current annotations."""
+    sync_documents([{"_id": document_id, "project_id": project_id, "annotations": annotations}])
+
+
+def sync_documents(documents: Iterable[Dict[str, Any]]) -> None:
+    """
+    Replace the index rows of several documents in one bulk write.
+
+    Args:
+        documents: Records with `_id` (or `id`), `project_id` and their annotations
+    """
+    operations = []
+    for doc in documents:
+        document_id = str(doc.get("_id", doc.get("id")))
+        operations.append(DeleteMany({"document_id": document_id}))
+        operations.extend(InsertOne(row) for row in span_rows(document_id, doc["project_id"], document_annotations(doc)))
+    if operations:
+        annotations_collection.bulk_write(operations, ordered=True)
+
+
+def index_new_documents(documents: Iterable[Dict[str, Any]]) -> None:
+    """Add rows for freshly inserted documents (nothing to replace, so no deletes)."""
+    rows = [row for doc in documents for row in span_rows(doc["_id"], doc["project_id"], document_annotations(doc))]
+    if rows:
+        annotations_collection.insert_many(rows, ordered=False)
+
+
+def remove_document_annotations(document_ids: Iterable[str]) -> int:
+    """Delete the index rows of the given documents."""
+    ids = [str(document_id) for document_id in document_ids]
+    if not ids:
+        return 0
+    return annotations_collection.delete_many({"document_id": {"$in": ids}}).deleted_count
+
+
+def remove_project_annotations(project_id: str) -> int:
+    """Delete every index row of a project."""
+    return annotations_collection.delete_many({"project_id": str(project_id)}).deleted_count
+
+
+def rename_entity(project_id: str, old_name: str, new_name: str) -> int:
+    """Apply an entity class rename to the index rows of a project."""
+    result = annotations_collection.update_many(
+        {"project_id": str(project_id), "entity": old_name},
+        {"$set": {"entity": new_name}}
+    )
+    return result.modified_count
+
+
+def rebuild_project_annotations(project_id: str, batch_size: int = REBUILD_BATCH_SIZE) -> int:
+    """
+    Cold rebuild of a project's rows from its documents, e.g. for data written
+    before the index existed. Returns the number of rows written.
+    """
+    remove_project_annotations(project_id)
+    cursor = documents_collection.find(
+        {"project_id": str(project_id), "deleted_at": None},
+        {"project_id": 1, "text": 1, "annotations": 1, "annotations_compact": 1}
+    )
+    rows_written = 0
+    batch: List[Dict[str, Any]] = []
+    for doc in cursor:
+        batch.extend(span_rows(str(doc["_id"]), doc["project_id"], document_annotations(doc)))
+        if len(batch) >= batch_size:
+            annotations_collection.insert_many(batch, ordered=False)
+            rows_written += len(batch)
+            batch = []
+    if batch:
+        annotations_collection.insert_many(batch, ordered=False)
+        rows_written += len(batch)
+    return rows_written
+
+
+def build_span_filter(project_id: str, entity: Optional[str] = None, text: Optional[str] = None, match: str = "contains") -> Dict[str, Any]:
+    """
+    Filter for span queries.
+
+    Args:
+        entity: Entity class to restrict to
+        text: Span text to look for (normalized like the stored rows)
+        match: "exact", "prefix" (index range scan) or "contains"
+    """
+    span_filter: Dict[str, Any] = {"project_id": str(project_id)}
+    if entity:
+        span_filter["entity"] = entity
+    if text:
+        normalized = normalize_span_text(text)
+        if match == "exact":
+            span_filter["norm_text"] = normalized
+        elif match == "prefix":
+            span_filter["norm_text"] = {"$regex": "^" + re.escape(normalized)}
+        else:
+            span_filter["norm_text"] = {"$regex": re.escape(normalized)}
+    return span_filter
@@ -0,0 +1,265 @@
+"""Versioned annotation operations for collaborative editing.
+
+Every change to a document's annotations increments its `version` and is
+appended to the `annotation_ops` log, one entry per version: small span
+operations sent over the collaboration channel (kind "ops"), or "replace"
+for writes of the whole annotation list (PUT /documents/{id}, entity
+renames).
+
+Operations:
+
+    {"op": "add",    "annotation": {"start_index", "end_index", "entity"[, "text"]}}
+    {"op": "remove", "annotation": {"start_index", "end_index", "entity"}}
+    {"op": "update", "from": {...}, "to": {...}}
+
+A client sends operations with the version it last saw (`base_version`).
+The log says what others changed since then; an operation whose span
+overlaps a span they touched is rejected as a conflict (the first writer
+wins, per span), and after a "replace" all are. Operations on the rest of
+the document apply whatever the version, so annotators working on different
+parts never block each other and nobody silently overwrites anyone. Unless
+ANNOTATION_OVERLAPS is "allow", a span overlapping another annotation is
+rejected as "overlap".
+"""
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+
+from config.database import annotation_ops_collection, documents_collection
+from config.annotation_validation_config import ANNOTATION_OVERLAPS
+from utils.annotation_index import sync_document_annotations
+from utils.annotation_validation import span_sort_key
+from utils.compact_annotations import document_annotations, storage_fields, unset_fields
+from utils.project_stats import apply_document_update
+
+OP_TYPES = ("add", "remove", "update")
+
+# Attempts at committing against a document that keeps changing underneath
+COMMIT_ATTEMPTS = 5
+
+# A commit that moved the version writes its log entry right after; readers
+# missing the newest entry wait this long for it before treating it as lost
+LOG_ENTRY_WAIT_SECONDS = 0.5
+
+
+class OpsError(ValueError):
+    """The operations cannot be applied at all (unknown document, bad message)."""
+
+
+def span_key(annotation: Dict[str, Any]) -> Tuple[int, int, str]:
+    return (annotation.get("start_index"), annotation.get("end_index"), annotation.get("entity"))
+
+
+def _span(annotation: Any, text: str) -> Dict[str, Any]:
+    """A validated annotation, with its text taken from the document."""
+    if not isinstance(annotation, dict):
+        raise ValueError("annotation must be an object")
+    start, end, entity = annotation.get("start_index"), annotation.get("end_index"), annotation.get("entity")
+    if not isinstance(start, int) or not isinstance(end, int) or not 0 <= start < end <= len(text):
+        raise ValueError(f"span {start}-{end} is outside the text")
+    if not isinstance(entity, str) or not entity:
+        raise ValueError("entity is required")
+    span_text = text[start:end]
+    if annotation.get("text") not in (None, span_text):
+        raise ValueError(f"text does not match the document at {start}-{end}")
+    return {"start_index": start, "end_index": end, "entity": entity, "text": span_text}
+
+
+def normalize_op(op: Any, text: str) -> Dict[str, Any]:
+    """
+    Validate one operation against the document text.
+
+    Raises:
+        ValueError: Unknown operation or a span that does not fit the text
+    """
+    if not isinstance(op, dict) or op.get("op") not in OP_TYPES:
+        raise ValueError(f"op must be one of {', '.join(OP_TYPES)}")
+    if op["op"] == "update":
+        return {"op": "update", "from": _span(op.get("from"), text), "to": _span(op.get("to"), text)}
+    return {"op": op["op"], "annotation": _span(op.get("annotation"), text)}
+
+
+def op_spans(op: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [op["from"], op["to"]] if op["op"] == "update" else [op["annotation"]]
+
+
+def _overlaps(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    return a["start_index"] < b["end_index"] and b["start_index"] < a["end_index"]
+
+
+def apply_op(annotations: List[Dict[str, Any]], op: Dict[str, Any]) -> Tuple[bool, Optional[str]]:
+    """
+    Apply one normalized operation in place.
+
+    Returns:
+        (whether the annotations changed, reason the operation was rejected or None)
+    """
+    keys = [span_key(annotation) for annotation in annotations]
+    if op["op"] == "add":
+        # Adding a span that is already there is a no-op, so retries are harmless
+        if span_key(op["annotation"]) in keys:
+            return False, None
+        annotations.append(op["annotation"])
+        return True, None
+    target = op["annotation"] if op["op"] == "remove" else op["from"]
+    if span_key(target) not in keys:
+        return False, "missing"
+    index = keys.index(span_key(target))
+    if op["op"] == "remove":
+        del annotations[index]
+    elif span_key(op["to"]) in keys and span_key(op["to"]) != span_key(target):
+        del annotations[index]
+    else:
+        annotations[index] = op["to"]
+    return True, None
+
+
+def _overlaps_existing(annotations: List[Dict[str, Any]], op: Dict[str, Any]) -> bool:
+    """Whether an added or updated span would overlap another annotation."""
+    span = op["annotation"] if op["op"] == "add" else op["to"]
+    ignored = {span_key(other) for other in op_spans(op)}
+    return any(_overlaps(span, other) for other in annotations if span_key(other) not in ignored)
+
+
+def version_filter(version: int) -> Dict[str, Any]:
+    # Documents written before versioning have no version field
+    return {"version": version} if version else {"version": {"$in": [0, None]}}
+
+
+def ops_since(document_id: str, base_version: int, version: int) -> Optional[List[Dict[str, Any]]]:
+    """
+    Log entries after `base_version` up to `version`, in order.
+
+    Returns:
+        None when the log no longer has all of them (expired or lost)
+    """
+    if base_version >= version:
+        return []
+    deadline = time.monotonic() + LOG_ENTRY_WAIT_SECONDS
+    while True:
+        entries = list(annotation_ops_collection.find(
+            {"document_id": str(document_id), "version": {"$gt": base_version, "$lte": version}}
+        ).sort("version", 1))
+        if len(entries) == version - base_version:
+            return entries
+        if time.monotonic() > deadline:
+            return None
+        time.sleep(0.05)
+
+
+def _log_entry(document_id: str, project_id: str, version: int, kind: str, user: Optional[Dict[str, Any]], client_id: Optional[str], ops: List[Dict[str, Any]]) -> Dict[str, Any]:
+    entry = {
+        "document_id": str(document_id),
+        "project_id": str(project_id),
+        "version": version,
+        "kind": kind,
+        "ops": ops,
+        "user_id": str(user["_id"]) if user else None,
+        "username": user.get("username") if user else None,
+        "client_id": client_id,
+        "created_at": datetime.utcnow(),
+    }
+    annotation_ops_collection.insert_one(entry)
+    return entry
+
+
+def record_replace(document_id: str, project_id: str, version: int, user: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Log a write of the whole annotation list that produced `version`."""
+    return _log_entry(document_id, project_id, version, "replace", user, None, [])
+
+
+def commit_ops(document_id: str, ops: List[Any], base_version: int, user: Dict[str, Any], client_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Apply a client's operations to the current annotations and log them.
+
+    Args:
+        base_version: Version the client's view of the document is based on
+        client_id: Connection of the client; its own earlier operations never conflict
+
+    Returns:
+        {"version", "applied", "rejected": [{"op", "reason", ["detail"]}],
+        "entry": the log entry, or None when nothing changed}
+
+    Raises:
+        OpsError: Unknown document, or a base_version the document never had
+    """
+    for _ in range(COMMIT_ATTEMPTS):
+        doc = documents_collection.find_one({"_id": ObjectId(document_id), "deleted_at": None})
+        if not doc:
+            raise OpsError("Document not found")
+        version = doc.get("version") or 0
+        if base_version > version or base_version < 0:
+            raise OpsError(f"Document has no version {base_version} (current is {version})")
+        text = doc.get("text") or ""
+
+        entries = ops_since(document_id, base_version, version)
+        if entries is None:
+            # Cannot tell what changed since the client's version: it has to resync
+            return {
+                "version": version,
+                "applied": [],
+                "rejected": [{"op": op, "reason": "stale"} for op in ops],
+                "entry": None,
+            }
+        replaced = any(entry["kind"] == "replace" for entry in entries)
+        touched = [
+            span
+            for entry in entries if entry.get("client_id") is None or entry["client_id"] != client_id
+            for op in entry["ops"] for span in op_spans(op)
+        ]
+
+        annotations = [dict(annotation) for annotation in document_annotations(doc)]
+        applied, rejected, changed = [], [], False
+        for op in ops:
+            try:
+                op = normalize_op(op, text)
+            except ValueError as e:
+                rejected.append({"op": op, "reason": "invalid", "detail": str(e)})
+                continue
+            if replaced or any(_overlaps(span, other) for span in op_spans(op) for other in touched):
+                rejected.append({"op": op, "reason": "conflict"})
+                continue
+            if ANNOTATION_OVERLAPS != "allow" and op["op"] != "remove" and _overlaps_existing(annotations, op):
+                rejected.append({"op": op, "reason": "overlap"})
+                continue
+            op_changed, reason = apply_op(annotations, op)
+            if reason:
+                rejected.append({"op": op, "reason": reason})
+                continue
+            applied.append(op)
+            changed = changed or op_changed
+
+        if not changed:
+            return {"version": version, "applied": applied, "rejected": rejected, "entry": None}
+        # Saved annotations are kept sorted like whole-list saves (see utils/annotation_validation.py)
+        annotations.sort(key=span_sort_key)
+
+        stored = storage_fields(annotations, text, (doc.get("annotations_compact") or {}).get("classes"), doc["project_id"])
+        result = documents_collection.update_one(
+            {"_id": doc["_id"], **version_filter(version)},
+            {"$set": {**stored, "updated_at": datetime.utcnow()}, "$unset": unset_fields(stored), "$inc": {"version": 1}}
+        )
+        if result.modified_count == 0:
+            # Someone committed in between: check the operations against that too
+            continue
+        entry = _log_entry(document_id, doc["project_id"], version + 1, "ops", user, client_id, applied)
+        sync_document_annotations(document_id, doc["project_id"], annotations)
+        apply_document_update(doc["project_id"], doc, {**doc, "annotations_compact": None, "annotations": annotations})
+        return {"version": version + 1, "applied": applied, "rejected": rejected, "entry": entry}
+
+    raise OpsError("Document is changing too quickly; try again")
+
+
+def entry_message(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """The event sent to collaborators for one log entry."""
+    return {
+        "type": "ops" if entry["kind"] == "ops" else "replaced",
+        "document_id": entry["document_id"],
+        "project_id": entry["project_id"],
+        "version": entry["version"],
+        "ops": entry["ops"],
+        "user": {"id": entry.get("user_id"), "username": entry.get("username")},
+        "client_id": entry.get("client_id"),
+    }
@@ -0,0 +1,113 @@
+"""Validation and normalization of a document's annotations on write.
+
+Every save of a whole annotation list goes through `normalize_annotations`,
+so stored annotations are always:
+
+    in bounds     0 <= start_index < end_index <= len(text)
+    consistent    `text` is text[start_index:end_index] (filled in when missing)
+    sorted        by (start_index, end_index, entity)
+    unique        exact duplicates removed
+    overlap-free  unless ANNOTATION_OVERLAPS is "allow"
+
+Spans are checked one by one, sorted once and swept in order keeping the
+furthest end seen so far, which finds every overlap in O(n log n) without
+comparing pairs.
+"""
+from typing import Any, Dict, Iterable, List, Tuple
+
+from config.annotation_validation_config import ANNOTATION_INVALID_SPANS, ANNOTATION_OVERLAPS
+
+INVALID_POLICIES = ("reject", "drop")
+OVERLAP_POLICIES = ("allow", "reject", "drop")
+
+# Problems described in an error; the rest are only counted
+MAX_REPORTED_ISSUES = 20
+
+
+class AnnotationError(ValueError):
+    """Annotations that cannot be saved under the configured policies."""
+
+    def __init__(self, issues: List[Dict[str, Any]], counts: Dict[str, int]):
+        self.issues = issues
+        self.counts = counts
+        summary = ", ".join(f"{count} {reason.replace('_', ' ')}" for reason, count in sorted(counts.items()))
+        super().__init__(f"Invalid annotations: {summary}")
+
+
+def span_sort_key(annotation: Dict[str, Any]) -> Tuple[int, int, str]:
+    return (annotation["start_index"], annotation["end_index"], annotation["entity"])
+
+
+def normalize_annotations(
+    annotations: Iterable[Dict[str, Any]],
+    text: str,
+    invalid: str = ANNOTATION_INVALID_SPANS,
+    overlaps: str = ANNOTATION_OVERLAPS
+) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """
+    Check annotations against the document text and bring them into canonical form.
+
+    Args:
+        annotations: Annotation dicts in any order
+        invalid: Policy for out-of-bounds spans and text mismatches ("reject" or "drop")
+        overlaps: Policy for overlapping spans ("allow", "reject" or "drop")
+
+    Returns:
+        (normalized annotations, number of spans removed by reason: "duplicate",
+        and with the "drop" policies "out_of_bounds", "invalid_entity",
+        "text_mismatch", "overlap")
+
+    Raises:
+        AnnotationError: A problem under a "reject" policy
+    """
+    text = text or ""
+    length = len(text)
+    counts: Dict[str, int] = {}
+    issues: List[Dict[str, Any]] = []
+    rejected = False
+
+    def problem(index: int, reason: str, detail: str, policy: str) -> None:
+        nonlocal rejected
+        counts[reason] = counts.get(reason, 0) + 1
+        if policy == "reject":
+            rejected = True
+            if len(issues) < MAX_REPORTED_ISSUES:
+                issues.append({"index": index, "reason": reason, "detail": detail})
+
+    spans = []
+    for index, annotation in enumerate(annotations):
+        start, end, entity = annotation.get("start_index"), annotation.get("end_index"), annotation.get("entity")
+        # bool is an int subclass, but never an offset
+        if type(start) is not int or type(end) is not int or not 0 <= start < end <= length:
+            problem(index, "out_of_bounds", f"span [{start}, {end}) is outside the text (length {length})", invalid)
+            continue
+        if not isinstance(entity, str) or not entity:
+            problem(index, "invalid_entity", f"span [{start}, {end}) has no entity", invalid)
+            continue
+        span_text = text[start:end]
+        given = annotation.get("text")
+        if given is not None and given != span_text:
+            problem(index, "text_mismatch", f"span [{start}, {end}) is {span_text!r} in the text, not {given!r}", invalid)
+            continue
+        spans.append((start, end, entity, index, span_text))
+    spans.sort()
+
+    normalized = []
+    previous = None
+    # Furthest end of the spans kept so far: a span starting before it overlaps one of them
+    reach, reach_index = 0, None
+    for start, end, entity, index, span_text in spans:
+        if (start, end, entity) == previous:
+            counts["duplicate"] = counts.get("duplicate", 0) + 1
+            continue
+        previous = (start, end, entity)
+        if start < reach and overlaps != "allow":
+            problem(index, "overlap", f"span [{start}, {end}) overlaps span {reach_index}", overlaps)
+            continue
+        if end > reach:
+            reach, reach_index = end, index
+        normalized.append({"start_index": start, "end_index": end, "entity": entity, "text": span_text})
+
+    if rejected:
+        raise AnnotationError(issues, {reason: count for reason, count in counts.items() if reason != "duplicate"})
+    return normalized, counts
@@ -17,6 +17,8 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 # Update token URL to match the API prefix
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/token")
+# For routes that also serve anonymous callers
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/token", auto_error=False)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -34,6 +36,22 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def user_from_token(token: Optional[str]):
+    """
+    The user an access token belongs to, or None if it is not valid.
+
+    For WebSocket handshakes, where browsers cannot send an Authorization
+    header and the token comes as a query parameter.
+    """
+    try:
+        payload = jwt.decode(token or "", SECRET_KEY, algorithms=[ALGORITHM])
+        user_id = payload.get("sub")
+        if user_id is None or not ObjectId.is_valid(user_id):
+            return None
+    except JWTError:
+        return None
+    return users_collection.find_one({"_id": ObjectId(user_id)})
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=401,
@@ -52,3 +70,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     if user is None:
         raise credentials_exception
     return user
+
+async def get_optional_user(token: Optional[str] = Depends(optional_oauth2_scheme)):
+    """The user of the request's access token, or None when there is none or it is not valid."""
+    return user_from_token(token) if token else None
@@ -0,0 +1,264 @@
+"""Collaboration rooms: WebSocket fan-out of annotation changes and presence.
+
+Each worker keeps the WebSocket connections it accepted in rooms, one per
+document and one per project (a project room sees the changes and presence
+of all its documents). Entries of the annotation_ops log written by this
+worker are sent to its rooms right away. Entries and presence from other
+workers arrive through MongoDB: while a worker has connections, it polls the
+log and the `presence` collection of their projects every
+COLLAB_POLL_INTERVAL seconds.
+
+Events carry the document version they produce. A client that sees a
+version that is not one more than the last it knows missed something (e.g.
+it reconnected) and asks for the operations since its version ("sync").
+"""
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from fastapi import WebSocket
+from fastapi.encoders import jsonable_encoder
+from starlette.concurrency import run_in_threadpool
+
+from config.collaboration_config import COLLAB_POLL_INTERVAL, COLLAB_PRESENCE_TTL
+from config.database import annotation_ops_collection, presence_collection
+from utils.annotation_ops import entry_message
+from utils.metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+COLLAB_CONNECTIONS = Gauge(
+    "collab_connections",
+    "Open collaboration WebSocket connections in this worker",
+    ["room"],
+)
+COLLAB_EVENTS = Counter(
+    "collab_events_total",
+    "Collaboration events sent to clients, by type and origin (this worker or another)",
+    ["type", "origin"],
+)
+
+# Log entries already delivered, remembered so polling does not send them twice
+SEEN_ENTRIES = 10000
+
+# Entries are polled from a little before the previous poll, covering inserts
+# that were still in flight and clock differences between workers
+POLL_LOOKBACK = timedelta(seconds=2)
+
+
+class Connection:
+    """One client connected to a document or project room."""
+
+    def __init__(self, websocket: WebSocket, user: Dict[str, Any], project_id: str, document_id: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.websocket = websocket
+        self.user = user
+        self.project_id = str(project_id)
+        self.document_id = str(document_id) if document_id else None
+        # Presence state sent by the client: cursor, selection, ...
+        self.state: Dict[str, Any] = {}
+        self.touched_at = datetime.min
+        # Events are held back until the greeting is sent (see `open`)
+        self._pending: Optional[List[Dict[str, Any]]] = []
+
+    @property
+    def rooms(self) -> List[str]:
+        rooms = [f"project:{self.project_id}"]
+        if self.document_id:
+            rooms.append(f"document:{self.document_id}")
+        return rooms
+
+    async def _send_now(self, message: Dict[str, Any]) -> bool:
+        try:
+            await self.websocket.send_json(jsonable_encoder(message))
+            return True
+        except Exception:
+            return False
+
+    async def send(self, message: Dict[str, Any]) -> bool:
+        if self._pending is not None:
+            self._pending.append(message)
+            return True
+        return await self._send_now(message)
+
+    async def open(self, greeting: List[Dict[str, Any]]) -> None:
+        """
+        Send the greeting, then the events that arrived since joining.
+
+        The greeting is built after joining, so nothing is missed between
+        the two; events it already covers (versions up to the greeting's)
+        may arrive again and are ignored by clients.
+        """
+        self._pending[:0] = greeting
+        while self._pending:
+            if not await self._send_now(self._pending.pop(0)):
+                break
+        self._pending = None
+
+
+class CollaborationHub:
+    """Rooms of this worker and the poller that brings in other workers' events."""
+
+    def __init__(self, poll_interval: float = COLLAB_POLL_INTERVAL, presence_ttl: float = COLLAB_PRESENCE_TTL):
+        self.poll_interval = poll_interval
+        self.presence_ttl = presence_ttl
+        self.rooms: Dict[str, Set[Connection]] = defaultdict(set)
+        self.connections: Dict[str, Connection] = {}
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        # project_id -> {document_id or "": presence list last sent}
+        self._presence: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+        self._polled_at: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def join(self, connection: Connection) -> None:
+        self.connections[connection.id] = connection
+        for room in connection.rooms:
+            self.rooms[room].add(connection)
+            COLLAB_CONNECTIONS.inc(room=room.split(":")[0])
+        await run_in_threadpool(self._touch, connection)
+        if self._task is None:
+            self._polled_at = datetime.utcnow()
+            self._task = asyncio.ensure_future(self._run())
+        await self.broadcast_presence(connection.project_id)
+
+    async def leave(self, connection: Connection) -> None:
+        if self.connections.pop(connection.id, None) is None:
+            return
+        for room in connection.rooms:
+            self.rooms[room].discard(connection)
+            if not self.rooms[room]:
+                del self.rooms[room]
+            COLLAB_CONNECTIONS.dec(room=room.split(":")[0])
+        await run_in_threadpool(presence_collection.delete_one, {"_id": connection.id})
+        await self.broadcast_presence(connection.project_id)
+        if not any(c.project_id == connection.project_id for c in self.connections.values()):
+            self._presence.pop(connection.project_id, None)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _touch(self, connection: Connection) -> None:
+        """Write the connection's presence record with a fresh expiry."""
+        now = datetime.utcnow()
+        connection.touched_at = now
+        presence_collection.update_one({"_id": connection.id}, {"$set": {
+            "project_id": connection.project_id,
+            "document_id": connection.document_id,
+            "user_id": str(connection.user["_id"]),
+            "username": connection.user.get("username"),
+            "state": connection.state,
+            "expires_at": now + timedelta(seconds=self.presence_ttl),
+        }}, upsert=True)
+
+    async def update_presence(self, connection: Connection, state: Optional[Dict[str, Any]] = None) -> None:
+        """Refresh a connection's presence, with new client state if given."""
+        if state is not None:
+            connection.state = state
+        await run_in_threadpool(self._touch, connection)
+        if state is not None:
+            await self.broadcast_presence(connection.project_id)
+
+    def presence(self, project_id: str) -> Dict[str, List[Dict[str, Any]]]:
+        """Connections present in a project, per document ("" for the project room)."""
+        by_document: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        records = presence_collection.find(
+            {"project_id": str(project_id), "expires_at": {"$gt": datetime.utcnow()}}
+        ).sort("_id", 1)
+        for record in records:
+            by_document[record.get("document_id") or ""].append({
+                "connection_id": record["_id"],
+                "user": {"id": record.get("user_id"), "username": record.get("username")},
+                "state": record.get("state") or {},
+            })
+        return by_document
+
+    async def broadcast_presence(self, project_id: str) -> None:
+        """Send the presence of every document of the project whose list changed."""
+        current = await run_in_threadpool(self.presence, project_id)
+        previous = self._presence.get(project_id, {})
+        self._presence[project_id] = current
+        for document_id in set(current) | set(previous):
+            users = current.get(document_id, [])
+            if users == previous.get(document_id, []):
+                continue
+            rooms = [f"project:{project_id}"] + ([f"document:{document_id}"] if document_id else [])
+            await self.broadcast(rooms, {
+                "type": "presence",
+                "project_id": project_id,
+                "document_id": document_id or None,
+                "users": users,
+            })
+
+    async def broadcast(self, rooms: Iterable[str], message: Dict[str, Any], exclude: Optional[str] = None) -> None:
+        targets = {c for room in rooms for c in self.rooms.get(room, ()) if c.id != exclude}
+        if not targets:
+            return
+        targets = list(targets)
+        results = await asyncio.gather(*(c.send(message) for c in targets))
+        for connection, sent in zip(targets, results):
+            if not sent:
+                await self.leave(connection)
+
+    async def publish(self, entry: Dict[str, Any], origin: str = "local") -> None:
+        """Send one log entry to its document and project rooms (not back to its author's connection)."""
+        key = str(entry["_id"])
+        if key in self._seen:
+            return
+        self._seen[key] = None
+        if len(self._seen) > SEEN_ENTRIES:
+            self._seen.popitem(last=False)
+        message = entry_message(entry)
+        COLLAB_EVENTS.inc(type=message["type"], origin=origin)
+        await self.broadcast(
+            [f"document:{entry['document_id']}", f"project:{entry['project_id']}"],
+            message,
+            exclude=entry.get("client_id"),
+        )
+
+    def _new_entries(self, project_ids: List[str], since: datetime) -> List[Dict[str, Any]]:
+        return list(annotation_ops_collection.find(
+            {"project_id": {"$in": project_ids}, "created_at": {"$gte": since}}
+        ).sort([("document_id", 1), ("version", 1)]))
+
+    async def poll(self) -> None:
+        """Deliver other workers' entries and presence changes, and keep our presence alive."""
+        project_ids = sorted({c.project_id for c in self.connections.values()})
+        if not project_ids:
+            return
+        now = datetime.utcnow()
+        since = (self._polled_at or now) - POLL_LOOKBACK
+        entries = await run_in_threadpool(self._new_entries, project_ids, since)
+        self._polled_at = now
+        for entry in entries:
+            await self.publish(entry, origin="remote")
+
+        stale = now - timedelta(seconds=self.presence_ttl / 3)
+        for connection in list(self.connections.values()):
+            if connection.touched_at < stale:
+                await run_in_threadpool(self._touch, connection)
+        for project_id in project_ids:
+            await self.broadcast_presence(project_id)
+
+    async def _run(self) -> None:
+        try:
+            while self.connections:
+                await asyncio.sleep(self.poll_interval)
+                try:
+                    await self.poll()
+                except Exception as e:
+                    logger.warning(f"Collaboration poll failed: {str(e)}")
+        finally:
+            self._task = None
+
+
+# Rooms of this worker, shared by the collaboration routes and every write path
+collaboration_hub = CollaborationHub()
@@ -0,0 +1,176 @@
+"""Compact (columnar) annotations: parallel arrays instead of one object per span.
+
+    {
+        "classes": ["PERSON", "ORG", ...],  entity class names, starting with the
+                                            project's entity_classes in their order
+        "start": [0, 17, ...],              start_index of each span
+        "end": [5, 21, ...],                end_index of each span
+        "entity": [0, 1, ...],              index into `classes` of each span
+        "text_index": [...], "text": [...]  only for spans whose text is not
+                                            text[start:end]: their positions and texts
+    }
+
+A span's text is derived from the document text on demand, so a dense
+document no longer repeats four keys and a copy of the substring per span.
+Conversion to and from the `Annotation` model is lossless: spans keep their
+order, class names missing from the project are appended to `classes`, and
+texts that do not match the document are kept as exceptions.
+
+Documents with at least COMPACT_ANNOTATIONS_MIN_SPANS spans are stored this
+way (`annotations_compact` instead of `annotations`). Code reading a
+document's spans goes through `document_annotations` and code writing them
+through `storage_fields`, so both forms work everywhere. Independently of
+storage, clients ask for the compact form with `annotation_format=compact`.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+
+from config.annotation_format_config import COMPACT_ANNOTATIONS_MIN_SPANS
+from config.database import projects_collection
+
+ANNOTATION_FORMATS = ("full", "compact")
+
+# Document fields that can hold the annotations; a document has one of them
+STORAGE_FIELDS = ("annotations", "annotations_compact")
+
+
+def _span_text(text: str, start: Any, end: Any) -> Optional[str]:
+    if isinstance(start, int) and isinstance(end, int) and 0 <= start <= end <= len(text):
+        return text[start:end]
+    return None
+
+
+def encode(annotations: Iterable[Dict[str, Any]], text: str, classes: Iterable[str] = ()) -> Dict[str, Any]:
+    """
+    Compact form of a document's annotations.
+
+    Args:
+        annotations: Annotation dicts (start_index, end_index, entity, text)
+        text: The document text the offsets refer to
+        classes: The project's entity class names; the entity indices refer to these
+    """
+    text = text or ""
+    table = list(dict.fromkeys(classes))
+    positions = {name: index for index, name in enumerate(table)}
+    start, end, entity, text_index, texts = [], [], [], [], []
+    for index, annotation in enumerate(annotations):
+        span_start, span_end, name = annotation["start_index"], annotation["end_index"], annotation["entity"]
+        if name not in positions:
+            positions[name] = len(table)
+            table.append(name)
+        start.append(span_start)
+        end.append(span_end)
+        entity.append(positions[name])
+        span_text = annotation.get("text")
+        if span_text != _span_text(text, span_start, span_end):
+            text_index.append(index)
+            texts.append(span_text)
+    compact = {"classes": table, "start": start, "end": end, "entity": entity}
+    if text_index:
+        compact["text_index"] = text_index
+        compact["text"] = texts
+    return compact
+
+
+def spans(compact: Dict[str, Any]) -> List[Tuple[int, int, str]]:
+    """
+    (start_index, end_index, entity) of each span, without deriving texts.
+
+    Raises:
+        ValueError: Malformed compact annotations
+    """
+    try:
+        classes, start, end, entity = compact["classes"], compact["start"], compact["end"], compact["entity"]
+    except (KeyError, TypeError):
+        raise ValueError("compact annotations need classes, start, end and entity")
+    if not len(start) == len(end) == len(entity):
+        raise ValueError("start, end and entity must have the same length")
+    if len(compact.get("text_index") or []) != len(compact.get("text") or []):
+        raise ValueError("text_index and text must have the same length")
+    for position, index in enumerate(entity):
+        if not isinstance(index, int) or not 0 <= index < len(classes):
+            raise ValueError(f"entity index {index} of span {position} is not in classes")
+    return [(span_start, span_end, classes[index]) for span_start, span_end, index in zip(start, end, entity)]
+
+
+def decode(compact: Dict[str, Any], text: str) -> List[Dict[str, Any]]:
+    """
+    Annotation dicts from the compact form, texts taken from the document.
+
+    Raises:
+        ValueError: Malformed compact annotations
+    """
+    text = text or ""
+    exceptions = dict(zip(compact.get("text_index") or [], compact.get("text") or []))
+    return [
+        {
+            "start_index": start,
+            "end_index": end,
+            "entity": entity,
+            "text": exceptions[index] if index in exceptions else _span_text(text, start, end),
+        }
+        for index, (start, end, entity) in enumerate(spans(compact))
+    ]
+
+
+def document_annotations(doc: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """A documents-collection record's annotations, whichever way they are stored."""
+    compact = doc.get("annotations_compact")
+    if compact is not None:
+        return decode(compact, doc.get("text") or "")
+    return doc.get("annotations") or []
+
+
+def document_compact_annotations(doc: Dict[str, Any], classes: Iterable[str] = ()) -> Dict[str, Any]:
+    """A record's annotations in compact form (as stored, or encoded against `classes`)."""
+    compact = doc.get("annotations_compact")
+    if compact is not None:
+        return compact
+    return encode(doc.get("annotations") or [], doc.get("text") or "", classes)
+
+
+def project_class_names(project: Optional[Dict[str, Any]]) -> List[str]:
+    return [entity["name"] for entity in (project or {}).get("entity_classes") or []]
+
+
+def stores_compact(span_count: int) -> bool:
+    return 0 < COMPACT_ANNOTATIONS_MIN_SPANS <= span_count
+
+
+def storage_fields(
+    annotations: List[Dict[str, Any]],
+    text: str,
+    classes: Optional[Iterable[str]] = None,
+    project_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    The document field holding `annotations`, in the form they are stored in.
+
+    Args:
+        classes: The project's entity class names; looked up by `project_id`
+            when not given and the document is stored compactly
+
+    Returns:
+        {"annotations": [...]} or {"annotations_compact": {...}}
+    """
+    if not stores_compact(len(annotations)):
+        return {"annotations": annotations}
+    if classes is None:
+        classes = project_class_names(projects_collection.find_one({"_id": ObjectId(str(project_id))}, {"entity_classes": 1}))
+    return {"annotations_compact": encode(annotations, text, classes)}
+
+
+def unset_fields(fields: Dict[str, Any]) -> Dict[str, str]:
+    """`$unset` for the storage field that `fields` (from `storage_fields`) does not use."""
+    return {name: "" for name in STORAGE_FIELDS if name not in fields}
+
+
+def format_record(doc: Dict[str, Any], annotation_format: str, classes: Iterable[str] = ()) -> Dict[str, Any]:
+    """A raw record (e.g. for exports) with its annotations in the requested format."""
+    record = {key: value for key, value in doc.items() if key not in STORAGE_FIELDS}
+    if annotation_format == "compact":
+        record["annotations_compact"] = document_compact_annotations(doc, classes)
+    else:
+        record["annotations"] = document_annotations(doc)
+    return record
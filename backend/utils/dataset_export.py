@@ -0,0 +1,160 @@
+"""Columnar dataset exports (Parquet or Arrow IPC) with train/dev/test splits.
+
+One row per document:
+
+    id, filename, status, split, text,
+    span_start, span_end, span_entity, span_text    one list entry per span
+    tokens, tags                                    with a tokenizer: IOB2 tags
+                                                    (see auto_gen_tools/ner_tools.py)
+
+Documents are read from the cursor in EXPORT_BATCH_SIZE batches and each
+batch is written as one record batch (one Parquet row group), so memory
+holds one batch whatever the project size. Files are kept as export
+snapshots (see utils/export_snapshots.py).
+
+Splits are drawn per document from a hash of (seed, document id), not by
+shuffling the project: the same seed gives the same split for a document in
+every export, and new documents do not move existing ones between splits.
+pyarrow is imported on first use.
+"""
+import hashlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from auto_gen_tools.ner_tools import iob2_tags
+from config.database import documents_collection
+from config.export_config import EXPORT_BATCH_SIZE, PARQUET_COMPRESSION
+from utils.compact_annotations import document_annotations
+from utils.lazy_imports import lazy_import
+from utils.token_cache import documents_tokens
+
+DATASET_FORMATS = ("parquet", "arrow")
+DATASET_MEDIA_TYPES = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+}
+SPLIT_NAMES = ("train", "dev", "test")
+
+EXPORT_PROJECTION = {"_id": 1, "project_id": 1, "text": 1, "filename": 1, "status": 1, "annotations": 1, "annotations_compact": 1}
+
+
+def parse_splits(value: str) -> Tuple[float, float, float]:
+    """
+    Train/dev/test fractions from "0.8,0.1,0.1" (normalized to sum to 1).
+
+    Raises:
+        ValueError: Not three non-negative numbers with a positive sum
+    """
+    try:
+        fractions = [float(part) for part in value.split(",")]
+    except ValueError:
+        raise ValueError(f"splits must be three comma-separated numbers, got {value!r}")
+    if len(fractions) != len(SPLIT_NAMES) or any(f < 0 for f in fractions) or sum(fractions) <= 0:
+        raise ValueError(f"splits must be three non-negative numbers for {', '.join(SPLIT_NAMES)}, got {value!r}")
+    total = sum(fractions)
+    return tuple(f / total for f in fractions)
+
+
+def assign_split(document_id: str, seed: int, splits: Tuple[float, float, float]) -> str:
+    digest = hashlib.blake2b(f"{seed}:{document_id}".encode(), digest_size=8).digest()
+    point = int.from_bytes(digest, "big") / 2 ** 64
+    cumulative = 0.0
+    for name, fraction in zip(SPLIT_NAMES, splits):
+        cumulative += fraction
+        if point < cumulative:
+            return name
+    # Rounding can leave the last sliver unassigned
+    return next(name for name, fraction in reversed(list(zip(SPLIT_NAMES, splits))) if fraction > 0)
+
+
+def document_batches(project_id: str, projection: Dict[str, int] = EXPORT_PROJECTION) -> Iterator[List[Dict[str, Any]]]:
+    """The live documents of a project in _id order, EXPORT_BATCH_SIZE at a time."""
+    cursor = documents_collection.find(
+        {"project_id": project_id, "deleted_at": None}, projection
+    ).sort("_id", 1).batch_size(EXPORT_BATCH_SIZE)
+    batch: List[Dict[str, Any]] = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def dataset_schema(pa, with_tokens: bool):
+    fields = [
+        pa.field("id", pa.string()),
+        pa.field("filename", pa.string()),
+        pa.field("status", pa.string()),
+        pa.field("split", pa.string()),
+        pa.field("text", pa.large_string()),
+        pa.field("span_start", pa.list_(pa.int32())),
+        pa.field("span_end", pa.list_(pa.int32())),
+        pa.field("span_entity", pa.list_(pa.string())),
+        pa.field("span_text", pa.list_(pa.string())),
+    ]
+    if with_tokens:
+        fields += [pa.field("tokens", pa.list_(pa.string())), pa.field("tags", pa.list_(pa.string()))]
+    return pa.schema(fields)
+
+
+def _record_batch(pa, schema, batch, tokenizer, seed, splits):
+    columns: Dict[str, List[Any]] = {name: [] for name in schema.names}
+    tokens = documents_tokens(batch, tokenizer) if tokenizer else {}
+    for doc in batch:
+        document_id = str(doc["_id"])
+        text = doc.get("text") or ""
+        annotations = document_annotations(doc)
+        columns["id"].append(document_id)
+        columns["filename"].append(doc.get("filename"))
+        columns["status"].append(doc.get("status"))
+        columns["split"].append(assign_split(document_id, seed, splits))
+        columns["text"].append(text)
+        columns["span_start"].append([a["start_index"] for a in annotations])
+        columns["span_end"].append([a["end_index"] for a in annotations])
+        columns["span_entity"].append([a["entity"] for a in annotations])
+        columns["span_text"].append([a.get("text") or text[a["start_index"]:a["end_index"]] for a in annotations])
+        if tokenizer:
+            offsets, token_texts = tokens[document_id]
+            columns["tokens"].append(token_texts)
+            columns["tags"].append(iob2_tags(offsets, annotations))
+    return pa.RecordBatch.from_arrays([pa.array(columns[name], type=schema.field(name).type) for name in schema.names], schema=schema)
+
+
+def write_dataset(
+    project_id: str,
+    path: str,
+    dataset_format: str = "parquet",
+    tokenizer: Optional[str] = None,
+    seed: int = 42,
+    splits: Tuple[float, float, float] = (0.8, 0.1, 0.1)
+) -> Dict[str, int]:
+    """
+    Write a project's documents to `path` as Parquet or an Arrow IPC file.
+
+    Args:
+        tokenizer: Add `tokens` and `tags` columns tokenized with this tokenizer
+        seed: Seed of the split assignment
+        splits: Train/dev/test fractions (see parse_splits)
+
+    Returns:
+        Number of documents per split
+
+    Raises:
+        ImportError: pyarrow (or the tokenizer's dependency) is not installed
+    """
+    pa = lazy_import("pyarrow", "Parquet/Arrow exports")
+    schema = dataset_schema(pa, with_tokens=bool(tokenizer))
+    if dataset_format == "parquet":
+        pq = lazy_import("pyarrow.parquet", "Parquet exports")
+        writer = pq.ParquetWriter(path, schema, compression=PARQUET_COMPRESSION)
+    else:
+        writer = pa.ipc.new_file(path, schema)
+    counts = {name: 0 for name in SPLIT_NAMES}
+    with writer:
+        for batch in document_batches(project_id):
+            record_batch = _record_batch(pa, schema, batch, tokenizer, seed, splits)
+            writer.write_batch(record_batch)
+            for name in record_batch.column("split").to_pylist():
+                counts[name] += 1
+    return counts
@@ -0,0 +1,327 @@
+"""Streaming parsers and batched ingestion for pre-annotated datasets.
+
+Supported formats, read line by line so files are never loaded whole:
+
+    jsonl   one document per line in the API's own shape:
+            {"text": ..., "annotations": [{"start_index", "end_index", "entity"}],
+             "filename": ..., "status": ...}, or "annotations_compact"
+            instead of "annotations" (see utils/compact_annotations.py)
+    spans   one document per line with spaCy/Prodigy-style spans
+            {"text": ..., "spans": [{"start", "end", "label"}]} or doccano-style
+            {"text": ..., "label": [[start, end, label], ...]}
+    conll   CoNLL/IOB2: one token per line with its tag in the last column,
+            blank lines between sentences. Documents are split at -DOCSTART-
+            lines; a file without them becomes one document per sentence.
+            Tokens are joined with spaces and sentences with newlines, and
+            B-/I- tags are turned back into character spans.
+"""
+import codecs
+import json
+import re
+import time
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Set, Tuple
+
+from config.database import documents_collection
+from utils.annotation_index import index_new_documents
+from utils.annotation_validation import AnnotationError, normalize_annotations
+from utils.compact_annotations import spans, storage_fields
+from utils.project_stats import apply_document_changes
+
+IMPORT_FORMATS = ("jsonl", "spans", "conll")
+
+# Documents per insert_many
+IMPORT_BATCH_SIZE = 500
+
+# Per-line errors returned in the report; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+# Bytes read from the uploaded file at a time
+IMPORT_READ_SIZE = 64 * 1024
+
+DOCSTART = "-DOCSTART-"
+
+# What decoded_lines(errors="surrogateescape") turns undecodable bytes into
+UNDECODABLE = re.compile("[\udc80-\udcff]")
+
+# A parsed record: (line number, document dict) or (line number, RecordError)
+ParsedLine = Tuple[int, Any]
+
+
+class RecordError(ValueError):
+    """A line that cannot be turned into a document."""
+
+
+def decoded_lines(stream: BinaryIO, encoding: str = "utf-8", errors: str = "strict") -> Iterator[str]:
+    """
+    Lines of a binary file, decoded incrementally and split on "\n" only.
+
+    Works on any object with `read()` (io.TextIOWrapper needs `readable()`,
+    which SpooledTemporaryFile lacks before Python 3.11). Other line
+    separators, e.g. U+2028 inside a JSON string, stay part of the line.
+
+    Args:
+        errors: Codec error handler; with "surrogateescape" undecodable bytes
+            stay in their line (see UNDECODABLE) for import_records to reject
+
+    Raises:
+        LookupError: Unknown encoding
+        UnicodeDecodeError: Bytes that are not valid in the encoding (and
+            that `errors` cannot handle)
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors)
+    # Pieces of the line being read, joined once it is complete
+    parts: List[str] = []
+    while True:
+        chunk = stream.read(IMPORT_READ_SIZE)
+        pieces = decoder.decode(chunk, final=not chunk).split("\n")
+        if len(pieces) > 1:
+            parts.append(pieces[0])
+            yield "".join(parts)
+            yield from pieces[1:-1]
+            parts = []
+        parts.append(pieces[-1])
+        if not chunk:
+            break
+    rest = "".join(parts)
+    if rest:
+        yield rest
+
+
+def _parse_json_line(line: str) -> Dict[str, Any]:
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise RecordError(f"Invalid JSON: {e.msg}")
+    if not isinstance(record, dict):
+        raise RecordError("Expected a JSON object")
+    if not isinstance(record.get("text"), str):
+        raise RecordError("Missing 'text'")
+    return record
+
+
+def _json_lines(lines: Iterable[str]) -> Iterator[Tuple[int, str]]:
+    for line_no, line in enumerate(lines, start=1):
+        line = line.strip()
+        if line:
+            yield line_no, line
+
+
+def parse_jsonl(lines: Iterable[str]) -> Iterator[ParsedLine]:
+    for line_no, line in _json_lines(lines):
+        try:
+            record = _parse_json_line(line)
+            if record.get("annotations_compact") is not None:
+                annotations = spans(record["annotations_compact"])
+            else:
+                annotations = [
+                    (span["start_index"], span["end_index"], span["entity"])
+                    for span in record.get("annotations") or []
+                ]
+            yield line_no, {
+                "text": record["text"],
+                "annotations": annotations,
+                "filename": record.get("filename"),
+                "status": record.get("status"),
+            }
+        except (KeyError, TypeError, ValueError) as e:
+            yield line_no, RecordError(f"Invalid annotation, missing {e}" if isinstance(e, KeyError) else str(e))
+
+
+def parse_spans(lines: Iterable[str]) -> Iterator[ParsedLine]:
+    for line_no, line in _json_lines(lines):
+        try:
+            record = _parse_json_line(line)
+            if "spans" in record:
+                annotations = [(span["start"], span["end"], span["label"]) for span in record["spans"] or []]
+            else:
+                annotations = [(start, end, label) for start, end, label in record.get("label") or []]
+            yield line_no, {
+                "text": record["text"],
+                "annotations": annotations,
+                "filename": record.get("filename"),
+                "status": record.get("status"),
+            }
+        except (KeyError, TypeError, ValueError) as e:
+            yield line_no, RecordError(f"Invalid span, missing {e}" if isinstance(e, KeyError) else str(e))
+
+
+def iob_to_spans(tokens: List[Tuple[int, int, str]]) -> List[Tuple[int, int, str]]:
+    """
+    Character spans from tagged tokens.
+
+    Args:
+        tokens: (start, end, tag) per token, tags in IOB2 ("B-ORG", "I-ORG", "O");
+            an I- tag that does not continue a span of the same class starts one (IOB1)
+    """
+    spans = []
+    current = None
+    for start, end, tag in tokens:
+        prefix, _, entity = tag.partition("-")
+        if tag == "O" or not entity or prefix not in ("B", "I"):
+            current = None
+        elif prefix == "I" and current is not None and current[2] == entity:
+            current[1] = end
+        else:
+            current = [start, end, entity]
+            spans.append(current)
+    return [tuple(span) for span in spans]
+
+
+def parse_conll(lines: Iterable[str]) -> Iterator[ParsedLine]:
+    """Documents from CoNLL lines; each is reported at the line where it starts."""
+    split_on_docstart = None
+    text_parts: List[str] = []
+    tokens: List[Tuple[int, int, str]] = []
+    length = 0
+    doc_line = None
+    # What goes before the next token: nothing, a space, or a newline after a sentence
+    separator = ""
+    error = None
+
+    def flush():
+        if doc_line is None:
+            return None
+        if error:
+            return doc_line, RecordError(error)
+        if not tokens:
+            return None
+        return doc_line, {"text": "".join(text_parts), "annotations": iob_to_spans(tokens), "filename": None, "status": None}
+
+    for line_no, line in enumerate(lines, start=1):
+        stripped = line.strip()
+        if split_on_docstart is None and stripped:
+            split_on_docstart = stripped.startswith(DOCSTART)
+
+        if stripped.startswith(DOCSTART) or (not stripped and not split_on_docstart):
+            # Document boundary
+            if not stripped and doc_line is None:
+                continue
+            parsed = flush()
+            if parsed:
+                yield parsed
+            text_parts, tokens, length, doc_line, separator, error = [], [], 0, None, "", None
+            continue
+
+        if not stripped:
+            # Sentence boundary inside a document
+            if separator:
+                separator = "\n"
+            continue
+
+        if doc_line is None:
+            doc_line = line_no
+        columns = stripped.split()
+        if len(columns) < 2:
+            error = error or f"Line {line_no}: expected a token and a tag"
+            continue
+        token, tag = columns[0], columns[-1]
+        text_parts.append(separator)
+        length += len(separator)
+        text_parts.append(token)
+        tokens.append((length, length + len(token), tag))
+        length += len(token)
+        separator = " "
+
+    parsed = flush()
+    if parsed:
+        yield parsed
+
+
+PARSERS = {"jsonl": parse_jsonl, "spans": parse_spans, "conll": parse_conll}
+
+
+def build_annotations(text: str, spans: Iterable[Tuple[int, int, str]], entity_names: Set[str], skip_unknown: bool) -> List[Dict[str, Any]]:
+    """Validate spans against the text and the project's entity classes."""
+    annotations = []
+    for start, end, entity in spans:
+        if not isinstance(start, int) or not isinstance(end, int) or not 0 <= start < end <= len(text):
+            raise RecordError(f"Span [{start}, {end}) is outside the text")
+        if entity not in entity_names:
+            if skip_unknown:
+                continue
+            raise RecordError(f"Unknown entity class '{entity}'")
+        annotations.append({"start_index": start, "end_index": end, "entity": entity})
+    try:
+        return normalize_annotations(annotations, text)[0]
+    except AnnotationError as e:
+        raise RecordError(str(e) + "".join(f"; {issue['detail']}" for issue in e.issues[:3]))
+
+
+def import_records(
+    project: Dict[str, Any],
+    records: Iterable[ParsedLine],
+    source_name: str,
+    skip_unknown_entities: bool = False,
+    batch_size: int = IMPORT_BATCH_SIZE
+) -> Dict[str, Any]:
+    """
+    Validate parsed records and insert them into a project in batches.
+
+    A file that stops decoding partway ends the import with an error
+    (line None) in the report; the documents before it stay imported.
+
+    Returns:
+        Counts of imported and failed documents, per-line errors (first
+        MAX_REPORTED_ERRORS) and ingestion throughput
+    """
+    project_id = str(project["_id"])
+    class_names = [entity["name"] for entity in project.get("entity_classes", [])]
+    entity_names = set(class_names)
+    start = time.perf_counter()
+    imported, failed, errors = 0, 0, []
+    batch: List[Dict[str, Any]] = []
+
+    def insert(batch):
+        documents_collection.insert_many(batch, ordered=False)
+        index_new_documents(batch)
+        apply_document_changes(project_id, added=batch)
+
+    def fail(line_no, error):
+        nonlocal failed
+        failed += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"line": line_no, "error": error})
+
+    try:
+        for line_no, record in records:
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                if UNDECODABLE.search(record["text"]) or UNDECODABLE.search(record.get("filename") or ""):
+                    raise RecordError("Bytes that are not valid in the file's encoding")
+                now = datetime.utcnow()
+                annotations = build_annotations(record["text"], record["annotations"], entity_names, skip_unknown_entities)
+                batch.append({
+                    "text": record["text"],
+                    "project_id": project_id,
+                    "filename": record.get("filename") or f"{source_name}:{line_no}",
+                    "created_at": now,
+                    "updated_at": now,
+                    **storage_fields(annotations, record["text"], class_names),
+                    "entities": [],
+                    "status": record.get("status") or ("completed" if annotations else "pending"),
+                })
+            except RecordError as e:
+                fail(line_no, str(e))
+                continue
+            if len(batch) >= batch_size:
+                insert(batch)
+                imported += len(batch)
+                batch = []
+    except UnicodeDecodeError as e:
+        # Bytes surrogateescape cannot keep (e.g. a truncated UTF-16 file): the rest is unreadable
+        fail(None, f"Unable to decode the rest of the file: {str(e)}")
+    if batch:
+        insert(batch)
+        imported += len(batch)
+
+    elapsed = time.perf_counter() - start
+    return {
+        "imported_count": imported,
+        "failed_count": failed,
+        "errors": errors,
+        "errors_truncated": failed > len(errors),
+        "elapsed_seconds": round(elapsed, 3),
+        "docs_per_second": round(imported / elapsed, 1) if elapsed > 0 else None,
+    }
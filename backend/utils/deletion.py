@@ -0,0 +1,163 @@
+"""Soft delete followed by a throttled background purge.
+
+Deleting a project or documents only stamps `deleted_at`, which every read
+filters on, so the data disappears from the API at once. The rows are then
+physically removed by a deletion job in batches of DELETE_BATCH_SIZE with a
+pause between batches, so a huge project never turns into one long
+`delete_many`. Jobs live in `deletion_jobs` with their progress; a job is
+claimed with a lease so that after a restart (or with several workers) an
+interrupted job is picked up again exactly once.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from config.database import (
+    DELETE_BATCH_PAUSE_MS,
+    DELETE_BATCH_SIZE,
+    deletion_jobs_collection,
+    documents_collection,
+    projects_collection,
+)
+from utils.annotation_index import remove_document_annotations, remove_project_annotations
+from utils.project_stats import remove_project_stats
+from utils.token_cache import remove_document_tokens, remove_project_tokens
+from utils.export_snapshots import remove_project_snapshots
+
+logger = logging.getLogger(__name__)
+
+# A job whose worker stops renewing its lease for this long is taken over
+LEASE_SECONDS = 60
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def create_deletion_job(kind: str, user_id: str, project_ids: List[str], total: int) -> str:
+    """
+    Record a purge to run in the background.
+
+    Args:
+        kind: "project" (purge the whole project) or "documents" (purge the
+            soft-deleted documents of the given projects)
+        total: Documents expected to be removed, for progress reporting
+    """
+    now = datetime.utcnow()
+    return str(deletion_jobs_collection.insert_one({
+        "kind": kind,
+        "user_id": str(user_id),
+        "project_ids": [str(project_id) for project_id in project_ids],
+        "status": "pending",
+        "total": total,
+        "deleted": 0,
+        "error": None,
+        "lease_until": now,
+        "created_at": now,
+        "updated_at": now,
+        "finished_at": None,
+    }).inserted_id)
+
+
+def get_deletion_job(job_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+    job = deletion_jobs_collection.find_one(
+        {"_id": ObjectId(job_id), "user_id": str(user_id)}, {"lease_until": 0, "worker": 0}
+    )
+    if job:
+        job["id"] = str(job.pop("_id"))
+        job["progress"] = round(min(job["deleted"] / job["total"], 1.0), 4) if job["total"] else 1.0
+    return job
+
+
+def _claim(job_id: ObjectId) -> Optional[Dict[str, Any]]:
+    """Take (or renew) the lease on a job that is not finished and not held by another worker."""
+    now = datetime.utcnow()
+    return deletion_jobs_collection.find_one_and_update(
+        {
+            "_id": job_id,
+            "status": {"$in": ["pending", "running"]},
+            "$or": [{"lease_until": {"$lte": now}}, {"worker": WORKER_ID}],
+        },
+        {"$set": {
+            "status": "running",
+            "worker": WORKER_ID,
+            "lease_until": now + timedelta(seconds=LEASE_SECONDS),
+            "updated_at": now,
+        }},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def _purge_filter(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Documents a job may remove; always scoped to the job's projects."""
+    purge_filter = {"project_id": {"$in": job["project_ids"]}}
+    if job["kind"] == "documents":
+        # Only documents that were soft-deleted, never live ones of the same project
+        purge_filter["deleted_at"] = {"$type": "date"}
+    return purge_filter
+
+
+def run_deletion_job(job_id: str, batch_size: int = DELETE_BATCH_SIZE, pause_ms: float = DELETE_BATCH_PAUSE_MS) -> None:
+    """Purge a job's documents batch by batch; safe to call again after an interruption."""
+    job_id = ObjectId(job_id)
+    job = _claim(job_id)
+    if job is None:
+        return
+    purge_filter = _purge_filter(job)
+    try:
+        while True:
+            ids = [doc["_id"] for doc in documents_collection.find(purge_filter, {"_id": 1}).limit(batch_size)]
+            if not ids:
+                break
+            deleted = documents_collection.delete_many({"_id": {"$in": ids}, **purge_filter}).deleted_count
+            remove_document_annotations(ids)
+            remove_document_tokens(ids)
+            deletion_jobs_collection.update_one(
+                {"_id": job_id}, {"$inc": {"deleted": deleted}, "$set": {"updated_at": datetime.utcnow()}}
+            )
+            if _claim(job_id) is None:
+                # Lease lost to another worker
+                return
+            time.sleep(pause_ms / 1000)
+
+        if job["kind"] == "project":
+            for project_id in job["project_ids"]:
+                remove_project_annotations(project_id)
+                remove_project_stats(project_id)
+                remove_project_tokens(project_id)
+                remove_project_snapshots(project_id)
+                projects_collection.delete_one({"_id": ObjectId(project_id), "deleted_at": {"$type": "date"}})
+
+        now = datetime.utcnow()
+        deletion_jobs_collection.update_one(
+            {"_id": job_id}, {"$set": {"status": "completed", "finished_at": now, "updated_at": now}}
+        )
+    except Exception as e:
+        logger.error(f"Deletion job {job_id} failed: {str(e)}")
+        # Keep it resumable: release the lease so resume_deletion_jobs() retries it
+        deletion_jobs_collection.update_one(
+            {"_id": job_id},
+            {"$set": {"status": "running", "error": str(e), "lease_until": datetime.utcnow(), "updated_at": datetime.utcnow()}}
+        )
+
+
+def start_deletion_job(job_id: str) -> None:
+    """Run a job on a daemon thread so the request returns immediately."""
+    threading.Thread(target=run_deletion_job, args=(job_id,), name=f"deletion-{job_id}", daemon=True).start()
+
+
+def resume_deletion_jobs() -> int:
+    """Restart jobs left unfinished by a previous process whose lease has expired."""
+    jobs = deletion_jobs_collection.find(
+        {"status": {"$in": ["pending", "running"]}, "lease_until": {"$lte": datetime.utcnow()}}, {"_id": 1}
+    )
+    count = 0
+    for job in jobs:
+        start_deletion_job(str(job["_id"]))
+        count += 1
+    return count
@@ -0,0 +1,284 @@
+"""Export snapshots: finished export files kept on disk until the project changes.
+
+Building an export reads and serializes every document of a project, while
+users tend to export the same unchanged project again and again. Each export
+is written once per project state to
+
+    EXPORT_SNAPSHOT_ROOT/<project_id>/<name>_<watermark>.<extension>
+
+where `name` identifies the export and its parameters and the watermark is
+the project's `changes` counter (moved by every document write, see
+utils/project_stats.py) with the project's `updated_at`. A request whose
+snapshot exists is answered from the file; otherwise the export is built in
+a worker thread. Concurrent requests for one snapshot share its build, which
+finishes even if they disconnect. With `stale` the newest older snapshot is
+served at once while the current one is built in the background.
+
+Files are written under a temporary name and renamed when complete, so
+workers sharing the folder only ever see whole snapshots (two workers may
+build the same snapshot; the second rename replaces identical content).
+Once a snapshot is built, older snapshots of the same export are removed,
+and when the folder exceeds EXPORT_SNAPSHOT_MAX_BYTES the least recently
+served snapshots are evicted; serving a snapshot updates its mtime.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+from starlette.concurrency import run_in_threadpool
+
+from config.database import project_stats_collection
+from config.export_config import EXPORT_SNAPSHOT_MAX_BYTES, EXPORT_SNAPSHOT_ROOT
+from utils.metrics import Counter, Gauge
+from utils.project_stats import get_project_counters
+
+logger = logging.getLogger(__name__)
+
+EXPORT_SNAPSHOT_REQUESTS = Counter(
+    "export_snapshot_requests_total",
+    "Export requests served from a current snapshot (hit), an older one (stale) or a new build (miss)",
+    ["export", "result"],
+)
+EXPORT_SNAPSHOT_BYTES = Gauge(
+    "export_snapshot_bytes",
+    "Disk used by export snapshots after the last build in this worker",
+)
+
+# Snapshots served or built this recently are never evicted: a response may still be reading them
+EVICTION_GRACE_SECONDS = 60
+
+# Snapshot path -> its build, shared by the requests waiting for it
+_builds: Dict[str, "asyncio.Task"] = {}
+
+# A build writes the export to the given path and may return metadata
+# (e.g. response headers) stored with the snapshot
+Builder = Callable[[str], Optional[Dict[str, Any]]]
+
+
+def project_watermark(project: Dict[str, Any]) -> str:
+    """
+    Identifies the current state of a project's export data: it changes with
+    every document write and every project update.
+    """
+    project_id = str(project["_id"])
+    stats = project_stats_collection.find_one({"project_id": project_id}, {"changes": 1})
+    if stats is None:
+        # Writes do not create counters; build them so later writes move the watermark
+        stats = get_project_counters(project_id)
+    updated_at = project.get("updated_at")
+    updated_ms = int(updated_at.timestamp() * 1000) if isinstance(updated_at, datetime) else 0
+    return f"{stats.get('changes', 0)}-{updated_ms}"
+
+
+def snapshot_name(export: str, params: Dict[str, Any]) -> str:
+    """File name prefix of an export with the given parameters."""
+    digest = hashlib.blake2b(json.dumps(params, sort_keys=True, default=str).encode(), digest_size=6).hexdigest()
+    return f"{export}-{digest}"
+
+
+def _folder(project_id: str) -> str:
+    return os.path.join(EXPORT_SNAPSHOT_ROOT, str(project_id))
+
+
+def _snapshot_path(project_id: str, name: str, watermark: str, extension: str) -> str:
+    return os.path.join(_folder(project_id), f"{name}_{watermark}.{extension}")
+
+
+def _meta_path(path: str) -> str:
+    return path + ".meta"
+
+
+def _read_meta(path: str) -> Dict[str, Any]:
+    try:
+        with open(_meta_path(path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _is_snapshot(filename: str) -> bool:
+    return not filename.startswith(".") and not filename.endswith(".meta")
+
+
+def _remove(path: str) -> None:
+    for name in (path, _meta_path(path)):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
+
+
+def _build(project_id: str, name: str, path: str, build: Builder) -> None:
+    folder = _folder(project_id)
+    os.makedirs(folder, exist_ok=True)
+    temp_path = os.path.join(folder, f".{uuid.uuid4().hex}.part")
+    try:
+        meta = build(temp_path) or {}
+        with open(_meta_path(path), "w") as f:
+            json.dump(meta, f)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    # Snapshots of earlier states of this export are never served fresh again,
+    # but one served within the grace period may still be streaming
+    recent = time.time() - EVICTION_GRACE_SECONDS
+    for filename in os.listdir(folder):
+        other = os.path.join(folder, filename)
+        if not _is_snapshot(filename) or not filename.startswith(name + "_") or other == path:
+            continue
+        try:
+            if os.stat(other).st_mtime > recent:
+                continue
+        except FileNotFoundError:
+            continue
+        _remove(other)
+    evict_snapshots()
+
+
+def evict_snapshots(max_bytes: int = EXPORT_SNAPSHOT_MAX_BYTES) -> int:
+    """
+    Remove the least recently served snapshots until the folder fits in `max_bytes`.
+
+    Returns:
+        Number of snapshots removed
+    """
+    snapshots = []
+    for root, _, filenames in os.walk(EXPORT_SNAPSHOT_ROOT):
+        for filename in filenames:
+            if not _is_snapshot(filename):
+                continue
+            path = os.path.join(root, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            snapshots.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in snapshots)
+    removed = 0
+    recent = time.time() - EVICTION_GRACE_SECONDS
+    for mtime, size, path in sorted(snapshots):
+        if total <= max_bytes:
+            break
+        if mtime > recent:
+            continue
+        _remove(path)
+        total -= size
+        removed += 1
+    EXPORT_SNAPSHOT_BYTES.set(total)
+    if removed:
+        logger.info(f"Evicted {removed} export snapshots, {total} bytes left")
+    return removed
+
+
+def _latest_snapshot(project_id: str, name: str) -> Optional[str]:
+    folder = _folder(project_id)
+    if not os.path.isdir(folder):
+        return None
+    paths = [
+        os.path.join(folder, filename) for filename in os.listdir(folder)
+        if _is_snapshot(filename) and filename.startswith(name + "_")
+    ]
+    return max(paths, key=os.path.getmtime, default=None)
+
+
+def _start_build(project_id: str, name: str, path: str, build: Builder) -> "asyncio.Task":
+    task = _builds.get(path)
+    if task is None:
+        task = asyncio.get_running_loop().create_task(run_in_threadpool(_build, project_id, name, path, build))
+        task.add_done_callback(lambda done: _build_finished(path, done))
+        _builds[path] = task
+    return task
+
+
+def _build_finished(path: str, task: "asyncio.Task") -> None:
+    _builds.pop(path, None)
+    # Logged here as a build started for a stale response has no request waiting for its error
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Export snapshot build failed for {path}: {task.exception()}")
+
+
+async def get_snapshot(
+    project_id: str,
+    watermark: str,
+    export: str,
+    params: Dict[str, Any],
+    extension: str,
+    build: Builder,
+    stale: bool = False
+) -> Tuple[str, str, Dict[str, Any]]:
+    """
+    The snapshot of an export for the project's current state, built if missing.
+
+    Args:
+        watermark: project_watermark() of the project
+        export: Name of the export (a metrics label and file name prefix)
+        params: Parameters the export's content depends on
+        build: Writes the export to the path it is given; runs in a worker thread
+        stale: Serve the newest older snapshot, if any, instead of waiting
+            for the build (which continues in the background)
+
+    Returns:
+        (path, watermark of the file served, metadata returned by `build`)
+    """
+    name = snapshot_name(export, params)
+    path = _snapshot_path(project_id, name, watermark, extension)
+    if os.path.exists(path):
+        EXPORT_SNAPSHOT_REQUESTS.inc(export=export, result="hit")
+        os.utime(path)
+        return path, watermark, _read_meta(path)
+
+    task = _start_build(project_id, name, path, build)
+    if stale:
+        previous = _latest_snapshot(project_id, name)
+        if previous is not None:
+            EXPORT_SNAPSHOT_REQUESTS.inc(export=export, result="stale")
+            os.utime(previous)
+            previous_watermark = os.path.splitext(os.path.basename(previous))[0][len(name) + 1:]
+            return previous, previous_watermark, _read_meta(previous)
+
+    EXPORT_SNAPSHOT_REQUESTS.inc(export=export, result="miss")
+    # Shielded: a client that gives up does not cancel the build for the others
+    await asyncio.shield(task)
+    return path, watermark, _read_meta(path)
+
+
+def snapshot_response(
+    request: Request,
+    path: str,
+    watermark: str,
+    current_watermark: str,
+    media_type: str,
+    filename: str,
+    headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """
+    Send a snapshot as a download; a client holding the same snapshot
+    (If-None-Match) gets 304.
+    """
+    etag = f'"{os.path.basename(path)}"'
+    response_headers = {
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        "X-Export-Watermark": watermark,
+        **(headers or {}),
+    }
+    if watermark != current_watermark:
+        response_headers["X-Export-Stale"] = "true"
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=response_headers)
+    return FileResponse(path, media_type=media_type, filename=filename, headers=response_headers)
+
+
+def remove_project_snapshots(project_id: str) -> None:
+    shutil.rmtree(_folder(project_id), ignore_errors=True)
@@ -0,0 +1,127 @@
+"""Storage helpers for uploaded images: streamed, size-capped, content-hashed writes and thumbnails."""
+import hashlib
+import logging
+import os
+import uuid
+from typing import Dict, Iterable, Optional, Tuple
+
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+
+from config.uploads_config import UPLOAD_CHUNK_SIZE
+
+try:
+    from PIL import Image
+except ImportError:  # Thumbnails are skipped without Pillow
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Leading bytes of the accepted formats
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+)
+
+# Hex digits of the content hash used in filenames
+HASH_LENGTH = 16
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    for signature, image_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return image_type
+    return None
+
+
+async def save_upload_hashed(upload: UploadFile, folder: str, prefix: str, extension: str, max_bytes: int) -> Tuple[str, int]:
+    """
+    Stream an uploaded image to `folder` as `<prefix>_<content hash>.<extension>`.
+
+    The upload is read and written in chunks (disk writes run in the
+    threadpool) and aborted as soon as it exceeds `max_bytes`, so neither the
+    whole file nor blocking I/O sits on the event loop.
+
+    Returns:
+        The stored filename and its size in bytes
+    """
+    os.makedirs(folder, exist_ok=True)
+    temp_path = os.path.join(folder, f".{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+    out = await run_in_threadpool(open, temp_path, "wb")
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            if size == 0 and sniff_image_type(chunk) is None:
+                raise InvalidImage("File content is not a PNG, JPEG or GIF image")
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(f"File exceeds the limit of {max_bytes} bytes")
+            digest.update(chunk)
+            await run_in_threadpool(out.write, chunk)
+        await run_in_threadpool(out.close)
+        if size == 0:
+            raise InvalidImage("File is empty")
+
+        filename = f"{prefix}_{digest.hexdigest()[:HASH_LENGTH]}.{extension}"
+        await run_in_threadpool(os.replace, temp_path, os.path.join(folder, filename))
+        return filename, size
+    except BaseException:
+        out.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def thumbnail_filename(filename: str, size: int) -> str:
+    stem, extension = os.path.splitext(filename)
+    return f"{stem}_{size}{extension}"
+
+
+def generate_thumbnails(folder: str, filename: str, sizes: Iterable[int]) -> Dict[str, str]:
+    """
+    Write downscaled copies of an image (blocking; run it off the request path).
+
+    Returns:
+        {str(size): thumbnail filename}; empty without Pillow or for unreadable images
+    """
+    if Image is None:
+        logger.info("Pillow is not installed, skipping thumbnails")
+        return {}
+    thumbnails = {}
+    try:
+        with Image.open(os.path.join(folder, filename)) as image:
+            image_format = image.format
+            image.seek(0)  # First frame of animated GIFs
+            for size in sorted(sizes, reverse=True):
+                thumbnail = image.copy()
+                thumbnail.thumbnail((size, size))
+                if image_format == "JPEG" and thumbnail.mode not in ("RGB", "L"):
+                    thumbnail = thumbnail.convert("RGB")
+                name = thumbnail_filename(filename, size)
+                options = {"quality": 85, "optimize": True} if image_format == "JPEG" else {"optimize": True}
+                thumbnail.save(os.path.join(folder, name), format=image_format, **options)
+                thumbnails[str(size)] = name
+    except Exception as e:
+        logger.error(f"Error creating thumbnails for {filename}: {str(e)}")
+    return thumbnails
+
+
+def remove_images(folder: str, filenames: Iterable[str]) -> None:
+    for filename in filenames:
+        path = os.path.join(folder, filename)
+        if filename and os.path.exists(path):
+            os.remove(path)
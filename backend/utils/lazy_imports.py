@@ -0,0 +1,89 @@
+"""Deferred imports of heavy dependencies.
+
+openai and transformers (with torch behind it) take from a fraction of a
+second to several seconds to import and tens to hundreds of MB of memory.
+Importing them at module level makes every worker pay that at startup, even
+workers that never call a hosted API or tokenize a document. Modules that
+need them call `lazy_import` where they are used instead; the import happens
+once per process, on first use. PRELOAD_MODULES names modules to import in
+the background at startup instead, so the first request does not wait.
+"""
+import importlib
+import logging
+import sys
+import threading
+import time
+from types import ModuleType
+from typing import Dict, Iterable, Optional
+
+from utils.metrics import Gauge
+
+logger = logging.getLogger(__name__)
+
+MODULE_IMPORT_SECONDS = Gauge(
+    "module_import_seconds",
+    "Time the first import of a lazily loaded dependency took in this worker",
+    ["module"],
+)
+
+# module -> seconds its first import took
+_import_seconds: Dict[str, float] = {}
+_lock = threading.Lock()
+
+
+def lazy_import(name: str, purpose: str = "") -> ModuleType:
+    """
+    The module `name`, imported on first call.
+
+    Args:
+        purpose: What the module is needed for, for the error when it is not installed
+
+    Raises:
+        ImportError: The module is not installed
+    """
+    # Only modules whose import finished are taken from sys.modules: another
+    # thread's import puts the module there before it has run its body
+    if name in _import_seconds:
+        return sys.modules[name]
+    with _lock:
+        if name in _import_seconds:
+            return sys.modules[name]
+        start = time.perf_counter()
+        try:
+            module = importlib.import_module(name)
+        except ImportError as e:
+            needed = f" for {purpose}" if purpose else ""
+            raise ImportError(f"'{name}' is required{needed}; install it with `pip install {name.split('.')[0]}`") from e
+        elapsed = time.perf_counter() - start
+        _import_seconds[name] = elapsed
+        MODULE_IMPORT_SECONDS.set(elapsed, module=name)
+        logger.info(f"Imported {name} in {elapsed:.2f}s")
+        return module
+
+
+def preload_modules(names: Iterable[str]) -> Dict[str, str]:
+    """
+    Import `names` now (e.g. from a startup thread).
+
+    Returns:
+        {name: "loaded" or the import error}; a missing optional module is not fatal
+    """
+    results = {}
+    for name in names:
+        try:
+            lazy_import(name)
+            results[name] = "loaded"
+        except Exception as e:
+            logger.warning(f"Preloading {name} failed: {str(e)}")
+            results[name] = str(e)
+    return results
+
+
+def imported_module(name: str) -> Optional[ModuleType]:
+    """The module `name` if `lazy_import` has finished importing it, without importing it."""
+    return sys.modules[name] if name in _import_seconds else None
+
+
+def imported_modules() -> Dict[str, float]:
+    """Lazily imported modules of this worker with the seconds their import took."""
+    return dict(_import_seconds)
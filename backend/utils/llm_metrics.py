@@ -0,0 +1,296 @@
+"""Instrumentation of LLM calls: latency, token usage and throughput.
+
+Every call made through `chat_with_gpt` / `chat_with_ollama` is recorded in
+the in-process metrics registry (for /api/metrics) and as one row in the
+`llm_usage` collection, which backs the per-project cost report. Series in
+the registry are not labelled by project, so their number does not grow
+with the projects; per-project figures come from `llm_usage` only.
+Calls and tokens saved by local pre-annotation are recorded alongside as
+rows with status "avoided".
+"""
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from config.database import llm_usage_collection
+from config.model_manager_config import LLM_PRICING
+from utils.metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+LLM_REQUEST_DURATION = Histogram(
+    "llm_request_duration_seconds",
+    "Total LLM call latency in seconds",
+    ["backend", "model"],
+)
+LLM_TIME_TO_FIRST_TOKEN = Histogram(
+    "llm_time_to_first_token_seconds",
+    "Time until the first generated token in seconds",
+    ["backend", "model"],
+)
+LLM_REQUESTS = Counter(
+    "llm_requests_total",
+    "LLM calls by outcome",
+    ["backend", "model", "status"],
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "LLM tokens by kind (prompt, completion, think)",
+    ["backend", "model", "kind"],
+)
+LLM_CALLS_AVOIDED = Counter(
+    "llm_calls_avoided_total",
+    "Auto-annotation requests answered by the local pre-annotator without an LLM call",
+)
+LLM_TOKENS_AVOIDED = Counter(
+    "llm_tokens_avoided_total",
+    "Estimated LLM tokens saved by local pre-annotation",
+    ["kind"],
+)
+PREANNOTATION_SPANS = Counter(
+    "preannotation_spans_total",
+    "Spans found by the local pre-annotator",
+    ["source"],
+)
+LLM_BACKEND_IN_FLIGHT = Gauge(
+    "llm_backend_in_flight",
+    "Generations currently running per LLM backend",
+    ["backend"],
+)
+LLM_BACKEND_QUEUE_WAIT = Histogram(
+    "llm_backend_queue_wait_seconds",
+    "Time spent waiting for a concurrency slot and rate-limit token",
+    ["backend"],
+)
+LLM_BACKEND_RETRIES = Counter(
+    "llm_backend_retries_total",
+    "Retried LLM calls by upstream status",
+    ["backend", "status"],
+)
+LLM_BACKEND_FALLBACKS = Counter(
+    "llm_backend_fallbacks_total",
+    "Generations moved to a fallback backend, by the skipped backend and reason",
+    ["backend", "reason"],
+)
+LLM_CIRCUIT_OPEN = Gauge(
+    "llm_backend_circuit_open",
+    "1 while a backend's circuit breaker is open",
+    ["backend"],
+)
+LLM_SINGLE_FLIGHT_LEADERS = Counter(
+    "llm_single_flight_leaders_total",
+    "Generations actually sent to an LLM by the single-flight layer",
+    [],
+)
+LLM_COALESCED = Counter(
+    "llm_coalesced_requests_total",
+    "Requests that shared an identical in-flight generation instead of making their own, "
+    "within the worker (local) or from another worker (remote)",
+    ["scope"],
+)
+AUTO_ANNOTATE_BATCH_DOCUMENTS = Counter(
+    "auto_annotate_batch_documents_total",
+    "Documents of batch auto-annotation by how they were annotated (packed, single, local, error)",
+    ["mode"],
+)
+LLM_MODEL_LOAD_SECONDS = Histogram(
+    "llm_model_load_seconds",
+    "Time Ollama spent loading the model, on warm-ups and on requests that found it unloaded",
+    ["backend", "model", "source"],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300),
+)
+LLM_MODEL_RESIDENT = Gauge(
+    "llm_model_resident",
+    "1 while a backend's Ollama model is loaded, as of the last probe",
+    ["backend", "model"],
+)
+LLM_GENERATION_SECONDS = Counter(
+    "llm_generation_seconds_total",
+    "Time spent generating completion tokens",
+    ["backend", "model"],
+)
+
+
+def estimate_think_tokens(raw_text: str, think_text: str, completion_tokens: int) -> int:
+    """
+    Estimate how many completion tokens went into a ``<think>`` section by
+    scaling the completion token count with the share of characters it takes.
+    """
+    if not raw_text or not think_text or not completion_tokens:
+        return 0
+    return round(completion_tokens * min(len(think_text) / len(raw_text), 1.0))
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Cost in USD from LLM_PRICING (per 1M tokens); unknown models are free."""
+    prompt_price, completion_price = LLM_PRICING.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+def record_llm_call(
+    backend: str,
+    model: str,
+    project_id: Optional[str],
+    duration: float,
+    prompt_tokens: int = 0,
+    completion_tokens: int = 0,
+    think_tokens: int = 0,
+    time_to_first_token: Optional[float] = None,
+    generation_time: Optional[float] = None,
+    error: Optional[str] = None,
+) -> None:
+    """
+    Record one LLM call. Never raises: instrumentation must not break annotation.
+
+    Args:
+        backend: Name of the configured backend ("openai", "ollama" by default)
+        model: Model name as sent to the backend
+        project_id: Project the call was made for, if any
+        duration: Wall-clock time of the whole call in seconds
+        prompt_tokens / completion_tokens: Token usage reported by the backend
+        think_tokens: Part of completion_tokens spent in <think> sections
+        time_to_first_token: Seconds until the first generated token
+        generation_time: Seconds spent generating completion tokens
+        error: Error message if the call failed
+    """
+    status = "error" if error else "ok"
+    try:
+        LLM_REQUESTS.inc(backend=backend, model=model, status=status)
+        LLM_REQUEST_DURATION.observe(duration, backend=backend, model=model)
+        if time_to_first_token is not None:
+            LLM_TIME_TO_FIRST_TOKEN.observe(time_to_first_token, backend=backend, model=model)
+        if generation_time:
+            LLM_GENERATION_SECONDS.inc(generation_time, backend=backend, model=model)
+        for kind, count in (("prompt", prompt_tokens), ("completion", completion_tokens), ("think", think_tokens)):
+            if count:
+                LLM_TOKENS.inc(count, backend=backend, model=model, kind=kind)
+
+        llm_usage_collection.insert_one({
+            "project_id": project_id,
+            "backend": backend,
+            "model": model,
+            "status": status,
+            "error": error,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "think_tokens": think_tokens,
+            "duration": duration,
+            "time_to_first_token": time_to_first_token,
+            "generation_time": generation_time,
+            "cost": estimate_cost(model, prompt_tokens, completion_tokens),
+            "created_at": datetime.utcnow(),
+        })
+    except Exception as e:
+        logger.warning(f"Failed to record LLM call metrics: {str(e)}")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token) for calls that were never made."""
+    return (len(text) + 3) // 4
+
+
+def record_llm_avoided(
+    project_id: Optional[str],
+    model: str,
+    prompt_tokens: int,
+    completion_tokens: int,
+    call_avoided: bool,
+    sources: Optional[Dict[str, int]] = None,
+) -> None:
+    """
+    Record what local pre-annotation saved. Never raises.
+
+    Args:
+        model: Model the LLM call would have used (for the saved cost)
+        prompt_tokens / completion_tokens: Estimated tokens not sent / not generated
+        call_avoided: True if the LLM was not called at all
+        sources: Spans found per local source
+    """
+    try:
+        for source, count in (sources or {}).items():
+            if count:
+                PREANNOTATION_SPANS.inc(count, source=source)
+        if call_avoided:
+            LLM_CALLS_AVOIDED.inc()
+        for kind, count in (("prompt", prompt_tokens), ("completion", completion_tokens)):
+            if count > 0:
+                LLM_TOKENS_AVOIDED.inc(count, kind=kind)
+
+        llm_usage_collection.insert_one({
+            "project_id": project_id,
+            "backend": "local",
+            "model": model,
+            "status": "avoided",
+            "call_avoided": call_avoided,
+            "prompt_tokens": max(prompt_tokens, 0),
+            "completion_tokens": max(completion_tokens, 0),
+            "cost": estimate_cost(model, max(prompt_tokens, 0), max(completion_tokens, 0)),
+            "created_at": datetime.utcnow(),
+        })
+    except Exception as e:
+        logger.warning(f"Failed to record avoided LLM usage: {str(e)}")
+
+
+def project_usage_report(project_id: str, since: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Aggregate LLM usage of a project per backend and model.
+
+    Returns:
+        dict with per-model rows (calls, errors, tokens, latency, time to first
+        token, completion tokens per second, think share and cost), totals, and
+        what local pre-annotation saved (calls, estimated tokens and cost)
+    """
+    match: Dict[str, Any] = {"project_id": project_id}
+    if since is not None:
+        match["created_at"] = {"$gte": since}
+
+    avoided = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0}
+    for row in llm_usage_collection.aggregate([
+        {"$match": {**match, "status": "avoided"}},
+        {"$group": {
+            "_id": None,
+            "calls": {"$sum": {"$cond": ["$call_avoided", 1, 0]}},
+            "prompt_tokens": {"$sum": "$prompt_tokens"},
+            "completion_tokens": {"$sum": "$completion_tokens"},
+            "cost": {"$sum": "$cost"},
+        }},
+    ]):
+        row.pop("_id")
+        avoided.update(row)
+    match["status"] = {"$ne": "avoided"}
+
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {"backend": "$backend", "model": "$model"},
+            "calls": {"$sum": 1},
+            "errors": {"$sum": {"$cond": [{"$eq": ["$status", "error"]}, 1, 0]}},
+            "prompt_tokens": {"$sum": "$prompt_tokens"},
+            "completion_tokens": {"$sum": "$completion_tokens"},
+            "think_tokens": {"$sum": "$think_tokens"},
+            "total_duration": {"$sum": "$duration"},
+            "avg_time_to_first_token": {"$avg": "$time_to_first_token"},
+            "generation_time": {"$sum": "$generation_time"},
+            "cost": {"$sum": "$cost"},
+        }},
+        {"$sort": {"cost": -1, "calls": -1}},
+    ]
+
+    models: List[Dict[str, Any]] = []
+    totals = {"calls": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0, "think_tokens": 0, "cost": 0.0}
+    for row in llm_usage_collection.aggregate(pipeline):
+        key = row.pop("_id")
+        calls = row["calls"]
+        generation_time = row.pop("generation_time") or 0
+        total_duration = row.pop("total_duration") or 0
+        models.append({
+            **key,
+            **row,
+            "avg_latency": total_duration / calls if calls else 0,
+            "completion_tokens_per_second": row["completion_tokens"] / generation_time if generation_time else None,
+            "think_share": row["think_tokens"] / row["completion_tokens"] if row["completion_tokens"] else 0,
+        })
+        for field in totals:
+            totals[field] += row[field]
+
+    return {"project_id": project_id, "since": since, "models": models, "totals": totals, "avoided": avoided}
@@ -0,0 +1,333 @@
+"""Routing of LLM generations across configured backends.
+
+A backend is one model on one server: an Ollama instance or an
+OpenAI-compatible API (see LLM_BACKENDS). Each backend has:
+
+* a concurrency limit, so one GPU is never handed more parallel generations
+  than it can run; further requests wait in line,
+* a token-bucket rate limit (requests per minute) for hosted APIs,
+* retries of 429, 5xx, timeout and connection errors, with exponential
+  backoff and full jitter, honouring Retry-After,
+* a circuit breaker that stops sending to a backend after consecutive
+  failures and lets a single probe through once the reset time has passed.
+
+When a backend is overloaded (no slot or rate-limit token within
+LLM_QUEUE_TIMEOUT), its circuit is open, or it keeps failing, the router
+moves on to the backends in its `fallback` list. The last backend in line
+waits for a slot as long as it takes. Errors that a retry cannot fix (400,
+401, ...) are raised as they are. All state is per worker process.
+"""
+import asyncio
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from config.model_manager_config import (
+    LLM_CIRCUIT_FAILURE_THRESHOLD,
+    LLM_CIRCUIT_RESET_SECONDS,
+    LLM_MAX_RETRIES,
+    LLM_QUEUE_TIMEOUT,
+    LLM_RETRY_BASE_DELAY,
+    LLM_RETRY_MAX_DELAY,
+)
+from utils.llm_metrics import (
+    LLM_BACKEND_FALLBACKS,
+    LLM_BACKEND_IN_FLIGHT,
+    LLM_BACKEND_QUEUE_WAIT,
+    LLM_BACKEND_RETRIES,
+    LLM_CIRCUIT_OPEN,
+)
+
+logger = logging.getLogger(__name__)
+
+# Upstream statuses worth retrying (mapped from timeouts and connection errors too)
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+# caller(messages, project_id, backend) -> {"response": ..., ["think": ...]}
+Caller = Callable[[List[Any], Optional[str], "Backend"], Awaitable[Dict[str, Any]]]
+
+
+class BackendUnavailable(Exception):
+    """A backend cannot take the generation right now; try the next one."""
+
+    def __init__(self, backend: str, reason: str, message: str, retry_after: Optional[float] = None):
+        super().__init__(f"{backend}: {message}")
+        self.backend = backend
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Requests-per-minute limit allowing bursts of `burst` requests."""
+
+    def __init__(self, requests_per_minute: float, burst: float):
+        self.rate = requests_per_minute / 60
+        self.capacity = max(burst, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, max_wait: Optional[float]) -> Optional[float]:
+        """
+        Take a token, possibly ahead of time.
+
+        Returns:
+            Seconds to wait before using it, or None (nothing taken) if that
+            would be longer than `max_wait`
+        """
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = max(0.0, (1 - self.tokens) / self.rate)
+        if max_wait is not None and wait > max_wait:
+            return None
+        self.tokens -= 1
+        return wait
+
+
+class CircuitBreaker:
+    """closed -> open after `failure_threshold` consecutive failures -> half_open after `reset_seconds`."""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Whether a call may go through; in half_open only one probe at a time."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def retry_after(self) -> Optional[float]:
+        if self.opened_at is None:
+            return None
+        return max(self.reset_seconds - (time.monotonic() - self.opened_at), 0.0)
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.probing = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            # A failed probe re-opens the circuit for another reset period
+            self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """End a call that says nothing about the backend's health."""
+        self.probing = False
+
+
+def _retry_after(error: HTTPException) -> Optional[float]:
+    value = (error.headers or {}).get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class Backend:
+    """One configured backend with its limits and breaker."""
+
+    def __init__(self, config: Dict[str, Any], caller: Caller):
+        self.name = config["name"]
+        self.type = config["type"]
+        self.model = config["model"]
+        self.config = config
+        self.caller = caller
+        self.max_concurrency = int(config.get("max_concurrency") or 1)
+        self.requests_per_minute = float(config.get("requests_per_minute") or 0)
+        self.fallback = list(config.get("fallback") or [])
+        self.max_retries = int(config.get("max_retries", LLM_MAX_RETRIES))
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.bucket = TokenBucket(self.requests_per_minute, config.get("burst") or self.max_concurrency)
+        self.breaker = CircuitBreaker(
+            int(config.get("circuit_failure_threshold", LLM_CIRCUIT_FAILURE_THRESHOLD)),
+            float(config.get("circuit_reset_seconds", LLM_CIRCUIT_RESET_SECONDS)),
+        )
+        self.in_flight = 0
+        self.waiting = 0
+
+    @property
+    def configured(self) -> bool:
+        # A hosted API without a key cannot serve anything
+        return self.type != "openai" or bool(self.config.get("api_key") or self.config.get("url"))
+
+    @asynccontextmanager
+    async def _slot(self, max_wait: Optional[float]):
+        """Hold a concurrency slot and a rate-limit token for one call."""
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), max_wait)
+        except asyncio.TimeoutError:
+            raise BackendUnavailable(self.name, "overloaded", f"all {self.max_concurrency} slots busy")
+        finally:
+            self.waiting -= 1
+        try:
+            remaining = None if max_wait is None else max(max_wait - (time.monotonic() - start), 0.0)
+            wait = self.bucket.reserve(remaining)
+            if wait is None:
+                raise BackendUnavailable(self.name, "rate_limited", f"over {self.requests_per_minute:g} requests per minute")
+            if wait:
+                await asyncio.sleep(wait)
+            LLM_BACKEND_QUEUE_WAIT.observe(time.monotonic() - start, backend=self.name)
+            self.in_flight += 1
+            LLM_BACKEND_IN_FLIGHT.inc(backend=self.name)
+            try:
+                yield
+            finally:
+                self.in_flight -= 1
+                LLM_BACKEND_IN_FLIGHT.dec(backend=self.name)
+        finally:
+            self.semaphore.release()
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt))
+
+    async def generate(self, messages: List[Any], project_id: Optional[str], max_wait: Optional[float]) -> Dict[str, Any]:
+        """
+        Run one generation with retries.
+
+        Raises:
+            BackendUnavailable: Overloaded, circuit open, or still failing after the retries
+            HTTPException: A non-retryable error from the backend
+        """
+        last_error = None
+        retry_after = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self._backoff(attempt - 1, retry_after))
+            if not self.breaker.allow():
+                raise BackendUnavailable(self.name, "circuit_open", "circuit open", self.breaker.retry_after())
+            try:
+                async with self._slot(max_wait):
+                    result = await self.caller(messages, project_id, self)
+            except HTTPException as e:
+                if e.status_code not in RETRYABLE_STATUS:
+                    self.breaker.release()
+                    raise
+                self.breaker.record_failure()
+                LLM_BACKEND_RETRIES.inc(backend=self.name, status=str(e.status_code))
+                last_error = e
+                retry_after = _retry_after(e)
+                if retry_after is not None and retry_after > LLM_RETRY_MAX_DELAY:
+                    # Not worth waiting for here; another backend may answer sooner
+                    break
+            except BaseException:
+                self.breaker.release()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+            finally:
+                LLM_CIRCUIT_OPEN.set(1 if self.breaker.state == "open" else 0, backend=self.name)
+
+        raise BackendUnavailable(
+            self.name,
+            "failing",
+            f"failed after {attempt + 1} attempts ({last_error.status_code}: {last_error.detail})",
+            retry_after or self.breaker.retry_after(),
+        )
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "type": self.type,
+            "model": self.model,
+            "configured": self.configured,
+            "max_concurrency": self.max_concurrency,
+            "requests_per_minute": self.requests_per_minute or None,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "fallback": self.fallback,
+        }
+
+
+class LLMRouter:
+    """Configured backends, the default one, and the fallback logic."""
+
+    def __init__(self, configs: List[Dict[str, Any]], callers: Dict[str, Caller], default: str, queue_timeout: float = LLM_QUEUE_TIMEOUT):
+        self.backends: Dict[str, Backend] = {}
+        for config in configs:
+            if config["type"] not in callers:
+                raise ValueError(f"Unknown LLM backend type '{config['type']}' for backend '{config['name']}'")
+            self.backends[config["name"]] = Backend(config, callers[config["type"]])
+        if default not in self.backends:
+            raise ValueError(f"Default LLM backend '{default}' is not configured")
+        self.default = default
+        self.queue_timeout = queue_timeout
+
+    def get(self, name: Optional[str] = None) -> Backend:
+        """The named backend; the default one for no name or a name that is no longer configured."""
+        if name and name not in self.backends:
+            logger.warning(f"LLM backend '{name}' is not configured, using '{self.default}'")
+        return self.backends.get(name or self.default) or self.backends[self.default]
+
+    def chain(self, name: Optional[str] = None) -> List[Backend]:
+        """The backend followed by its configured fallbacks, in order."""
+        primary = self.get(name)
+        chain = [primary]
+        for fallback in primary.fallback:
+            backend = self.backends.get(fallback)
+            if backend is not None and backend not in chain and backend.configured:
+                chain.append(backend)
+        return chain
+
+    async def generate(self, messages: List[Any], project_id: Optional[str] = None, backend: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Generate a reply on `backend` (or the default one), falling back when it is unavailable.
+
+        Returns:
+            The backend's reply ({"response": ..., ["think": ...]}) plus the
+            "backend" and "model" that produced it
+        """
+        chain = self.chain(backend)
+        errors: List[BackendUnavailable] = []
+        for index, candidate in enumerate(chain):
+            is_last = index == len(chain) - 1
+            try:
+                result = await candidate.generate(messages, project_id, None if is_last else self.queue_timeout)
+            except BackendUnavailable as e:
+                errors.append(e)
+                if not is_last:
+                    LLM_BACKEND_FALLBACKS.inc(backend=candidate.name, reason=e.reason)
+                    logger.warning(f"LLM backend unavailable, falling back: {str(e)}")
+                continue
+            return {**result, "backend": candidate.name, "model": candidate.model}
+
+        retry_after = min((e.retry_after for e in errors if e.retry_after is not None), default=None)
+        raise HTTPException(
+            status_code=503,
+            detail="No LLM backend available: " + "; ".join(str(e) for e in errors),
+            headers={"Retry-After": str(max(int(retry_after + 0.999), 1))} if retry_after is not None else None,
+        )
+
+    def status(self) -> Dict[str, Any]:
+        return {"default": self.default, "backends": [backend.status() for backend in self.backends.values()]}
@@ -0,0 +1,195 @@
+"""pymongo command monitoring: per-command latency metrics and a slow-query log."""
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+from utils.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+MONGO_COMMAND_DURATION = Histogram(
+    "mongo_command_duration_seconds",
+    "MongoDB command latency in seconds",
+    ["collection", "command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+MONGO_COMMAND_FAILURES = Counter(
+    "mongo_command_failures_total",
+    "MongoDB commands that returned an error",
+    ["collection", "command"],
+)
+MONGO_SLOW_COMMANDS = Counter(
+    "mongo_slow_commands_total",
+    "MongoDB commands slower than the slow-query threshold",
+    ["collection", "command"],
+)
+
+# Handshake, auth and session bookkeeping; not useful and may carry credentials
+IGNORED_COMMANDS = {
+    "hello", "ismaster", "isMaster", "ping", "buildInfo", "buildinfo",
+    "saslStart", "saslContinue", "authenticate", "getnonce", "endSessions",
+    "killCursors",
+}
+
+# Where each command keeps the part of its body that describes the query
+SHAPE_FIELDS = {
+    "find": ("filter", "sort", "projection"),
+    "count": ("query",),
+    "distinct": ("key", "query"),
+    "aggregate": ("pipeline",),
+    "findAndModify": ("query", "sort", "update"),
+    "update": ("updates",),
+    "delete": ("deletes",),
+    "createIndexes": ("indexes",),
+}
+
+REDACTED = "?"
+
+
+def redact(value: Any) -> Any:
+    """
+    Replace literal values with "?" while keeping field names and operators,
+    e.g. ``{"project_id": "abc", "$or": [{"a": 1}]}`` -> ``{"project_id": "?", "$or": [{"a": "?"}]}``.
+    """
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if value and all(isinstance(item, dict) for item in value):
+            return [redact(item) for item in value]
+        return [REDACTED] if value else []
+    return REDACTED
+
+
+def command_shape(command_name: str, command: Dict[str, Any]) -> Dict[str, Any]:
+    """Extract the redacted query shape of a command."""
+    shape = {}
+    for field in SHAPE_FIELDS.get(command_name, ()):
+        if field not in command:
+            continue
+        value = command[field]
+        if field in ("updates", "deletes"):
+            # Bulk writes: keep the shape of the first statement and the batch size
+            statements = list(value)
+            if statements:
+                shape["q"] = redact(statements[0].get("q", {}))
+                if "u" in statements[0] and isinstance(statements[0]["u"], dict):
+                    shape["u"] = redact(statements[0]["u"])
+            shape["n"] = len(statements)
+        elif field in ("sort", "projection", "key", "indexes"):
+            shape[field] = value if field != "indexes" else [index.get("key") for index in value]
+        else:
+            shape[field] = redact(value)
+    return shape
+
+
+def command_collection(command_name: str, command: Dict[str, Any]) -> str:
+    if command_name == "getMore":
+        return str(command.get("collection", ""))
+    target = command.get(command_name)
+    return target if isinstance(target, str) else ""
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """
+    Record latency of every MongoDB command and log slow ones.
+
+    Args:
+        slow_ms: Commands taking at least this many milliseconds are logged
+            with their redacted filter shape and kept in `slow_commands`
+        max_slow_commands: How many recent slow commands to keep for the report
+    """
+
+    def __init__(self, slow_ms: float = 100, max_slow_commands: int = 100):
+        self.slow_ms = slow_ms
+        self.slow_commands = deque(maxlen=max_slow_commands)
+        self._pending: Dict[Tuple[Any, int], Tuple[str, Dict[str, Any]]] = {}
+        self._max_ms: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        try:
+            collection = command_collection(event.command_name, event.command)
+            shape = command_shape(event.command_name, event.command)
+        except Exception:
+            collection, shape = "", {}
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (collection, shape)
+
+    def _finish(self, event, failed: bool) -> None:
+        with self._lock:
+            pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        collection, shape = pending
+        command = event.command_name
+        duration = event.duration_micros / 1_000_000
+
+        MONGO_COMMAND_DURATION.observe(duration, collection=collection, command=command)
+        if failed:
+            MONGO_COMMAND_FAILURES.inc(collection=collection, command=command)
+
+        duration_ms = duration * 1000
+        key = (collection, command)
+        with self._lock:
+            if duration_ms > self._max_ms.get(key, 0):
+                self._max_ms[key] = duration_ms
+
+        if duration_ms >= self.slow_ms:
+            MONGO_SLOW_COMMANDS.inc(collection=collection, command=command)
+            self.slow_commands.append({
+                "timestamp": time.time(),
+                "collection": collection,
+                "command": command,
+                "duration_ms": round(duration_ms, 3),
+                "failed": failed,
+                "shape": shape,
+            })
+            logger.warning(
+                "Slow MongoDB command %s on %s took %.1f ms: %s",
+                command, collection or "-", duration_ms, shape,
+            )
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finish(event, failed=False)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finish(event, failed=True)
+
+    def report(self, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Summarise command latency by collection and operation, slowest total first.
+
+        Returns:
+            dict with `commands` (count, total/avg/max ms and p95 estimate per
+            collection/command), `slow_threshold_ms` and `slow_commands`
+        """
+        commands: List[Dict[str, Any]] = []
+        failures = MONGO_COMMAND_FAILURES.samples()
+        for (collection, command), sample in MONGO_COMMAND_DURATION.samples().items():
+            if not sample["count"]:
+                continue
+            p95 = MONGO_COMMAND_DURATION.quantile(0.95, collection=collection, command=command)
+            commands.append({
+                "collection": collection,
+                "command": command,
+                "count": sample["count"],
+                "failures": int(failures.get((collection, command), 0)),
+                "total_ms": round(sample["sum"] * 1000, 3),
+                "avg_ms": round(sample["sum"] * 1000 / sample["count"], 3),
+                "p95_ms_upper_bound": None if p95 is None else p95 * 1000,
+                "max_ms": round(self._max_ms.get((collection, command), 0), 3),
+            })
+        commands.sort(key=lambda row: row["total_ms"], reverse=True)
+        if limit:
+            commands = commands[:limit]
+        return {
+            "slow_threshold_ms": self.slow_ms,
+            "commands": commands,
+            "slow_commands": list(reversed(self.slow_commands)),
+        }
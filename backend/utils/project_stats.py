@@ -0,0 +1,205 @@
+"""Per-project statistics kept as counters in the `project_stats` collection.
+
+Every document write applies the difference between the document's old and
+new contribution with a single `$inc`, so dashboards and list-page totals are
+read from one small record instead of scanning the project. An aggregation
+over the documents rebuilds the record from scratch; it runs lazily the first
+time a project without counters is read (e.g. projects created before the
+counters existed) and on demand to repair drift.
+
+Counters:
+    documents, text_chars, annotations, annotated_documents,
+    annotated_chars (sum of span lengths), status.<status>, entities.<class>
+
+`changes` is incremented by every write, including those that leave the
+counters as they were (e.g. a span moved), and never goes back, so it tells
+whether a project's documents changed (see utils/export_snapshots.py).
+"""
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional
+
+from config.database import documents_collection, project_stats_collection
+from utils.compact_annotations import spans
+
+SCALAR_COUNTERS = ("documents", "text_chars", "annotations", "annotated_documents", "annotated_chars")
+
+# Entity and status names become field names, which must not contain '.' or '$'
+FIELD_ESCAPES = (("%", "%25"), (".", "%2E"), ("$", "%24"))
+
+
+def _field_key(name: str) -> str:
+    key = str(name)
+    for char, escaped in FIELD_ESCAPES:
+        key = key.replace(char, escaped)
+    return key
+
+
+def _field_name(key: str) -> str:
+    for char, escaped in reversed(FIELD_ESCAPES):
+        key = key.replace(escaped, char)
+    return key
+
+
+def document_counters(doc: Optional[Dict[str, Any]]) -> Counter:
+    """Counters one document contributes to its project (empty for None)."""
+    counters = Counter()
+    if not doc:
+        return counters
+    counters["documents"] = 1
+    counters["text_chars"] = len(doc.get("text") or "")
+    counters["status." + _field_key(doc.get("status") or "pending")] = 1
+    counters.update(_span_counters(doc))
+    return counters
+
+
+def _span_counters(doc: Dict[str, Any]) -> Counter:
+    if doc.get("annotations_compact") is not None:
+        # Offsets and classes are all the counters need; no span texts to derive
+        document_spans = spans(doc["annotations_compact"])
+    else:
+        document_spans = [
+            (annotation.get("start_index", 0), annotation.get("end_index", 0), annotation.get("entity"))
+            for annotation in doc.get("annotations") or []
+        ]
+    counters = Counter()
+    counters["annotations"] = len(document_spans)
+    counters["annotated_documents"] = 1 if document_spans else 0
+    for start, end, entity in document_spans:
+        counters["annotated_chars"] += max(0, end - start)
+        counters["entities." + _field_key(entity)] += 1
+    return counters
+
+
+def apply_document_changes(project_id: str, added: Iterable[Dict[str, Any]] = (), removed: Iterable[Dict[str, Any]] = ()) -> None:
+    """
+    Update a project's counters for documents written or deleted.
+
+    Args:
+        added: New versions of created or updated documents
+        removed: Old versions of updated or deleted documents
+    """
+    delta = Counter()
+    for doc in added:
+        delta.update(document_counters(doc))
+    for doc in removed:
+        delta.subtract(document_counters(doc))
+    delta = {key: value for key, value in delta.items() if value}
+    delta["changes"] = 1
+    # No upsert: a project without counters gets them from a full rebuild on first read
+    project_stats_collection.update_one(
+        {"project_id": str(project_id)},
+        {"$inc": delta, "$set": {"updated_at": datetime.utcnow()}}
+    )
+
+
+def apply_document_update(project_id: str, old_doc: Dict[str, Any], new_doc: Dict[str, Any]) -> None:
+    apply_document_changes(project_id, added=[new_doc], removed=[old_doc])
+
+
+def init_project_stats(project_id: str) -> None:
+    """Zeroed counters for a new, empty project."""
+    now = datetime.utcnow()
+    project_stats_collection.insert_one({
+        "project_id": str(project_id),
+        **{name: 0 for name in SCALAR_COUNTERS},
+        "changes": 0,
+        "status": {},
+        "entities": {},
+        "rebuilt_at": now,
+        "updated_at": now,
+    })
+
+
+def rename_entity_counters(project_id: str, old_name: str, new_name: str) -> None:
+    project_stats_collection.update_one(
+        {"project_id": str(project_id)},
+        {
+            "$rename": {"entities." + _field_key(old_name): "entities." + _field_key(new_name)},
+            "$inc": {"changes": 1}
+        }
+    )
+
+
+def remove_project_stats(project_id: str) -> None:
+    project_stats_collection.delete_one({"project_id": str(project_id)})
+
+
+def rebuild_project_stats(project_id: str) -> Dict[str, Any]:
+    """Recompute a project's counters with aggregation pipelines and store them."""
+    project_id = str(project_id)
+    annotations = {"$ifNull": ["$annotations", []]}
+    totals = list(documents_collection.aggregate([
+        {"$match": {"project_id": project_id, "deleted_at": None}},
+        {"$group": {
+            "_id": {"$ifNull": ["$status", "pending"]},
+            "documents": {"$sum": 1},
+            "text_chars": {"$sum": {"$strLenCP": {"$ifNull": ["$text", ""]}}},
+            "annotations": {"$sum": {"$size": annotations}},
+            "annotated_documents": {"$sum": {"$cond": [{"$gt": [{"$size": annotations}, 0]}, 1, 0]}},
+        }},
+    ]))
+    entities = list(documents_collection.aggregate([
+        {"$match": {"project_id": project_id, "deleted_at": None}},
+        {"$unwind": "$annotations"},
+        {"$group": {
+            "_id": "$annotations.entity",
+            "count": {"$sum": 1},
+            "chars": {"$sum": {"$max": [0, {"$subtract": ["$annotations.end_index", "$annotations.start_index"]}]}},
+        }},
+    ]))
+    # The pipelines see no spans in compactly stored documents; count those here
+    compact = Counter()
+    for doc in documents_collection.find(
+        {"project_id": project_id, "deleted_at": None, "annotations_compact": {"$exists": True}},
+        {"annotations_compact": 1}
+    ):
+        compact.update(_span_counters(doc))
+
+    # Rebuilt counters keep moving `changes` forward
+    previous = project_stats_collection.find_one({"project_id": project_id}, {"changes": 1}) or {}
+    now = datetime.utcnow()
+    entity_counts = Counter({_field_key(row["_id"]): row["count"] for row in entities})
+    entity_counts.update({key[len("entities."):]: count for key, count in compact.items() if key.startswith("entities.")})
+    stats = {
+        "project_id": project_id,
+        **{name: sum(row[name] for row in totals) + compact[name] for name in SCALAR_COUNTERS if name != "annotated_chars"},
+        "annotated_chars": sum(row["chars"] for row in entities) + compact["annotated_chars"],
+        "status": {_field_key(row["_id"]): row["documents"] for row in totals},
+        "entities": dict(entity_counts),
+        "changes": previous.get("changes", 0) + 1,
+        "rebuilt_at": now,
+        "updated_at": now,
+    }
+    project_stats_collection.replace_one({"project_id": project_id}, stats, upsert=True)
+    return stats
+
+
+def get_project_counters(project_id: str) -> Dict[str, Any]:
+    """The stored counters of a project, rebuilt first if it has none."""
+    stats = project_stats_collection.find_one({"project_id": str(project_id)}, {"_id": 0})
+    return stats if stats is not None else rebuild_project_stats(project_id)
+
+
+def project_stats_report(project: Dict[str, Any]) -> Dict[str, Any]:
+    """Statistics for the dashboard; configured entity classes without spans are reported as 0."""
+    stats = get_project_counters(project["_id"])
+    entities = {name: 0 for name in (entity["name"] for entity in project.get("entity_classes", []))}
+    for key, count in (stats.get("entities") or {}).items():
+        if count or _field_name(key) in entities:
+            entities[_field_name(key)] = count
+    documents = stats["documents"]
+    return {
+        "project_id": stats["project_id"],
+        "documents": documents,
+        "status": {_field_name(key): count for key, count in (stats.get("status") or {}).items() if count},
+        "annotations": stats["annotations"],
+        "annotated_documents": stats["annotated_documents"],
+        "annotations_per_document": round(stats["annotations"] / documents, 2) if documents else 0,
+        "entities": dict(sorted(entities.items(), key=lambda item: (-item[1], item[0]))),
+        "text_chars": stats["text_chars"],
+        "annotated_chars": stats["annotated_chars"],
+        "coverage": round(stats["annotated_chars"] / stats["text_chars"], 4) if stats["text_chars"] else 0,
+        "rebuilt_at": stats.get("rebuilt_at"),
+        "updated_at": stats.get("updated_at"),
+    }
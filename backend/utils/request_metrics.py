@@ -0,0 +1,81 @@
+"""ASGI middleware recording per-route request metrics."""
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from utils.metrics import DEFAULT_SIZE_BUCKETS, Counter, Gauge, Histogram
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency in seconds",
+    ["method", "route"],
+)
+REQUESTS_TOTAL = Counter(
+    "http_requests_total",
+    "HTTP requests by route and status code",
+    ["method", "route", "status"],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests currently being handled",
+    ["method"],
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes",
+    "HTTP response body size in bytes as sent on the wire",
+    ["method", "route"],
+    buckets=DEFAULT_SIZE_BUCKETS,
+)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def route_label(scope: Scope) -> str:
+    """
+    Return the route template (e.g. ``/api/documents/{document_id}``) for a
+    handled request. Templates keep label cardinality bounded, unlike raw paths.
+    """
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path_format", None) or getattr(route, "path", UNMATCHED_ROUTE)
+    # Mounted apps (e.g. /uploads) set root_path to the mount prefix
+    root_path = scope.get("root_path", "")
+    if root_path and root_path != scope.get("app_root_path", ""):
+        return root_path
+    return UNMATCHED_ROUTE
+
+
+class RequestMetricsMiddleware:
+    """Record latency, status, in-flight count and response size for each HTTP request."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        response_size = 0
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, response_size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        REQUESTS_IN_PROGRESS.inc(method=method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            REQUESTS_IN_PROGRESS.dec(method=method)
+            route = route_label(scope)
+            REQUEST_DURATION.observe(duration, method=method, route=route)
+            REQUESTS_TOTAL.inc(method=method, route=route, status=str(status_code))
+            RESPONSE_SIZE.observe(response_size, method=method, route=route)
@@ -0,0 +1,86 @@
+"""Helpers for full-text search: query term parsing and highlighted snippets."""
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Phrases in quotes, or single words; a leading "-" negates (MongoDB $text syntax)
+TERM_PATTERN = re.compile(r'(-?)"([^"]+)"|(-?)(\S+)')
+
+
+def parse_search_terms(query: str) -> List[str]:
+    """
+    Return the positive terms and phrases of a MongoDB $text query,
+    e.g. ``'acme "orchard road" -draft'`` -> ``["acme", "orchard road"]``.
+    """
+    terms = []
+    for negated_phrase, phrase, negated_word, word in TERM_PATTERN.findall(query):
+        if phrase and not negated_phrase:
+            terms.append(phrase.strip())
+        elif word and not negated_word:
+            terms.append(word.strip("\"'"))
+    return [term for term in terms if term]
+
+
+def build_highlight_pattern(terms: List[str]) -> Optional["re.Pattern"]:
+    """
+    Regex matching the terms case-insensitively. Words also match with any
+    suffix, since the text index stems words (e.g. "invoice" finds "invoices").
+    """
+    if not terms:
+        return None
+    alternatives = []
+    for term in sorted(set(terms), key=len, reverse=True):
+        escaped = r"\s+".join(re.escape(part) for part in term.split())
+        alternatives.append(escaped if " " in term else escaped + r"\w*")
+    return re.compile(r"\b(?:" + "|".join(alternatives) + r")", re.IGNORECASE)
+
+
+def find_highlights(text: str, pattern: Optional["re.Pattern"], limit: int = 1000) -> List[Tuple[int, int]]:
+    """Character offsets of matches in text."""
+    if not text or pattern is None:
+        return []
+    highlights = []
+    for match in pattern.finditer(text):
+        highlights.append((match.start(), match.end()))
+        if len(highlights) >= limit:
+            break
+    return highlights
+
+
+def build_snippet(text: str, pattern: Optional["re.Pattern"], length: int = 200) -> Dict[str, Any]:
+    """
+    Pick the window of `length` characters with the most matches and return it
+    with match offsets relative to the snippet. Offsets are returned instead of
+    markup so clients can render highlights safely.
+    """
+    text = text or ""
+    highlights = find_highlights(text, pattern)
+    if not highlights:
+        snippet = text[:length]
+        return {"text": snippet, "start": 0, "highlights": [], "truncated": len(text) > length}
+
+    # Slide a window over the match starts (two pointers) to find the densest region
+    best_start, best_count, right = highlights[0][0], 0, 0
+    for left, (start, _) in enumerate(highlights):
+        while right < len(highlights) and highlights[right][1] - start <= length:
+            right += 1
+        if right - left > best_count:
+            best_start, best_count = start, right - left
+
+    # Center the densest matches and snap to a word boundary
+    window_start = max(0, best_start - length // 4)
+    if window_start > 0:
+        space = text.find(" ", window_start, best_start)
+        window_start = space + 1 if space != -1 else window_start
+    window_end = min(len(text), window_start + length)
+
+    snippet_highlights = [
+        [start - window_start, end - window_start]
+        for start, end in highlights
+        if start >= window_start and end <= window_end
+    ]
+    return {
+        "text": text[window_start:window_end],
+        "start": window_start,
+        "highlights": snippet_highlights,
+        "truncated": window_start > 0 or window_end < len(text),
+    }
@@ -0,0 +1,92 @@
+"""Fast JSON serialization for trusted MongoDB records.
+
+Records read straight from MongoDB are already well-formed, so instead of
+rebuilding Pydantic models and letting FastAPI validate them a second time,
+endpoints can shape the raw dict and hand it to `MongoJSONResponse`, which
+encodes it with orjson in one pass.
+"""
+from typing import Any, Dict, Iterable, Optional
+
+import orjson
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from utils.compact_annotations import document_annotations, document_compact_annotations
+
+
+def mongo_default(value: Any) -> Any:
+    """orjson `default` hook for types orjson does not handle natively."""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Encode content to JSON bytes, handling ObjectId, datetime and Pydantic models."""
+    return orjson.dumps(content, default=mongo_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class MongoJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson that understands MongoDB types."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def document_to_dict(
+    doc: Dict[str, Any],
+    project_id: Optional[str] = None,
+    annotation_format: str = "full",
+    classes: Iterable[str] = ()
+) -> Dict[str, Any]:
+    """
+    Shape a raw documents-collection record like the `Document` response model
+    without validating it.
+
+    Args:
+        doc: Record as returned by pymongo (with `_id`)
+        project_id: Fallback project id for records missing one
+        annotation_format: "compact" replaces `annotations` with
+            `annotations_compact` (see utils/compact_annotations.py)
+        classes: The project's entity class names, for the compact format
+
+    Returns:
+        dict with exactly the fields of `models.document.Document`
+    """
+    doc_id = str(doc["_id"]) if "_id" in doc else str(doc.get("id"))
+    if annotation_format == "compact":
+        annotations = {"annotations_compact": document_compact_annotations(doc, classes)}
+    else:
+        annotations = {"annotations": document_annotations(doc)}
+    return {
+        "id": doc_id,
+        "text": doc.get("text") or "",
+        "filename": doc.get("filename") or f"document_{doc_id}.txt",
+        "project_id": doc.get("project_id") or project_id,
+        "status": doc.get("status") or "pending",
+        "created_at": doc.get("created_at"),
+        "updated_at": doc.get("updated_at"),
+        **annotations,
+        "version": doc.get("version") or 0,
+    }
+
+
+def project_to_dict(project: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape a raw projects-collection record like the `Project` response model."""
+    return {
+        "id": str(project["_id"]) if "_id" in project else str(project.get("id")),
+        "name": project.get("name"),
+        "description": project.get("description"),
+        "entity_classes": project.get("entity_classes") or [],
+        "llm_backend": project.get("llm_backend"),
+        "user_id": project.get("user_id"),
+        "created_at": project.get("created_at"),
+        "updated_at": project.get("updated_at"),
+    }
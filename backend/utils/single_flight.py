@@ -0,0 +1,173 @@
+"""Single-flight coalescing of identical LLM generations.
+
+When several annotators (or browser tabs) open the same document at once,
+each auto-annotate request would start its own multi-second generation for
+the very same prompt. Instead, the first request becomes the leader and
+makes the call; identical requests arriving while it runs wait for its
+result:
+
+* within a worker, they await the leader's task;
+* across workers, the leader holds a lease on the key in `llm_inflight`
+  (renewed while the call runs) and stores the result there for
+  LLM_COALESCE_RESULT_TTL seconds; other workers poll for it. If the leader
+  dies, its lease lapses and a waiting worker takes over.
+
+Finished results stay readable for LLM_COALESCE_RESULT_TTL seconds so that
+every waiter sees them, which means a request arriving just after a call
+finished shares it too. Beyond that this is not a result cache.
+
+The MongoDB calls are blocking and run in the threadpool, so polling
+waiters do not hold up the event loop.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from starlette.concurrency import run_in_threadpool
+
+from config.database import llm_inflight_collection
+from config.model_manager_config import (
+    LLM_COALESCE_LEASE_SECONDS,
+    LLM_COALESCE_POLL_INTERVAL,
+    LLM_COALESCE_RESULT_TTL,
+)
+from utils.llm_metrics import LLM_COALESCED, LLM_SINGLE_FLIGHT_LEADERS
+
+logger = logging.getLogger(__name__)
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def coalesce_key(*parts: str) -> str:
+    """Key of a generation from everything the LLM sees (backend, model, prompt)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time across all workers."""
+
+    def __init__(
+        self,
+        collection=llm_inflight_collection,
+        lease_seconds: float = LLM_COALESCE_LEASE_SECONDS,
+        poll_interval: float = LLM_COALESCE_POLL_INTERVAL,
+        result_ttl: float = LLM_COALESCE_RESULT_TTL,
+    ):
+        self.collection = collection
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.result_ttl = result_ttl
+        # key -> task of this worker's call (leader or remote waiter)
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        Return `fn()`'s result, sharing it with concurrent calls for the same key.
+
+        The result must be storable in MongoDB. An HTTPException raised by the
+        leader is raised to every waiter; other errors only to the leader's
+        callers in this worker, after which remote waiters retry themselves.
+        """
+        task = self._tasks.get(key)
+        if task is not None:
+            LLM_COALESCED.inc(scope="local")
+        else:
+            # A task of its own, so a disconnecting client does not cancel the call for the others
+            task = self._tasks[key] = asyncio.ensure_future(self._run(key, fn))
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return await asyncio.shield(task)
+
+    def _claim(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Become the leader for `key`.
+
+        Returns:
+            None when this worker now holds the lease, otherwise the current
+            record (running elsewhere or finished)
+        """
+        now = datetime.utcnow()
+        lease = {"status": "running", "owner": WORKER_ID, "lease_until": now + timedelta(seconds=self.lease_seconds)}
+        try:
+            self.collection.insert_one({"_id": key, **lease, "created_at": now})
+            return None
+        except DuplicateKeyError:
+            pass
+        # Take over a lapsed lease (dead leader) or an expired result
+        taken = self.collection.find_one_and_update(
+            {"_id": key, "lease_until": {"$lte": now}},
+            {"$set": {**lease, "created_at": now}, "$unset": {"result": "", "error": ""}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if taken is not None:
+            return None
+        return self.collection.find_one({"_id": key}) or {"status": "gone"}
+
+    async def _run(self, key: str, fn: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        while True:
+            record = await run_in_threadpool(self._claim, key)
+            if record is None:
+                return await self._lead(key, fn)
+            if record["status"] == "running":
+                record = await self._wait(key)
+            if record["status"] == "done":
+                LLM_COALESCED.inc(scope="remote")
+                return record["result"]
+            if record["status"] == "error":
+                LLM_COALESCED.inc(scope="remote")
+                raise HTTPException(status_code=record["error"]["status_code"], detail=record["error"]["detail"])
+            # Lease lapsed or the leader gave up without a shareable error: try to lead
+
+    async def _wait(self, key: str) -> Dict[str, Any]:
+        """Poll until another worker's call finishes or its lease lapses."""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            record = await run_in_threadpool(self.collection.find_one, {"_id": key})
+            if record is None or record["lease_until"] <= datetime.utcnow():
+                return {"status": "gone"}
+            if record["status"] != "running":
+                return record
+
+    async def _renew(self, key: str) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            await run_in_threadpool(
+                self.collection.update_one,
+                {"_id": key, "owner": WORKER_ID, "status": "running"},
+                {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=self.lease_seconds)}},
+            )
+
+    async def _lead(self, key: str, fn: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        LLM_SINGLE_FLIGHT_LEADERS.inc()
+        renewal = asyncio.ensure_future(self._renew(key))
+        outcome: Dict[str, Any] = {}
+        try:
+            result = await fn()
+            outcome = {"status": "done", "result": result}
+            return result
+        except HTTPException as e:
+            outcome = {"status": "error", "error": {"status_code": e.status_code, "detail": e.detail}}
+            raise
+        finally:
+            renewal.cancel()
+            owned = {"_id": key, "owner": WORKER_ID}
+            try:
+                if outcome:
+                    await run_in_threadpool(self.collection.update_one, owned, {"$set": {
+                        **outcome,
+                        "lease_until": datetime.utcnow() + timedelta(seconds=self.result_ttl),
+                    }})
+                else:
+                    await run_in_threadpool(self.collection.delete_one, owned)
+            except Exception as e:
+                logger.warning(f"Failed to publish coalesced LLM result: {str(e)}")
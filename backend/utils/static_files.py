@@ -0,0 +1,27 @@
+"""StaticFiles with Cache-Control headers for uploaded files."""
+import os
+import re
+
+from starlette.staticfiles import StaticFiles
+
+from config.uploads_config import IMMUTABLE_CACHE_MAX_AGE
+from utils.images import HASH_LENGTH
+
+# `<prefix>_<content hash>.<ext>` and its thumbnails `<prefix>_<content hash>_<size>.<ext>`
+CONTENT_HASHED_NAME = re.compile(r"_[0-9a-f]{%d}(_\d+)?\.\w+$" % HASH_LENGTH)
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    Content-hashed files never change under the same URL, so browsers may keep
+    them for a year without revalidating. Anything else (e.g. pictures stored
+    before filenames were hashed) must be revalidated with its ETag.
+    """
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if CONTENT_HASHED_NAME.search(os.path.basename(full_path)):
+            response.headers["Cache-Control"] = f"public, max-age={IMMUTABLE_CACHE_MAX_AGE}, immutable"
+        else:
+            response.headers["Cache-Control"] = "no-cache"
+        return response
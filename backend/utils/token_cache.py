@@ -0,0 +1,128 @@
+"""Per-document token cache for token-level exports.
+
+Tokenizing is most of the cost of an IOB2 export, while a document's text
+rarely changes after upload. The tokens of each (document, tokenizer) pair
+are computed on first export and stored in `document_tokens`, so later
+exports only align spans to tokens:
+
+    {document_id, project_id, tokenizer, text_hash, count,
+     offsets: start/end of each token, packed as little-endian uint32 pairs,
+     ids: token ids packed the same way (None for the "words" tokenizer),
+     created_at}
+
+Rows carry a hash of the text they were computed from, so tokens are never
+used for a different text; `update_document` also drops a document's rows
+when its text changes, and purges remove them with the documents.
+"""
+import hashlib
+import sys
+from array import array
+from datetime import datetime
+from itertools import chain
+from typing import Any, Dict, Iterable, List, Tuple
+
+from bson.binary import Binary
+from pymongo import ReplaceOne
+
+from auto_gen_tools.ner_tools import token_strings, tokenize
+from config.database import document_tokens_collection
+from utils.metrics import Counter
+
+TOKEN_CACHE_LOOKUPS = Counter(
+    "token_cache_lookups_total",
+    "Document tokenizations served from the token cache (hit) or computed (miss)",
+    ["tokenizer", "result"],
+)
+
+# (start, end) per token, and the token strings
+Tokens = Tuple[List[Tuple[int, int]], List[str]]
+
+
+def text_hash(text: str) -> str:
+    return hashlib.blake2b((text or "").encode("utf-8"), digest_size=16).hexdigest()
+
+
+def pack(values: Iterable[int]) -> bytes:
+    packed = array("I", values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def unpack(data: bytes) -> array:
+    values = array("I")
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _token_row(doc: Dict[str, Any], tokenizer: str, digest: str) -> Dict[str, Any]:
+    offsets, ids = tokenize(doc.get("text") or "", tokenizer)
+    return {
+        "document_id": str(doc["_id"]),
+        "project_id": doc.get("project_id"),
+        "tokenizer": tokenizer,
+        "text_hash": digest,
+        "count": len(offsets),
+        "offsets": Binary(pack(chain.from_iterable(offsets))),
+        "ids": Binary(pack(ids)) if ids is not None else None,
+        "created_at": datetime.utcnow(),
+    }
+
+
+def _row_tokens(row: Dict[str, Any], text: str, tokenizer: str) -> Tokens:
+    flat = unpack(row["offsets"])
+    offsets = list(zip(flat[0::2], flat[1::2]))
+    ids = unpack(row["ids"]).tolist() if row.get("ids") is not None else None
+    return offsets, token_strings(text, offsets, ids, tokenizer)
+
+
+def documents_tokens(documents: List[Dict[str, Any]], tokenizer: str) -> Dict[str, Tokens]:
+    """
+    Tokens of several documents: cached rows are read in one query, the
+    others are tokenized and stored in one bulk write.
+
+    Args:
+        documents: Records with `_id`, `project_id` and `text`
+
+    Returns:
+        document id -> (offsets, token strings)
+    """
+    if not documents:
+        return {}
+    cached = {
+        row["document_id"]: row
+        for row in document_tokens_collection.find({
+            "document_id": {"$in": [str(doc["_id"]) for doc in documents]},
+            "tokenizer": tokenizer,
+        })
+    }
+    tokens, writes = {}, []
+    for doc in documents:
+        document_id = str(doc["_id"])
+        text = doc.get("text") or ""
+        digest = text_hash(text)
+        row = cached.get(document_id)
+        if row is None or row.get("text_hash") != digest:
+            TOKEN_CACHE_LOOKUPS.inc(tokenizer=tokenizer, result="miss")
+            row = _token_row(doc, tokenizer, digest)
+            writes.append(ReplaceOne({"document_id": document_id, "tokenizer": tokenizer}, row, upsert=True))
+        else:
+            TOKEN_CACHE_LOOKUPS.inc(tokenizer=tokenizer, result="hit")
+        tokens[document_id] = _row_tokens(row, text, tokenizer)
+    if writes:
+        document_tokens_collection.bulk_write(writes, ordered=False)
+    return tokens
+
+
+def remove_document_tokens(document_ids: Iterable[Any]) -> int:
+    """Drop the cached tokens of the given documents (e.g. after a text change)."""
+    ids = [str(document_id) for document_id in document_ids]
+    if not ids:
+        return 0
+    return document_tokens_collection.delete_many({"document_id": {"$in": ids}}).deleted_count
+
+
+def remove_project_tokens(project_id: str) -> int:
+    return document_tokens_collection.delete_many({"project_id": str(project_id)}).deleted_count
@@ -53,7 +53,9 @@ const UserSettings = () => {
       const response = await axios.get(`${API_URL}/api/users/profile`);
       setProfile(response.data);
       if (response.data.profile_picture) {
-        setPreviewImage(`${API_URL}/uploads/profile_pictures/${response.data.profile_picture}`);
+        // Prefer the downscaled variant once the server has generated it
+        const picture = response.data.profile_picture_thumbnails?.['256'] || response.data.profile_picture;
+        setPreviewImage(`${API_URL}/uploads/profile_pictures/${picture}`);
       }
     } catch (error) {
       setMessage({ type: 'error', text: 'Failed to load profile' });
@@ -185,6 +185,10 @@ export const autoAnnotateDocument = async (projectId, documentId) => {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
+        // The project's classes, gazetteer and LLM backend are only used for its owner
+        ...(axios.defaults.headers.common['Authorization'] && {
+          Authorization: axios.defaults.headers.common['Authorization'],
+        }),
       }
     });
     if (!response.ok) {